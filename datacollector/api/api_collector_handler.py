@@ -14,7 +14,12 @@ import uuid
 from datetime import datetime, timedelta
 from threading import Thread
 
+import numpy as np
+
 from datacollector.collector.agent import Agent
+from datacollector.collector.columnar_store import COLUMNS_SUFFIX, MISSING, ColumnarReader, microseconds_to_timestamp
+from datacollector.collector.process_delta import ProcessDeltaDecoder, ProcessDeltaException
+from datacollector.collector.segments import iter_data_lines
 
 
 class CollectorHandler:
@@ -98,18 +103,49 @@ class CollectorHandler:
             raise Exception("Failed to retrieve collection names.")
         return collections
 
-    def get_collection_results(self, folder_name, file_name):
-        """Get results of a collection."""
+    def get_collection_results(self, folder_name, file_name, start=None, end=None):
+        """Get results of a collection. Incrementally stored process tables are rebuilt into full snapshots.
+
+        start and end are optional ISO timestamps limiting the samples returned. Rotated data file segments
+        outside the range are not read.
+        """
         lines = []
         try:
             path = os.path.join(os.getcwd(), 'data')
             for folder in os.listdir(path):
                 if folder == folder_name:
-                    file = path + "/" + folder_name + "/" +file_name + ".json"
-                    with open(file) as json_data:
-                        for line in json_data:
-                            lines.append(json.loads(line))
+                    decoder = ProcessDeltaDecoder()
+                    for line in iter_data_lines(path + "/" + folder_name, file_name, start, end):
+                        row = json.loads(line)
+                        try:
+                            row = decoder.decode(row)
+                        except ProcessDeltaException:
+                            logging.getLogger('__collector__').warning(
+                                "Process delta at %s without keyframe, process data left out.", row["timestamp"])
+                        if (start is None or row["timestamp"] >= start) and (end is None or row["timestamp"] <= end):
+                            lines.append(row)
 
         except Exception:
             raise Exception("Failed to retrieve results for the run ID.")
         return lines
+
+    def get_collection_series(self, folder_name, file_name, names, start=None, end=None):
+        """Get numeric series of a collection from its columnar store.
+
+        names are series names of ColumnarReader.series(), e.g. memory.MemFree or cpu.cpu0.utilisation.
+        start and end are optional ISO timestamps. Missing values are returned as None.
+        """
+        try:
+            reader = ColumnarReader(os.path.join(os.getcwd(), 'data', folder_name, file_name + COLUMNS_SUFFIX))
+            series = {"timestamp": [microseconds_to_timestamp(value)
+                                    for value in reader.series("timestamp", start, end).tolist()]}
+            for name in names:
+                values = reader.series(name, start, end)
+                if values.dtype.kind == "f":
+                    values = np.where(np.isnan(values), None, values)
+                else:
+                    values = np.where(values == MISSING, None, values)
+                series[name] = values.tolist()
+        except Exception:
+            raise Exception("Failed to retrieve series for the run ID.")
+        return series
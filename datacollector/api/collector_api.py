@@ -68,11 +68,28 @@ def retrieve_collections():
 
 @app.route('/api/results/collections/<run_id>/<host>', methods=['GET'])
 def retrieve_collection_results(run_id, host):
-    """Return results of a collection run using collection name and filename."""
-    data = collector_handler.get_collection_results(run_id, host)
+    """Return results of a collection run using collection name and filename.
+
+    Optional start and end query arguments limit the samples to a time range (ISO timestamps).
+    """
+    data = collector_handler.get_collection_results(run_id, host, request.args.get("start"),
+                                                    request.args.get("end"))
     return Response(json.dumps({"ret": "ok", "message": "Results for collection retrieved successfully.", "data": data}))
 
 
+@app.route('/api/results/series/<run_id>/<host>', methods=['GET'])
+def retrieve_collection_series(run_id, host):
+    """Return numeric series of a collection run from its columnar store.
+
+    The series query argument is a comma separated list of series names. Optional start and end limit the
+    samples to a time range (ISO timestamps).
+    """
+    names = [name for name in request.args.get("series", "").split(",") if name]
+    data = collector_handler.get_collection_series(run_id, host, names, request.args.get("start"),
+                                                   request.args.get("end"))
+    return Response(json.dumps({"ret": "ok", "message": "Series for collection retrieved successfully.", "data": data}))
+
+
 @app.route('/', methods=['GET'])
 def default_get():
     """Entry point for the API."""
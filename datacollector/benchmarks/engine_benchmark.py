@@ -0,0 +1,192 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Benchmark comparing the threaded and asyncio collection engines.
+
+Nodes are simulated in-process with a fixed command latency, so the results
+reflect the scheduling overhead of the engine instead of the network.
+Reports achieved samples per second, process CPU usage, peak thread count
+and the number of nodes a single fully used core could sustain.
+
+Example:
+python -m datacollector.benchmarks.engine_benchmark --nodes 100 500 --interval 1 --duration 20
+"""
+import argparse
+import logging
+import threading
+import time
+from datetime import datetime
+
+from datacollector.collector.async_maincollector import AsyncMainCollector
+from datacollector.collector.collector_config_parser import CollectorConfig
+from datacollector.collector.iconnection import IConnection
+from datacollector.collector.inodecollector import INodeCollector
+from datacollector.collector.maincollector import MainCollector
+from datacollector.collector.memcpu_parser import MemCpuParser
+from datacollector.collector.sample import CpuSample, MemorySample, Sample
+
+MEM_LINES = ["MemTotal:       28803616 kB\n", "MemFree:        27841200 kB\n", "MemAvailable:   28058048 kB\n",
+             "Buffers:           44012 kB\n", "Cached:           481248 kB\n", "SwapTotal:       2097148 kB\n",
+             "SwapFree:        2097148 kB\n"]
+
+
+class SimulatedConnection(IConnection):
+    """IConnection returning synthetic /proc output after a fixed latency."""
+
+    def __init__(self, hostname, latency, handshake, cores=4):
+        super().__init__(hostname, 22, "benchmark", "benchmark")
+        self._latency = latency
+        self._handshake = handshake
+        self._cores = cores
+        self._active = False
+        self._ticks = 0
+
+    def is_active(self):
+        """Check if connection is active."""
+        return self._active
+
+    def connect(self, via=None):
+        """Simulate an SSH handshake."""
+        time.sleep(self._handshake)
+        self._active = True
+
+    def close_session(self):
+        """Close the simulated connection."""
+        self._active = False
+
+    def execute_batch(self, batch):
+        """Return synthetic cpu and memory sections after one round trip."""
+        time.sleep(self._latency)
+        self._ticks += 100
+        cpu_lines = []
+        for name in ["cpu"] + ["cpu{}".format(n) for n in range(self._cores)]:
+            values = [self._ticks * 3, 0, self._ticks, self._ticks * 5, 10, 0, 0, 0, 0, 0]
+            cpu_lines.append(name + " " + " ".join(str(value) for value in values) + "\n")
+        return {"cpu": cpu_lines, "memory": list(MEM_LINES)}
+
+    def _execute_command(self, command):
+        """Simulate a single command."""
+        time.sleep(self._latency)
+        if command == 'echo hello':
+            return ['hello\n']
+        return []
+
+
+class BenchmarkNodeCollector(INodeCollector):
+    """Node collector parsing simulated data with MemCpuParser without writing files or indexing."""
+
+    def __init__(self, main_collector, connection):
+        super().__init__(main_collector, connection)
+        self._parser = MemCpuParser()
+
+    def _create_dirs(self):
+        """Benchmark does not write data files."""
+
+    def _try_collect(self):
+        """Collect, parse and count a sample."""
+        sections = self._connection.execute_batch(None)
+        sample = Sample(datetime.utcnow().isoformat(), self.node_run_id)
+        sample.memory = MemorySample.from_lines(sections["memory"])
+        sample.cpu = CpuSample.from_lines(sections["cpu"])
+        self._parser.update_utilisation(sample.cpu)
+        self.success = True
+
+
+class BenchmarkAgent:
+    """Minimal stand-in for Agent with the attributes used by the engines."""
+
+    def __init__(self, collect_interval):
+        self.collect_id = "Benchmark_" + datetime.strftime(datetime.utcnow(), "%Y-%m-%dT%H-%M-%S")
+        self.collect_interval = collect_interval
+        self.collect_start_time = datetime.utcnow()
+        self._reconnect_start_time = None
+        self._reconnect = False
+
+
+def _engine_class(base, nodes, latency, handshake):
+    """Create an engine class that builds simulated node collectors."""
+
+    class BenchmarkEngine(base):
+        def _create_node_collectors(self):
+            for n in range(nodes):
+                connection = SimulatedConnection("node-{}".format(n), latency, handshake)
+                self._node_collectors.append(BenchmarkNodeCollector(self, connection))
+
+    return BenchmarkEngine
+
+
+def _total_samples(engine):
+    return sum(collector.samples for collector in engine.node_collectors)
+
+
+def run_engine(engine_name, nodes, interval, duration, latency, handshake, workers, startup_timeout):
+    """Run one engine against simulated nodes. Return a dict of measurements."""
+    base = AsyncMainCollector if engine_name == "asyncio" else MainCollector
+    config = CollectorConfig('collector')
+    config.update(engine=engine_name, async_workers=workers, ssh_pool=False, batch_commands=True,
+                  collect_mode="poll")
+    engine = _engine_class(base, nodes, latency, handshake)(BenchmarkAgent(interval), config)
+
+    startup_begin = time.monotonic()
+    engine.start()
+    while time.monotonic() - startup_begin < startup_timeout:
+        collectors = engine.node_collectors
+        if len(collectors) == nodes and all(collector.samples > 0 for collector in collectors):
+            break
+        time.sleep(0.1)
+    startup = time.monotonic() - startup_begin
+
+    peak_threads = threading.active_count()
+    samples_begin = _total_samples(engine)
+    cpu_begin = time.process_time()
+    wall_begin = time.monotonic()
+    while time.monotonic() - wall_begin < duration:
+        time.sleep(0.5)
+        peak_threads = max(peak_threads, threading.active_count())
+    wall = time.monotonic() - wall_begin
+    cpu = time.process_time() - cpu_begin
+    samples = _total_samples(engine) - samples_begin
+
+    engine.signal_stop()
+    engine.join()
+
+    rate = samples / wall
+    expected = nodes / interval
+    cpu_fraction = cpu / wall
+    nodes_per_core = (rate * interval) / cpu_fraction if cpu_fraction > 0 else float("inf")
+    return {"engine": engine_name, "nodes": nodes, "startup": startup, "rate": rate, "expected": expected,
+            "cpu": cpu_fraction * 100, "threads": peak_threads, "nodes_per_core": nodes_per_core}
+
+
+def parse_arguments():
+    """Parse benchmark arguments."""
+    parser = argparse.ArgumentParser(description='Compare threaded and asyncio collection engines.')
+    parser.add_argument('--nodes', type=int, nargs='+', default=[100, 500], help='Simulated node counts.')
+    parser.add_argument('--engines', nargs='+', default=["threaded", "asyncio"], help='Engines to run.')
+    parser.add_argument('--interval', type=float, default=1.0, help='Collect interval in seconds.')
+    parser.add_argument('--duration', type=float, default=15.0, help='Measurement duration in seconds.')
+    parser.add_argument('--latency', type=float, default=0.05, help='Simulated command latency in seconds.')
+    parser.add_argument('--handshake', type=float, default=0.01, help='Simulated handshake latency in seconds.')
+    parser.add_argument('--workers', type=int, default=64, help='Executor size of the asyncio engine.')
+    parser.add_argument('--startup-timeout', type=float, default=120.0, help='Maximum time to wait for startup.')
+    return parser.parse_args()
+
+
+def main():
+    """Run the benchmark and print a result table."""
+    args = parse_arguments()
+    logging.basicConfig(level=logging.ERROR)
+    print("{:<9} {:>6} {:>9} {:>11} {:>11} {:>7} {:>8} {:>11}".format(
+        "engine", "nodes", "startup", "samples/s", "expected/s", "cpu%", "threads", "nodes/core"))
+    for nodes in args.nodes:
+        for engine_name in args.engines:
+            result = run_engine(engine_name, nodes, args.interval, args.duration, args.latency, args.handshake,
+                                args.workers, args.startup_timeout)
+            print("{engine:<9} {nodes:>6} {startup:>8.1f}s {rate:>11.1f} {expected:>11.1f} {cpu:>7.1f} "
+                  "{threads:>8} {nodes_per_core:>11.0f}".format(**result))
+
+
+if __name__ == "__main__":
+    main()
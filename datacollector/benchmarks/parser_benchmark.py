@@ -0,0 +1,136 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Benchmark of the CPU utilisation calculation of MemCpuParser.
+
+Compares the per-core calculation on dict values (cpu_utilisation), the
+vectorized calculation per node, and the batched calculation for all nodes
+at once. Reports microseconds per node and sample.
+
+Example:
+python -m datacollector.benchmarks.parser_benchmark --nodes 100 --cores 4 64 --rounds 50
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from datacollector.collector.memcpu_parser import (CPU_FIELDS, MemCpuParser, cpu_counters_from_row,
+                                                   cpu_utilisation_array, parse_cpu_counters)
+
+
+def _cpu_lines(counters):
+    """Format counters of the aggregate cpu and each core as /proc/stat lines."""
+    return ["{} {}\n".format("cpu" if index == 0 else "cpu{}".format(index - 1), " ".join(map(str, values)))
+            for index, values in enumerate(counters)]
+
+
+def _advance(counters, rng):
+    """Advance counters of every core by a random load."""
+    for values in counters:
+        for field in range(len(CPU_FIELDS)):
+            values[field] += rng.randint(0, 100)
+
+
+def _row(lines):
+    """Build a data row with string cpu dicts as MemCpuRecord does."""
+    row = {"timestamp": "", "run_id": ""}
+    for line in lines:
+        temp = line.split()
+        row[temp[0]] = dict(zip(CPU_FIELDS, temp[1:]))
+    return row
+
+
+def stacked_cpu_utilisation(counters, previous):
+    """Calculate the utilisation of the counters of many nodes in one vectorized delta.
+
+    counters and previous are lists of cores x fields arrays. Return the list of utilisation arrays.
+    """
+    if not counters:
+        return []
+    if len({values.shape[1] for values in counters}) > 1:
+        return [cpu_utilisation_array(values, prev) for values, prev in zip(counters, previous)]
+    utilisation = cpu_utilisation_array(np.concatenate(counters), np.concatenate(previous))
+    return np.split(utilisation, np.cumsum([len(values) for values in counters])[:-1])
+
+
+def handle_memcpu_data_rows(items):
+    """Handle data rows of many nodes, calculating the CPU utilisation of all of them in one vectorized delta.
+
+    items is a list of (parser, data_row, counters) tuples, counters being optional as in handle_memcpu_data_row().
+
+    Return the list of parsed data rows.
+    """
+    counters = {}
+    for index, (parser, row, row_counters) in enumerate(items):
+        if "cpu" in row:
+            counters[index] = row_counters if row_counters is not None else cpu_counters_from_row(row)
+    utilisations = stacked_cpu_utilisation(
+        [counters[index][1] for index in counters],
+        [items[index][0].previous_counters(*counters[index]) for index in counters])
+    utilisations = dict(zip(counters, utilisations))
+    return [parser.modify_memcpu_data_row(row, counters.get(index), utilisations.get(index))
+            for index, (parser, row, _) in enumerate(items)]
+
+
+def run_benchmark(nodes, cores, rounds, seed=0):
+    """Return microseconds per node and sample of the scalar, vectorized and batched calculations."""
+    rng = random.Random(seed)
+    counters = [[[rng.randint(0, 10 ** 6) for _ in CPU_FIELDS] for _ in range(cores + 1)] for _ in range(nodes)]
+    reference = MemCpuParser()
+    scalar = [dict() for _ in range(nodes)]
+    vectorized = [MemCpuParser() for _ in range(nodes)]
+    batched = [MemCpuParser() for _ in range(nodes)]
+    timings = {"scalar": 0.0, "vectorized": 0.0, "batched": 0.0}
+    for _ in range(rounds):
+        lines = []
+        for node in counters:
+            _advance(node, rng)
+            lines.append(_cpu_lines(node))
+
+        rows = [_row(node_lines) for node_lines in lines]
+        begin = time.perf_counter()
+        for previous, row in zip(scalar, rows):
+            for name in [key for key in row if key.startswith("cpu")]:
+                row[name]["utilisation"] = reference.cpu_utilisation(row[name],
+                                                                     previous.get(name, dict.fromkeys(CPU_FIELDS, 0)))
+                previous[name] = row[name]
+        timings["scalar"] += time.perf_counter() - begin
+
+        rows = [_row(node_lines) for node_lines in lines]
+        begin = time.perf_counter()
+        for parser, row, node_lines in zip(vectorized, rows, lines):
+            parser.handle_memcpu_data_row(row, parse_cpu_counters(node_lines))
+        timings["vectorized"] += time.perf_counter() - begin
+
+        rows = [_row(node_lines) for node_lines in lines]
+        begin = time.perf_counter()
+        handle_memcpu_data_rows([(parser, row, parse_cpu_counters(node_lines))
+                                 for parser, row, node_lines in zip(batched, rows, lines)])
+        timings["batched"] += time.perf_counter() - begin
+    return {name: value / (nodes * rounds) * 10 ** 6 for name, value in timings.items()}
+
+
+def parse_arguments():
+    """Parse benchmark arguments."""
+    parser = argparse.ArgumentParser(description='Benchmark the CPU utilisation calculation.')
+    parser.add_argument('--nodes', type=int, default=100, help='Number of nodes.')
+    parser.add_argument('--cores', type=int, nargs='+', default=[4, 64], help='Numbers of cores per node.')
+    parser.add_argument('--rounds', type=int, default=50, help='Samples per node.')
+    return parser.parse_args()
+
+
+def main():
+    """Run the benchmarks and print a result table."""
+    args = parse_arguments()
+    print("{:>6} {:>6} {:>12} {:>14} {:>11}".format("nodes", "cores", "scalar us", "vectorized us", "batched us"))
+    for cores in args.cores:
+        result = run_benchmark(args.nodes, cores, args.rounds)
+        print("{:>6} {:>6} {scalar:>12.1f} {vectorized:>14.1f} {batched:>11.1f}".format(args.nodes, cores, **result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Benchmark of the JSON data files against the columnar store.
+
+Writes the samples of one node over a run of the given length to a JSON
+data file and to a columnar store, then reads back one cpu series of the
+whole run and of one hour in its middle. Reports the write time per
+sample, the read times, and the size on disk of both formats.
+
+Example:
+python -m datacollector.benchmarks.store_benchmark --days 7 --interval 10 --cores 4
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from datacollector.collector.columnar_store import ColumnarReader, ColumnarWriter
+from datacollector.collector.file_sink import FileSink
+from datacollector.collector.memcpu_parser import CPU_FIELDS
+from datacollector.collector.sample import CpuSample, MemorySample, Sample
+from datacollector.benchmarks.engine_benchmark import MEM_LINES
+
+
+def _samples(count, interval, cores, seed=0):
+    """Yield synthetic samples of one node at the given interval."""
+    rng = np.random.default_rng(seed)
+    names = tuple(["cpu"] + ["cpu{}".format(core) for core in range(cores)])
+    counters = rng.integers(0, 10 ** 6, (cores + 1, len(CPU_FIELDS)))
+    memory = MemorySample.from_lines(MEM_LINES)
+    start = datetime(2021, 5, 3)
+    for index in range(count):
+        counters = counters + rng.integers(0, 100, counters.shape)
+        sample = Sample((start + timedelta(seconds=index * interval)).isoformat(), "benchmark")
+        sample.cpu = CpuSample(names, counters, rng.random(cores + 1) * 100)
+        sample.memory = memory
+        yield sample
+
+
+def _size(path):
+    """Return the size of a file or of the files in a directory."""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def run_benchmark(days, interval, cores):
+    """Return write and read timings of both formats for one node."""
+    count = int(days * 86400 / interval)
+    directory = tempfile.mkdtemp(prefix="dc_store_")
+    json_path = os.path.join(directory, "node.json")
+    columns_path = os.path.join(directory, "node.columns")
+    try:
+        sink = FileSink(json_path, durability="none")
+        writer = ColumnarWriter(columns_path, durability="none")
+        timings = {"json_write": 0.0, "columnar_write": 0.0}
+        for sample in _samples(count, interval, cores):
+            begin = time.perf_counter()
+            sink.write(sample.to_dict())
+            timings["json_write"] += time.perf_counter() - begin
+            begin = time.perf_counter()
+            writer.append(sample)
+            timings["columnar_write"] += time.perf_counter() - begin
+        sink.close()
+        writer.close()
+
+        middle = (datetime(2021, 5, 3) + timedelta(days=days / 2))
+        hour = (middle.isoformat(), (middle + timedelta(hours=1)).isoformat())
+        begin = time.perf_counter()
+        with open(json_path) as file:
+            values = [int(json.loads(line)["cpu0"]["user"]) for line in file]
+        timings["json_read_all"] = time.perf_counter() - begin
+        begin = time.perf_counter()
+        with open(json_path) as file:
+            rows = (json.loads(line) for line in file)
+            hourly = [int(row["cpu0"]["user"]) for row in rows if hour[0] <= row["timestamp"] <= hour[1]]
+        timings["json_read_hour"] = time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        reader = ColumnarReader(columns_path)
+        total = int(reader.series("cpu.cpu0.user").sum())
+        timings["columnar_read_all"] = time.perf_counter() - begin
+        begin = time.perf_counter()
+        reader = ColumnarReader(columns_path)
+        hourly_total = int(reader.series("cpu.cpu0.user", *hour).sum())
+        timings["columnar_read_hour"] = time.perf_counter() - begin
+        if total != sum(values) or hourly_total != sum(hourly):
+            raise RuntimeError("Columnar store does not match the JSON data file")
+        return dict(timings, samples=count, json_bytes=_size(json_path), columnar_bytes=_size(columns_path))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def parse_arguments():
+    """Parse benchmark arguments."""
+    parser = argparse.ArgumentParser(description='Benchmark the JSON data files against the columnar store.')
+    parser.add_argument('--days', type=float, default=7.0, help='Length of the run in days.')
+    parser.add_argument('--interval', type=float, default=10.0, help='Collect interval in seconds.')
+    parser.add_argument('--cores', type=int, default=4, help='Number of cores of the node.')
+    return parser.parse_args()
+
+
+def main():
+    """Run the benchmark and print a result table."""
+    args = parse_arguments()
+    result = run_benchmark(args.days, args.interval, args.cores)
+    print("{} samples, {} cores".format(result["samples"], args.cores))
+    print("{:<9} {:>12} {:>12} {:>13} {:>10}".format("format", "write us", "read all ms", "read hour ms", "MB"))
+    for name in ("json", "columnar"):
+        print("{:<9} {:>12.1f} {:>12.1f} {:>13.2f} {:>10.1f}".format(
+            name, result[name + "_write"] / result["samples"] * 10 ** 6, result[name + "_read_all"] * 1000,
+            result[name + "_read_hour"] * 1000, result[name + "_bytes"] / 2 ** 20))
+
+
+if __name__ == "__main__":
+    main()
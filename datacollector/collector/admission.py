@@ -0,0 +1,107 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Admission control for SSH handshakes.
+
+Limits how many node collectors connect at the same time and how many new
+connections are started per second. Waiting nodes are admitted in FIFO order.
+
+Example usage:
+with admission.admit(node_name):
+    connection.connect()
+"""
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from threading import Condition
+
+
+class AdmissionController:
+    """Bounded, rate limited and fair admission of connection attempts."""
+
+    def __init__(self, max_concurrent=8, rate=0, burst=1):
+        """Initialize controller.
+
+        max_concurrent: number of handshakes allowed at the same time.
+        rate: new handshakes per second (token bucket refill rate). 0 disables rate limiting.
+        burst: token bucket size.
+        """
+        self._max_concurrent = max(1, max_concurrent)
+        self._rate = rate
+        self._burst = max(1, burst)
+        self._tokens = float(self._burst)
+        self._last_refill = time.monotonic()
+        self._active = 0
+        self._queue = deque()
+        self._condition = Condition()
+        self._wait_times = {}
+
+    @property
+    def active(self):
+        """Number of admitted handshakes in progress."""
+        return self._active
+
+    @property
+    def queued(self):
+        """Number of nodes waiting for admission."""
+        return len(self._queue)
+
+    def wait_times(self):
+        """Return a dict of node name -> seconds the node waited for its last admission."""
+        with self._condition:
+            return dict(self._wait_times)
+
+    @contextmanager
+    def admit(self, name):
+        """Context manager that blocks until the node is admitted and releases the slot on exit."""
+        self.acquire(name)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, name):
+        """Block until the node is first in line, a slot is free and a token is available.
+
+        Return the time waited in seconds.
+        """
+        ticket = object()
+        start = time.monotonic()
+        with self._condition:
+            self._queue.append(ticket)
+            while True:
+                timeout = None
+                if self._queue[0] is ticket and self._active < self._max_concurrent:
+                    timeout = self._take_token()
+                    if timeout is None:
+                        break
+                self._condition.wait(timeout)
+            self._queue.popleft()
+            self._active += 1
+            waited = time.monotonic() - start
+            self._wait_times[name] = waited
+            self._condition.notify_all()
+        if waited > 1:
+            logging.getLogger('__collector__').info("%s waited %.1fs for connection admission.", name, waited)
+        return waited
+
+    def release(self):
+        """Release an admitted slot."""
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def _take_token(self):
+        """Take a token from the bucket. Return None on success, else seconds until the next token."""
+        if self._rate <= 0:
+            return None
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return None
+        return (1 - self._tokens) / self._rate
@@ -10,14 +10,17 @@ import time
 from datetime import datetime, timedelta
 from threading import Event, Thread
 
+from datacollector.collector.async_maincollector import AsyncMainCollector
+from datacollector.collector.collector_config_parser import CollectorConfig
 from datacollector.collector.maincollector import MainCollector
+from datacollector.collector.ssh_pool import SshTransportPool
 
 
 class Agent(Thread):
     """ Agent is used to communicate messages from and to the MainCollector-Nodecollector(s)-complexe(s)."""
 
-    def __init__(self, start_time, stop_time, collect_interval, run_id):
-        """Construct agent."""
+    def __init__(self, start_time, stop_time, collect_interval, run_id, collector_config=None):
+        """Construct agent. Collector configuration is read from collector_config.ini if not given."""
         super().__init__()
         self._collect_interval = collect_interval
         self._collect_start_time = start_time
@@ -30,6 +33,7 @@ class Agent(Thread):
         self._shutdown = False
         self.adapter = None
         self._reconnect = False
+        self._collector_config = collector_config
 
     @property
     def collect_id(self):
@@ -90,8 +94,27 @@ class Agent(Thread):
             time.sleep(1)
 
     def connect(self):
-        """Starts a loop which waits for messages from any adapters."""
-        self.adapter = MainCollector(self)
+        """Starts a loop which waits for messages from any adapters.
+
+        A reference to the shared SSH pool is held until the adapter has finished, including its restarts,
+        so that a restarted adapter reuses the transports of the previous one.
+        """
+        if self._collector_config is None:
+            self._collector_config = CollectorConfig('collector')
+        if self._collector_config.ssh_pool:
+            SshTransportPool.shared()
+        try:
+            self._run_adapter()
+        finally:
+            if self._collector_config.ssh_pool:
+                SshTransportPool.release_shared()
+
+    def _run_adapter(self):
+        """Run the adapter until shutdown or stop time, then restart it if it has died."""
+        if self._collector_config.engine == "asyncio":
+            self.adapter = AsyncMainCollector(self, self._collector_config)
+        else:
+            self.adapter = MainCollector(self, self._collector_config)
         logging.info("Agent started.")
         self.wait_for_start()
         logging.info("Start time reached")
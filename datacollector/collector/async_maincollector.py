@@ -0,0 +1,155 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Asyncio based alternative to the threaded MainCollector.
+
+Node collectors are not started as threads. A single event loop schedules a
+collection coroutine for every node on each interval, and the blocking parts
+(connecting, paramiko commands, ingestion) run in a bounded thread pool.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from datacollector.collector.inventory import NodeStatus
+from datacollector.collector.maincollector import MainCollector, NoNodesException
+
+
+class AsyncMainCollector(MainCollector):
+    """MainCollector that drives all node collectors from one asyncio event loop."""
+
+    def __init__(self, agent, collector_config=None):
+        """Initialize asyncio main collector."""
+        super().__init__(agent, collector_config)
+        self._loop = None
+        self._wakeup = None
+        self._executor = None
+        self._in_flight = {}
+
+    def signal_stop(self):
+        """Call after StopCollector message. Wakes up the event loop."""
+        super().signal_stop()
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _main_logic(self):
+        """Run main logic in an event loop owned by this thread."""
+        try:
+            logging.info("Running AsyncMainCollector _main_logic...")
+            self._create_node_collectors()
+            asyncio.run(self._async_main())
+        except Exception as e:
+            logging.warning("Collector ran into an issue: %s. Shutting down...", str(e))
+            self.stop = True
+
+    async def _async_main(self):
+        """Connect all nodes, then trigger collections every collect interval until stopped."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self._collector_config.async_workers,
+                                            thread_name_prefix=self.name)
+        try:
+            await self._start_node_collectors_async()
+            self.agent._reconnect_start_time = None
+            self.agent._reconnect = False
+            tick = self._scheduler.first_tick()
+            while not self._stop_event.is_set() and self._node_collectors != []:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, tick - time.time()))
+                except asyncio.TimeoutError:
+                    self._collect(tick)
+                    tick = self._scheduler.next_tick(tick)
+            self._collect(time.time(), use_offsets=False)  # Collect last time after stop event has been set.
+            await self._finish_collections()
+            self._stop_node_collectors()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    async def _start_node_collectors_async(self):
+        """Connect and test all node collectors through the bounded executor."""
+        logging.info("Starting %s NodeCollectors...", len(self._node_collectors))
+        if not self._node_collectors:
+            raise NoNodesException
+
+        await asyncio.gather(*[self._connect_node(collector) for collector in self._node_collectors])
+
+    async def _connect_node(self, collector):
+        """Connect and test a single node collector. A failed node keeps reconnecting in the background."""
+        try:
+            ready = await self._loop.run_in_executor(self._executor, collector.connect_and_test)
+        except Exception as e:
+            ready = False
+            logging.getLogger('__collector__').error("%s connection failed: %s", collector.node_name, str(e))
+        if not ready:
+            logging.getLogger('__collector__').warning("%s not connected, retrying in background.",
+                                                       collector.node_name)
+
+    def _start_node_collector(self, collector):
+        """Connect a node collector added while the event loop is running."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(lambda: self._loop.create_task(self._connect_node(collector)))
+
+    def _collect(self, scheduled_time, use_offsets=True):
+        """Schedule a collection coroutine for every node that is not still collecting.
+
+        A node with an ongoing collection skips or coalesces the new request without affecting other nodes.
+        Each coroutine starts at the scheduled tick plus the phase offset of its node.
+        """
+        if not self._check_alive_collectors():
+            self.signal_stop()
+        if use_offsets and not self._admit_tick(scheduled_time):
+            return
+
+        logging.info("Triggering new collection for all nodes.")
+        self._collect_start_time = datetime.utcnow()
+        for collector in self._node_collectors:
+            if collector.stopped or collector.status != NodeStatus.RUNNING:
+                continue
+            if not collector.begin_collection(scheduled_time):
+                continue
+            start = scheduled_time + collector.phase_offset if use_offsets else scheduled_time
+            self._in_flight[collector] = self._loop.create_task(self._collect_node(collector, start))
+
+    async def _collect_node(self, collector, start):
+        """Wait until the start time of the node and run the begun collection in the executor."""
+        try:
+            delay = start - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._loop.run_in_executor(self._executor, collector.run_collection)
+        except Exception as e:
+            logging.getLogger('__collector__').error("%s collecting failed: %s",
+                                                     collector.connection.hostname, str(e))
+        finally:
+            del self._in_flight[collector]
+
+    async def _finish_collections(self):
+        """Wait for the collections in flight, then for the executor, so that no collection outlives its record.
+
+        Collections still waiting for their start after collect_interval are cancelled. Those already running in
+        the executor cannot be interrupted, and shutting down the executor waits for them.
+        """
+        if self._in_flight:
+            await asyncio.wait(list(self._in_flight.values()), timeout=self._collect_interval)
+        for task in list(self._in_flight.values()):
+            task.cancel()
+        self._executor.shutdown(wait=True)
+
+    def _stop_node_collectors(self):
+        """Set stop flag for each node collector and close their connections and data files."""
+        logging.info("%s stopping node collectors.", self.name)
+        for collector in self._node_collectors:
+            collector.connection.close_session()
+            collector.stop()
+            collector.close_record()
+            if collector.status != NodeStatus.FAILED:
+                collector.status = NodeStatus.STOPPED
+        logging.info("%s all node collectors stopped.", self.name)
+
+    def _check_alive_collectors(self):
+        """Check that at least one node collector has not been stopped."""
+        return any(not collector.stopped for collector in self._node_collectors)
@@ -0,0 +1,130 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Backpressure from the sinks of the samples into the collection scheduler.
+
+Sinks report their lag as a number where 0 is idle and 1 is saturated: the
+share of the time a data file spends writing, the fill level of the
+Elasticsearch queue or of a spool near its disk budget. On every tick, the main collector takes
+the highest lag of all sinks as the pressure. Above the high watermark, the
+next action of the policy is taken; below the low watermark, the last one is
+undone. Actions, in the order given by the policy:
+
+drop_process: collect samples without the process table
+stretch: collect only every 2nd tick, then every 4th and so on up to max_stretch
+shed: skip ticks, so that no samples are collected
+
+Every decision is counted.
+"""
+import logging
+import math
+import threading
+
+BACKPRESSURE_ACTIONS = ("drop_process", "stretch", "shed")
+
+
+class BackpressureException(Exception):
+    """Raised with an unknown backpressure action."""
+
+
+class BackpressureController:
+    """Escalates and relaxes the actions of a backpressure policy by the pressure of the sinks."""
+
+    def __init__(self, actions=BACKPRESSURE_ACTIONS, high=0.8, low=0.5, max_stretch=8):
+        """Initialize controller.
+
+        actions: actions to take in order of escalation, none to only measure the pressure.
+        high: pressure at or above which the next action is taken.
+        low: pressure at or below which the last action is undone.
+        max_stretch: largest factor by which the collect interval is stretched.
+        """
+        unknown = [action for action in actions if action not in BACKPRESSURE_ACTIONS]
+        if unknown:
+            raise BackpressureException("Unknown backpressure actions: {}".format(", ".join(unknown)))
+        self._actions = tuple(actions)
+        self._high = high
+        self._low = low
+        self._max_stretch = max(2, max_stretch)
+        self._lock = threading.Lock()
+        self._level = 0
+        self._stretch = 1
+        self._pressure = 0.0
+        self._counters = {"escalations": 0, "relaxations": 0, "ticks_stretched": 0, "ticks_shed": 0,
+                          "samples_shed": 0, "processes_dropped": 0}
+
+    @property
+    def pressure(self):
+        """Pressure given to the last update."""
+        return self._pressure
+
+    @property
+    def active_actions(self):
+        """Actions currently taken."""
+        return self._actions[:self._level]
+
+    @property
+    def drop_process(self):
+        """Check if samples are collected without the process table."""
+        return "drop_process" in self.active_actions
+
+    @property
+    def stretch(self):
+        """Factor by which the collect interval is currently stretched."""
+        return self._stretch if "stretch" in self.active_actions else 1
+
+    def counters(self):
+        """Return a dict of the decisions taken, the current pressure, actions and stretch factor."""
+        with self._lock:
+            return dict(self._counters, pressure=self._pressure, actions=list(self.active_actions),
+                        stretch=self.stretch)
+
+    def update(self, pressure):
+        """Take the next action above the high watermark, or undo the last one below the low watermark."""
+        with self._lock:
+            self._pressure = pressure
+            top = self._actions[self._level - 1] if self._level else None
+            if pressure >= self._high:
+                if top == "stretch" and self._stretch < self._max_stretch:
+                    self._stretch *= 2
+                elif self._level < len(self._actions):
+                    self._level += 1
+                    if self._actions[self._level - 1] == "stretch":
+                        self._stretch = 2
+                else:
+                    return
+                self._counters["escalations"] += 1
+            elif pressure <= self._low and top is not None:
+                if top == "stretch" and self._stretch > 2:
+                    self._stretch //= 2
+                else:
+                    self._level -= 1
+                    if top == "stretch":
+                        self._stretch = 1
+                self._counters["relaxations"] += 1
+            else:
+                return
+        logging.getLogger('__collector__').warning("Sink pressure %.2f, backpressure actions: %s, stretch %s.",
+                                                   pressure, ", ".join(self.active_actions) or "none", self.stretch)
+
+    def admit(self, scheduled_time, interval, nodes):
+        """Check if the tick at scheduled_time is collected. Count it as stretched or shed if not.
+
+        Stretched ticks are chosen by their position since the epoch, so that the remaining ticks stay aligned.
+        """
+        with self._lock:
+            active = self._actions[:self._level]
+            if "shed" in active:
+                self._counters["ticks_shed"] += 1
+                self._counters["samples_shed"] += nodes
+                return False
+            if "stretch" in active and math.floor(scheduled_time / interval + 0.5) % self._stretch:
+                self._counters["ticks_stretched"] += 1
+                return False
+            return True
+
+    def count_process_dropped(self):
+        """Count a sample collected without the process table because of backpressure."""
+        with self._lock:
+            self._counters["processes_dropped"] += 1
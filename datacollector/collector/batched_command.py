@@ -0,0 +1,111 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Functionality for running several commands in a single remote invocation.
+
+The output of each command is framed between a begin and an end marker line,
+so that the combined output can be split back into named sections:
+
+#DC-BEGIN cpu
+...output of cat /proc/stat...
+#DC-END cpu 0
+
+The sections can also be read while the output is still being received,
+with iter_sections().
+"""
+import logging
+
+SECTION_BEGIN = "#DC-BEGIN "
+SECTION_END = "#DC-END "
+
+
+class BatchFramingException(Exception):
+    """Raised when batched command output cannot be split into sections."""
+
+
+class BatchedCommand:
+    """Combines named commands into one shell command and demultiplexes its output."""
+
+    def __init__(self, sections):
+        """Initialize with an iterable of (name, command) pairs."""
+        self._sections = list(sections)
+        self._command = self._build_command()
+
+    @property
+    def sections(self):
+        """Public access for the (name, command) pairs."""
+        return self._sections
+
+    @property
+    def names(self):
+        """Public access for the section names."""
+        return [name for name, _ in self._sections]
+
+    @property
+    def command(self):
+        """Public access for the combined shell command."""
+        return self._command
+
+    def _build_command(self):
+        """Frame each command with begin and end markers. End marker includes the exit status."""
+        parts = []
+        for name, command in self._sections:
+            parts.append("echo '{begin}{name}'; {command}; echo \"{end}{name} $?\"".format(
+                begin=SECTION_BEGIN, end=SECTION_END, name=name, command=command))
+        return "; ".join(parts)
+
+    def split(self, lines):
+        """Split the output lines of the combined command into a dict of section name -> lines."""
+        return {name: list(section) for name, section in self.iter_sections(lines)}
+
+    def iter_sections(self, lines):
+        """Demultiplex output lines while they are read. Yield (name, lines) pairs in output order.
+
+        The lines of a section are an iterator over the same output, so a section should be consumed before
+        the next one is read. Lines left unconsumed are skipped. Framing errors raise BatchFramingException
+        when they are reached, and missing sections once the output has ended.
+        """
+        lines = iter(lines)
+        seen = set()
+        for line in lines:
+            if line.startswith(SECTION_BEGIN):
+                name = line[len(SECTION_BEGIN):].strip()
+                section = self._section_lines(name, lines)
+                yield name, section
+                for _ in section:
+                    pass
+                seen.add(name)
+            elif line.startswith(SECTION_END):
+                name = line[len(SECTION_END):].strip().partition(" ")[0]
+                raise BatchFramingException("Unexpected end of section {}".format(name))
+        missing = [name for name in self.names if name not in seen]
+        if missing:
+            raise BatchFramingException("Missing sections: {}".format(", ".join(missing)))
+
+    @staticmethod
+    def _section_lines(name, lines):
+        """Yield the lines of a section until its end marker.
+
+        Each line is yielded only once the next one has been read, so a line cut off by lost output
+        is never parsed. The framing error is raised instead.
+        """
+        previous = None
+        for line in lines:
+            if line.startswith(SECTION_END):
+                end, _, status = line[len(SECTION_END):].strip().partition(" ")
+                if end != name:
+                    raise BatchFramingException("Unexpected end of section {}".format(end))
+                if status not in ("", "0"):
+                    logging.getLogger('__collector__').warning("Command for section %s exited with status %s",
+                                                               name, status)
+                if previous is not None:
+                    yield previous
+                return
+            if line.startswith(SECTION_BEGIN):
+                raise BatchFramingException("Section {} was not terminated".format(name))
+            if previous is not None:
+                yield previous
+            previous = line
+        raise BatchFramingException("Section {} was not terminated".format(name))
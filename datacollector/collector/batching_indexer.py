@@ -0,0 +1,204 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Background batching of documents indexed to Elasticsearch.
+
+Node collectors put bulk actions on a bounded queue and return at once. A
+pool of worker threads collects them into batches and sends each batch with
+one bulk request when it reaches elastic_batch_size documents or
+elastic_batch_bytes of serialized documents, or when its oldest document has
+waited elastic_flush_latency seconds. The workers send their batches in
+parallel over the connection pool of the indexer. When the queue is full,
+actions go to the overflow handler, e.g. the spool of the indexer.
+
+The _source of each action is serialized once, when it is added to a batch,
+and passed on as a JSON string, which the Elasticsearch client sends as is.
+"""
+import collections
+import json
+import logging
+import queue
+import threading
+import time
+
+_STOP = object()
+_IDLE_WAIT = 0.5
+
+
+class BatchingIndexer:
+    """Bounded queue of bulk actions with worker threads sending them in batches."""
+
+    def __init__(self, send, overflow, queue_size=10000, batch_size=500, batch_bytes=5 * 1024 ** 2,
+                 max_latency=1.0, workers=2):
+        """Initialize and start the workers.
+
+        send(actions): delivers a batch, e.g. ElasticIndexer.index_actions.
+        overflow(actions): takes the actions that do not fit in the queue.
+        """
+        self._send = send
+        self._overflow = overflow
+        self._queue = queue.Queue(max(1, queue_size))
+        self._capacity = max(1, queue_size)
+        self._batch_size = max(1, batch_size)
+        self._batch_bytes = batch_bytes
+        self._max_latency = max_latency
+        self._lock = threading.Lock()
+        self._enqueued = 0
+        self._overflowed = 0
+        self._sent = 0
+        self._flushes = 0
+        self._peak_depth = 0
+        self._overflowed_checked = 0
+        self._latencies = collections.deque(maxlen=1000)
+        self._request_times = collections.deque(maxlen=1000)
+        self._closed = False
+        self._workers = [threading.Thread(target=self._run, name="BatchingIndexer-{}".format(number), daemon=True)
+                         for number in range(max(1, workers))]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def depth(self):
+        """Number of actions waiting in the queue."""
+        return self._queue.qsize()
+
+    @property
+    def capacity(self):
+        """Maximum number of actions in the queue."""
+        return self._capacity
+
+    def lag(self):
+        """Return the fill level of the queue, 0 to 1. 1 if actions overflowed since the previous call."""
+        with self._lock:
+            overflowed, self._overflowed_checked = self._overflowed > self._overflowed_checked, self._overflowed
+        return 1.0 if overflowed else min(1.0, self._queue.qsize() / self._capacity)
+
+    def put(self, action):
+        """Queue a bulk action without waiting. Return False if the queue was full and it was overflowed.
+
+        After close(), the action is sent from the calling thread.
+        """
+        if self._closed:
+            self._send([action])
+            return True
+        try:
+            self._queue.put_nowait((time.monotonic(), action))
+        except queue.Full:
+            with self._lock:
+                self._overflowed += 1
+            self._overflow([action])
+            return False
+        with self._lock:
+            self._enqueued += 1
+            self._peak_depth = max(self._peak_depth, self._queue.qsize())
+        return True
+
+    def metrics(self):
+        """Return a dict of queue depth and counters, and flush latency and request time percentiles in seconds.
+
+        sent counts the actions handed to send(), including those it spooled.
+        The flush latency of a batch is the time from queueing its oldest action until its request completed.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            request_times = sorted(self._request_times)
+            return {"depth": self._queue.qsize(), "capacity": self._capacity, "peak_depth": self._peak_depth,
+                    "enqueued": self._enqueued, "overflowed": self._overflowed, "sent": self._sent,
+                    "flushes": self._flushes, "latency_p50": _percentile(latencies, 0.5),
+                    "latency_p99": _percentile(latencies, 0.99), "latency_max": latencies[-1] if latencies else None,
+                    "request_p50": _percentile(request_times, 0.5),
+                    "request_p99": _percentile(request_times, 0.99)}
+
+    def close(self, timeout=30.0):
+        """Send the queued actions and stop the workers. Actions still queued after timeout are overflowed.
+
+        Never blocks longer than timeout: with a full queue, the workers stop when they find it empty.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            try:
+                self._queue.put_nowait((time.monotonic(), _STOP))
+            except queue.Full:
+                break
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        remaining = []
+        while True:
+            try:
+                _, action = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if action is not _STOP:
+                remaining.append(action)
+        if remaining:
+            self._overflow(remaining)
+
+    def _run(self):
+        """Collect queued actions into batches and send them until stopped.
+
+        Actions already queued are taken without waiting, so that a batch waiting for a slow request is sent
+        full instead of one action at a time. After close(), a worker stops when it finds the queue empty.
+        """
+        batch = []
+        size = 0
+        deadline = None
+        while True:
+            try:
+                enqueued, action = self._queue.get(
+                    timeout=max(0.0, deadline - time.monotonic()) if batch else _IDLE_WAIT)
+            except queue.Empty:
+                enqueued, action = None, None
+                if self._closed and not batch:
+                    return
+            while action is not None and action is not _STOP:
+                if not batch:
+                    deadline = enqueued + self._max_latency
+                source = action["_source"]
+                if not isinstance(source, str):
+                    source = json.dumps(source, separators=(",", ":"))
+                    action = dict(action, _source=source)
+                batch.append((enqueued, action))
+                size += len(source)
+                if len(batch) >= self._batch_size or size >= self._batch_bytes:
+                    break
+                try:
+                    enqueued, action = self._queue.get_nowait()
+                except queue.Empty:
+                    action = None
+            if action is _STOP:
+                self._flush(batch)
+                return
+            if batch and (len(batch) >= self._batch_size or size >= self._batch_bytes
+                          or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+                size = 0
+
+    def _flush(self, batch):
+        """Send a batch and record its latency."""
+        if not batch:
+            return
+        begin = time.monotonic()
+        try:
+            self._send([action for _, action in batch])
+        except Exception as e:
+            logging.getLogger('__collector__').exception("Failed to send batch of %s documents: %s", len(batch),
+                                                         str(e))
+        end = time.monotonic()
+        with self._lock:
+            self._flushes += 1
+            self._sent += len(batch)
+            self._request_times.append(end - begin)
+            self._latencies.append(end - batch[0][0])
+
+
+def _percentile(ordered, fraction):
+    """Return the nearest-rank percentile of a sorted list, None for an empty list."""
+    if not ordered:
+        return None
+    return ordered[max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))]
@@ -0,0 +1,508 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+"""Module for IConfig implementation for collector behaviour settings."""
+
+import configparser
+import logging
+import pathlib
+
+from datacollector.collector.backpressure import BACKPRESSURE_ACTIONS
+from datacollector.collector.file_sink import DURABILITY_POLICIES
+from datacollector.collector.iconfig_parser import IConfig
+from datacollector.collector.segments import COMPRESSION_SUFFIXES
+from datacollector.collector.sshconnection import COMPRESSORS
+
+COLLECT_MODES = ("poll", "stream")
+ENGINES = ("threaded", "asyncio")
+OVERRUN_POLICIES = ("skip", "coalesce")
+FILE_FORMATS = ("json", "columnar", "both")
+
+
+class CollectorConfigException(Exception):
+    """Raised when configuration values are invalid or cannot be used together."""
+
+
+class CollectorConfig(IConfig):
+    """Implementation of IConfig for collector behaviour configuration.
+
+    All values are optional. A missing file, section or key falls back to the default value.
+    """
+    def __init__(self, config_name):
+        super().__init__(config_name)
+        self._config_parser = configparser.ConfigParser(inline_comment_prefixes=(';',))
+
+        absp = pathlib.Path(__file__).parent.parent.absolute()
+        abspath = absp.__str__()
+        self._config_parser.read(abspath + '/config/' + 'collector_config.ini')
+
+        self._config_name = config_name
+        self._batch_commands = True
+        self._collect_mode = "poll"
+        self._stream_interval_ms = 1000
+        self._ssh_pool = True
+        self._ssh_pool_idle_timeout = 300
+        self._engine = "threaded"
+        self._async_workers = 32
+        self._inventory_file = ""
+        self._start_concurrency = 16
+        self._max_concurrent_handshakes = 8
+        self._handshake_rate = 0.0
+        self._handshake_burst = 8
+        self._reconnect_base_delay = 1.0
+        self._reconnect_max_delay = 60.0
+        self._reconnect_workers = 4
+        self._breaker_failure_threshold = 5
+        self._breaker_reset_timeout = 300.0
+        self._align_ticks = True
+        self._phase_spread = 0.0
+        self._overrun_policy = "skip"
+        self._cpu_interval = 0.0
+        self._memory_interval = 0.0
+        self._process_interval = 0.0
+        self._compression = "none"
+        self._compression_level = 1
+        self._process_delta = False
+        self._process_keyframe_interval = 10
+        self._process_cpu_threshold = 1.0
+        self._process_memory_threshold = 1024
+        self._index_to_elastic = True
+        self._file_buffer_bytes = 65536
+        self._file_flush_interval = 1.0
+        self._file_durability = "flush"
+        self._file_fsync_every = 10
+        self._file_rotate_bytes = 0
+        self._file_rotate_interval = 0.0
+        self._file_compression = "none"
+        self._file_format = "json"
+        self._elastic_spool = True
+        self._elastic_spool_directory = ""
+        self._elastic_spool_max_bytes = 1024 ** 3
+        self._elastic_spool_segment_bytes = 16 * 1024 ** 2
+        self._elastic_replay_batch = 5000
+        self._elastic_replay_interval = 60.0
+        self._elastic_pool_size = 10
+        self._elastic_batching = True
+        self._elastic_queue_size = 10000
+        self._elastic_batch_size = 500
+        self._elastic_batch_bytes = 5 * 1024 ** 2
+        self._elastic_flush_latency = 1.0
+        self._elastic_workers = 2
+        self._backpressure = True
+        self._backpressure_actions = ("drop_process", "stretch")
+        self._backpressure_high = 0.8
+        self._backpressure_low = 0.5
+        self._backpressure_max_stretch = 8
+        self._backpressure_spool_threshold = 0.9
+        self.read_config()
+        self._validate()
+
+    @property
+    def port(self):
+        """Collector configuration does not define a port."""
+        return None
+
+    @property
+    def batch_commands(self):
+        """Getter for self._batch_commands."""
+        return self._batch_commands
+
+    @property
+    def collect_mode(self):
+        """Getter for self._collect_mode. Either "poll" or "stream"."""
+        return self._collect_mode
+
+    @property
+    def stream_interval_ms(self):
+        """Getter for self._stream_interval_ms."""
+        return self._stream_interval_ms
+
+    @property
+    def ssh_pool(self):
+        """Getter for self._ssh_pool."""
+        return self._ssh_pool
+
+    @property
+    def ssh_pool_idle_timeout(self):
+        """Getter for self._ssh_pool_idle_timeout."""
+        return self._ssh_pool_idle_timeout
+
+    @property
+    def engine(self):
+        """Getter for self._engine. Either "threaded" or "asyncio"."""
+        return self._engine
+
+    @property
+    def async_workers(self):
+        """Getter for self._async_workers."""
+        return self._async_workers
+
+    @property
+    def inventory_file(self):
+        """Getter for self._inventory_file. Empty means every section of device_config.ini."""
+        return self._inventory_file
+
+    @property
+    def start_concurrency(self):
+        """Getter for self._start_concurrency."""
+        return self._start_concurrency
+
+    @property
+    def max_concurrent_handshakes(self):
+        """Getter for self._max_concurrent_handshakes."""
+        return self._max_concurrent_handshakes
+
+    @property
+    def handshake_rate(self):
+        """Getter for self._handshake_rate. New handshakes per second, 0 for unlimited."""
+        return self._handshake_rate
+
+    @property
+    def handshake_burst(self):
+        """Getter for self._handshake_burst."""
+        return self._handshake_burst
+
+    @property
+    def reconnect_base_delay(self):
+        """Getter for self._reconnect_base_delay."""
+        return self._reconnect_base_delay
+
+    @property
+    def reconnect_max_delay(self):
+        """Getter for self._reconnect_max_delay."""
+        return self._reconnect_max_delay
+
+    @property
+    def reconnect_workers(self):
+        """Getter for self._reconnect_workers."""
+        return self._reconnect_workers
+
+    @property
+    def breaker_failure_threshold(self):
+        """Getter for self._breaker_failure_threshold."""
+        return self._breaker_failure_threshold
+
+    @property
+    def breaker_reset_timeout(self):
+        """Getter for self._breaker_reset_timeout."""
+        return self._breaker_reset_timeout
+
+    @property
+    def align_ticks(self):
+        """Getter for self._align_ticks."""
+        return self._align_ticks
+
+    @property
+    def phase_spread(self):
+        """Getter for self._phase_spread."""
+        return self._phase_spread
+
+    @property
+    def overrun_policy(self):
+        """Getter for self._overrun_policy."""
+        return self._overrun_policy
+
+    @property
+    def cpu_interval(self):
+        """Getter for self._cpu_interval."""
+        return self._cpu_interval
+
+    @property
+    def memory_interval(self):
+        """Getter for self._memory_interval."""
+        return self._memory_interval
+
+    @property
+    def process_interval(self):
+        """Getter for self._process_interval."""
+        return self._process_interval
+
+    @property
+    def compression(self):
+        """Getter for self._compression."""
+        return self._compression
+
+    @property
+    def compression_level(self):
+        """Getter for self._compression_level."""
+        return self._compression_level
+
+    @property
+    def process_delta(self):
+        """Getter for self._process_delta."""
+        return self._process_delta
+
+    @property
+    def process_keyframe_interval(self):
+        """Getter for self._process_keyframe_interval."""
+        return self._process_keyframe_interval
+
+    @property
+    def process_cpu_threshold(self):
+        """Getter for self._process_cpu_threshold."""
+        return self._process_cpu_threshold
+
+    @property
+    def process_memory_threshold(self):
+        """Getter for self._process_memory_threshold."""
+        return self._process_memory_threshold
+
+    @property
+    def index_to_elastic(self):
+        """Getter for self._index_to_elastic."""
+        return self._index_to_elastic
+
+    @property
+    def file_buffer_bytes(self):
+        """Getter for self._file_buffer_bytes."""
+        return self._file_buffer_bytes
+
+    @property
+    def file_flush_interval(self):
+        """Getter for self._file_flush_interval."""
+        return self._file_flush_interval
+
+    @property
+    def file_durability(self):
+        """Getter for self._file_durability. One of "none", "flush" or "fsync"."""
+        return self._file_durability
+
+    @property
+    def file_fsync_every(self):
+        """Getter for self._file_fsync_every."""
+        return self._file_fsync_every
+
+    @property
+    def file_rotate_bytes(self):
+        """Getter for self._file_rotate_bytes."""
+        return self._file_rotate_bytes
+
+    @property
+    def file_rotate_interval(self):
+        """Getter for self._file_rotate_interval."""
+        return self._file_rotate_interval
+
+    @property
+    def file_compression(self):
+        """Getter for self._file_compression. One of "none", "gzip" or "lzma"."""
+        return self._file_compression
+
+    @property
+    def file_format(self):
+        """Getter for self._file_format. One of "json", "columnar" or "both"."""
+        return self._file_format
+
+    @property
+    def elastic_spool(self):
+        """Getter for self._elastic_spool."""
+        return self._elastic_spool
+
+    @property
+    def elastic_spool_directory(self):
+        """Getter for self._elastic_spool_directory. Empty for the spool folder of the package."""
+        return self._elastic_spool_directory
+
+    @property
+    def elastic_spool_max_bytes(self):
+        """Getter for self._elastic_spool_max_bytes."""
+        return self._elastic_spool_max_bytes
+
+    @property
+    def elastic_spool_segment_bytes(self):
+        """Getter for self._elastic_spool_segment_bytes."""
+        return self._elastic_spool_segment_bytes
+
+    @property
+    def elastic_replay_batch(self):
+        """Getter for self._elastic_replay_batch."""
+        return self._elastic_replay_batch
+
+    @property
+    def elastic_replay_interval(self):
+        """Getter for self._elastic_replay_interval."""
+        return self._elastic_replay_interval
+
+    @property
+    def elastic_pool_size(self):
+        """Getter for self._elastic_pool_size."""
+        return self._elastic_pool_size
+
+    @property
+    def elastic_batching(self):
+        """Getter for self._elastic_batching."""
+        return self._elastic_batching
+
+    @property
+    def elastic_queue_size(self):
+        """Getter for self._elastic_queue_size."""
+        return self._elastic_queue_size
+
+    @property
+    def elastic_batch_size(self):
+        """Getter for self._elastic_batch_size."""
+        return self._elastic_batch_size
+
+    @property
+    def elastic_batch_bytes(self):
+        """Getter for self._elastic_batch_bytes."""
+        return self._elastic_batch_bytes
+
+    @property
+    def elastic_flush_latency(self):
+        """Getter for self._elastic_flush_latency."""
+        return self._elastic_flush_latency
+
+    @property
+    def elastic_workers(self):
+        """Getter for self._elastic_workers."""
+        return self._elastic_workers
+
+    @property
+    def backpressure(self):
+        """Getter for self._backpressure."""
+        return self._backpressure
+
+    @property
+    def backpressure_actions(self):
+        """Getter for self._backpressure_actions. Tuple of drop_process, stretch and shed in order of escalation."""
+        return self._backpressure_actions
+
+    @property
+    def backpressure_high(self):
+        """Getter for self._backpressure_high."""
+        return self._backpressure_high
+
+    @property
+    def backpressure_low(self):
+        """Getter for self._backpressure_low."""
+        return self._backpressure_low
+
+    @property
+    def backpressure_max_stretch(self):
+        """Getter for self._backpressure_max_stretch."""
+        return self._backpressure_max_stretch
+
+    @property
+    def backpressure_spool_threshold(self):
+        """Getter for self._backpressure_spool_threshold. Share of the spool budget above which it is lag."""
+        return self._backpressure_spool_threshold
+
+    def update(self, **values):
+        """Override configuration values by name, e.g. for benchmarks and load tests."""
+        for name, value in values.items():
+            if not hasattr(self, '_' + name):
+                raise AttributeError("Unknown collector configuration value: {}".format(name))
+            setattr(self, '_' + name, value)
+        self._validate()
+
+    def _validate(self):
+        """Reject unknown values and combinations of values that the collector does not support."""
+        allowed = {
+            "collect_mode": COLLECT_MODES,
+            "engine": ENGINES,
+            "overrun_policy": OVERRUN_POLICIES,
+            "compression": ("none",) + tuple(COMPRESSORS),
+            "file_durability": DURABILITY_POLICIES,
+            "file_compression": ("none",) + tuple(COMPRESSION_SUFFIXES),
+            "file_format": FILE_FORMATS,
+        }
+        for name, values in allowed.items():
+            value = getattr(self, '_' + name)
+            if value not in values:
+                raise CollectorConfigException("Invalid {} = {}, expected one of: {}".format(
+                    name, value, ", ".join(values)))
+        unknown = [action for action in self._backpressure_actions if action not in BACKPRESSURE_ACTIONS]
+        if unknown:
+            raise CollectorConfigException("Invalid backpressure_actions: {}, expected any of: {}".format(
+                ", ".join(unknown), ", ".join(BACKPRESSURE_ACTIONS)))
+        if not 0.0 <= self._backpressure_spool_threshold <= 1.0:
+            raise CollectorConfigException("Invalid backpressure_spool_threshold = {}, expected 0 to 1".format(
+                self._backpressure_spool_threshold))
+        if self._collect_mode == "stream" and self._engine == "asyncio":
+            raise CollectorConfigException("collect_mode = stream is not supported with engine = asyncio")
+
+    def read_config(self):
+        """Read the configuration from the file."""
+        try:
+            logging.info('Reading collector configuration from file.')
+            if not self._config_parser.has_section(self._config_name):
+                return
+            section = self._config_parser[self._config_name]
+            self._batch_commands = section.getboolean('batch_commands', fallback=self._batch_commands)
+            self._collect_mode = section.get('collect_mode', fallback=self._collect_mode).strip().lower()
+            self._stream_interval_ms = section.getint('stream_interval_ms', fallback=self._stream_interval_ms)
+            self._ssh_pool = section.getboolean('ssh_pool', fallback=self._ssh_pool)
+            self._ssh_pool_idle_timeout = section.getfloat('ssh_pool_idle_timeout',
+                                                           fallback=self._ssh_pool_idle_timeout)
+            self._engine = section.get('engine', fallback=self._engine).strip().lower()
+            self._async_workers = section.getint('async_workers', fallback=self._async_workers)
+            self._inventory_file = section.get('inventory_file', fallback=self._inventory_file).strip()
+            self._start_concurrency = section.getint('start_concurrency', fallback=self._start_concurrency)
+            self._max_concurrent_handshakes = section.getint('max_concurrent_handshakes',
+                                                             fallback=self._max_concurrent_handshakes)
+            self._handshake_rate = section.getfloat('handshake_rate', fallback=self._handshake_rate)
+            self._handshake_burst = section.getint('handshake_burst', fallback=self._handshake_burst)
+            self._reconnect_base_delay = section.getfloat('reconnect_base_delay',
+                                                          fallback=self._reconnect_base_delay)
+            self._reconnect_max_delay = section.getfloat('reconnect_max_delay', fallback=self._reconnect_max_delay)
+            self._reconnect_workers = section.getint('reconnect_workers', fallback=self._reconnect_workers)
+            self._breaker_failure_threshold = section.getint('breaker_failure_threshold',
+                                                             fallback=self._breaker_failure_threshold)
+            self._breaker_reset_timeout = section.getfloat('breaker_reset_timeout',
+                                                           fallback=self._breaker_reset_timeout)
+            self._align_ticks = section.getboolean('align_ticks', fallback=self._align_ticks)
+            self._phase_spread = section.getfloat('phase_spread', fallback=self._phase_spread)
+            self._overrun_policy = section.get('overrun_policy', fallback=self._overrun_policy).strip().lower()
+            self._cpu_interval = section.getfloat('cpu_interval', fallback=self._cpu_interval)
+            self._memory_interval = section.getfloat('memory_interval', fallback=self._memory_interval)
+            self._process_interval = section.getfloat('process_interval', fallback=self._process_interval)
+            self._compression = section.get('compression', fallback=self._compression).strip().lower()
+            self._compression_level = section.getint('compression_level', fallback=self._compression_level)
+            self._process_delta = section.getboolean('process_delta', fallback=self._process_delta)
+            self._process_keyframe_interval = section.getint('process_keyframe_interval',
+                                                             fallback=self._process_keyframe_interval)
+            self._process_cpu_threshold = section.getfloat('process_cpu_threshold',
+                                                           fallback=self._process_cpu_threshold)
+            self._process_memory_threshold = section.getint('process_memory_threshold',
+                                                            fallback=self._process_memory_threshold)
+            self._index_to_elastic = section.getboolean('index_to_elastic', fallback=self._index_to_elastic)
+            self._file_buffer_bytes = section.getint('file_buffer_bytes', fallback=self._file_buffer_bytes)
+            self._file_flush_interval = section.getfloat('file_flush_interval', fallback=self._file_flush_interval)
+            self._file_durability = section.get('file_durability', fallback=self._file_durability).strip().lower()
+            self._file_fsync_every = section.getint('file_fsync_every', fallback=self._file_fsync_every)
+            self._file_rotate_bytes = section.getint('file_rotate_bytes', fallback=self._file_rotate_bytes)
+            self._file_rotate_interval = section.getfloat('file_rotate_interval', fallback=self._file_rotate_interval)
+            self._file_compression = section.get('file_compression', fallback=self._file_compression).strip().lower()
+            self._file_format = section.get('file_format', fallback=self._file_format).strip().lower()
+            self._elastic_spool = section.getboolean('elastic_spool', fallback=self._elastic_spool)
+            self._elastic_spool_directory = section.get('elastic_spool_directory',
+                                                        fallback=self._elastic_spool_directory).strip()
+            self._elastic_spool_max_bytes = section.getint('elastic_spool_max_bytes',
+                                                           fallback=self._elastic_spool_max_bytes)
+            self._elastic_spool_segment_bytes = section.getint('elastic_spool_segment_bytes',
+                                                               fallback=self._elastic_spool_segment_bytes)
+            self._elastic_replay_batch = section.getint('elastic_replay_batch', fallback=self._elastic_replay_batch)
+            self._elastic_replay_interval = section.getfloat('elastic_replay_interval',
+                                                             fallback=self._elastic_replay_interval)
+            self._elastic_pool_size = section.getint('elastic_pool_size', fallback=self._elastic_pool_size)
+            self._elastic_batching = section.getboolean('elastic_batching', fallback=self._elastic_batching)
+            self._elastic_queue_size = section.getint('elastic_queue_size', fallback=self._elastic_queue_size)
+            self._elastic_batch_size = section.getint('elastic_batch_size', fallback=self._elastic_batch_size)
+            self._elastic_batch_bytes = section.getint('elastic_batch_bytes', fallback=self._elastic_batch_bytes)
+            self._elastic_flush_latency = section.getfloat('elastic_flush_latency',
+                                                           fallback=self._elastic_flush_latency)
+            self._elastic_workers = section.getint('elastic_workers', fallback=self._elastic_workers)
+            self._backpressure = section.getboolean('backpressure', fallback=self._backpressure)
+            actions = section.get('backpressure_actions', fallback=None)
+            if actions is not None:
+                self._backpressure_actions = tuple(action.strip().lower() for action in actions.split(",")
+                                                   if action.strip())
+            self._backpressure_high = section.getfloat('backpressure_high', fallback=self._backpressure_high)
+            self._backpressure_low = section.getfloat('backpressure_low', fallback=self._backpressure_low)
+            self._backpressure_max_stretch = section.getint('backpressure_max_stretch',
+                                                            fallback=self._backpressure_max_stretch)
+            self._backpressure_spool_threshold = section.getfloat('backpressure_spool_threshold',
+                                                                  fallback=self._backpressure_spool_threshold)
+        except (ValueError, configparser.Error) as e:
+            raise CollectorConfigException("Cannot parse collector configuration: {}".format(str(e)))
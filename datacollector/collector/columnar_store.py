@@ -0,0 +1,398 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Columnar binary store of the numeric series of a node.
+
+The series of <host>.json are stored in the directory <host>.columns as
+append-only arrays of fixed-size rows in native byte order, one file per
+series:
+
+timestamp.i8        sample timestamps, microseconds since the epoch (UTC)
+cpu_counters.i8     samples x cpus x counter fields
+cpu_utilisation.f8  samples x cpus
+memory.i8           samples x meminfo keys
+
+schema.json names the cpus, counter fields and meminfo keys, fixed by the
+first samples written. Values missing from a sample are stored as -1, or NaN
+for the utilisation. Cpus and meminfo keys that only appear later are not
+stored, and a warning is logged for each of them. Files are read with numpy.memmap, so a field or time
+range is a view into the page cache without copying or parsing. Samples must
+be appended in time order for the range lookups.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from datacollector.collector.memcpu_parser import CPU_FIELDS
+from datacollector.collector.sample import CpuSample, MemorySample, Sample
+
+COLUMNS_SUFFIX = ".columns"
+SCHEMA_FILE = "schema.json"
+SCHEMA_VERSION = 1
+SERIES = {"timestamp": ("timestamp.i8", np.int64), "cpu_counters": ("cpu_counters.i8", np.int64),
+          "cpu_utilisation": ("cpu_utilisation.f8", np.float64), "memory": ("memory.i8", np.int64)}
+MISSING = -1
+SCHEMA_PENDING_SAMPLES = 16
+EPOCH = datetime(1970, 1, 1)
+
+
+class ColumnarStoreException(Exception):
+    """Raised when a columnar store cannot be read or does not match the samples written to it."""
+
+
+def timestamp_to_microseconds(timestamp):
+    """Convert an ISO timestamp (UTC, without zone) to microseconds since the epoch."""
+    return (datetime.fromisoformat(timestamp) - EPOCH) // timedelta(microseconds=1)
+
+
+def microseconds_to_timestamp(value):
+    """Convert microseconds since the epoch to an ISO timestamp."""
+    return (EPOCH + timedelta(microseconds=int(value))).isoformat()
+
+
+def _load_schema(directory):
+    """Return the schema of a store, None if there is none."""
+    path = os.path.join(directory, SCHEMA_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as file:
+            schema = json.load(file)
+    except (OSError, ValueError) as e:
+        raise ColumnarStoreException("Cannot read schema {}: {}".format(path, str(e)))
+    if schema.get("version") != SCHEMA_VERSION:
+        raise ColumnarStoreException("Unsupported columnar store version: {}".format(schema.get("version")))
+    return schema
+
+
+def _row_shapes(schema):
+    """Return a dict of series name -> shape of one row in the layout of a schema."""
+    return {"timestamp": (), "cpu_counters": (len(schema["cpus"]), len(schema["cpu_fields"])),
+            "cpu_utilisation": (len(schema["cpus"]),), "memory": (len(schema["memory"]),)}
+
+
+def _row_bytes(schema):
+    """Return a dict of series name -> bytes of one row in the layout of a schema."""
+    return {name: np.dtype(SERIES[name][1]).itemsize * int(np.prod(shape, dtype=np.int64))
+            for name, shape in _row_shapes(schema).items()}
+
+
+def _complete_rows(directory, schema):
+    """Return the number of rows written completely to every series of a store."""
+    rows = []
+    for name, row_bytes in _row_bytes(schema).items():
+        path = os.path.join(directory, SERIES[name][0])
+        if row_bytes:
+            rows.append(os.path.getsize(path) // row_bytes if os.path.exists(path) else 0)
+    return min(rows) if rows else 0
+
+
+class ColumnarWriter:
+    """Appends the cpu and memory series of samples to a columnar store."""
+
+    def __init__(self, directory, buffer_bytes=65536, flush_interval=1.0, durability="flush", fsync_every=10):
+        """Initialize writer. An existing store is appended to with its schema.
+
+        buffer_bytes, flush_interval, durability and fsync_every are used as by FileSink. Buffered rows are
+        written per series with one system call.
+        """
+        self._directory = directory
+        self._buffer_bytes = buffer_bytes
+        self._flush_interval = flush_interval
+        self._durability = durability
+        self._fsync_every = max(1, fsync_every)
+        self._unsynced = 0
+        self._ignored = set()
+        self._schema = _load_schema(directory)
+        if self._schema is not None:
+            self._truncate_torn_rows()
+        self._files = {}
+        self._pending = []
+        self._buffers = {name: [] for name in SERIES}
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._rows = 0
+
+    @property
+    def directory(self):
+        """Public access for directory."""
+        return self._directory
+
+    @property
+    def rows(self):
+        """Number of samples appended by this writer."""
+        return self._rows
+
+    def append(self, sample):
+        """Append the timestamp, cpu and memory series of a Sample."""
+        with self._lock:
+            if self._closed:
+                raise ColumnarStoreException("Append to closed store {}".format(self._directory))
+            if self._schema is None:
+                self._pending.append(sample)
+                if (sample.cpu is None or sample.memory is None) and len(self._pending) < SCHEMA_PENDING_SAMPLES:
+                    return
+                pending, self._pending = self._pending, []
+                self._create(pending)
+            else:
+                pending = [sample]
+            for pending_sample in pending:
+                self._buffer_row(pending_sample)
+            if (self._durability != "none" or self._buffered >= self._buffer_bytes
+                    or time.monotonic() - self._last_flush >= self._flush_interval):
+                self._flush()
+            if self._durability == "fsync" and self._unsynced >= self._fsync_every:
+                self._fsync()
+
+    def flush(self):
+        """Write buffered rows to the files."""
+        with self._lock:
+            if not self._closed:
+                self._flush()
+
+    def close(self):
+        """Write buffered rows, sync them to disk unless the policy is none, and close the files."""
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                if self._pending:
+                    pending, self._pending = self._pending, []
+                    self._create(pending)
+                    for sample in pending:
+                        self._buffer_row(sample)
+                self._flush()
+                if self._durability != "none":
+                    self._fsync()
+            finally:
+                self._closed = True
+                for file in self._files.values():
+                    file.close()
+                self._files = {}
+
+    def _buffer_row(self, sample):
+        """Add the row of a sample to the buffers. Hold the lock."""
+        for name, values in self._row(sample).items():
+            data = values.tobytes()
+            self._buffers[name].append(data)
+            self._buffered += len(data)
+        self._rows += 1
+        self._unsynced += 1
+
+    def _truncate_torn_rows(self):
+        """Cut every series to the rows written completely to all of them, e.g. after a crash between the writes.
+
+        Otherwise rows appended later would be misaligned between the series.
+        """
+        rows = _complete_rows(self._directory, self._schema)
+        for name, row_bytes in _row_bytes(self._schema).items():
+            path = os.path.join(self._directory, SERIES[name][0])
+            if os.path.exists(path) and os.path.getsize(path) > rows * row_bytes:
+                logging.getLogger('__collector__').warning("Truncating %s to %s complete rows.", path, rows)
+                os.truncate(path, rows * row_bytes)
+
+    def _create(self, samples):
+        """Create the store with the cpus and meminfo keys of the last of the first samples. Hold the lock.
+
+        Samples missing cpu or memory data are held back until a sample has both, or SCHEMA_PENDING_SAMPLES
+        samples have been held, so that a first partial sample does not leave a series out of the store.
+        """
+        cpu = next((sample.cpu for sample in reversed(samples) if sample.cpu is not None), None)
+        memory = next((sample.memory for sample in reversed(samples) if sample.memory is not None), None)
+        self._schema = {"version": SCHEMA_VERSION,
+                        "cpus": list(cpu.names) if cpu is not None else [],
+                        "cpu_fields": list(CPU_FIELDS[:cpu.counters.shape[1]] if cpu is not None else CPU_FIELDS),
+                        "memory": list(memory.names) if memory is not None else []}
+        os.makedirs(self._directory, exist_ok=True)
+        temporary = os.path.join(self._directory, SCHEMA_FILE + ".tmp")
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(self._schema, file)
+        os.replace(temporary, os.path.join(self._directory, SCHEMA_FILE))
+
+    def _row(self, sample):
+        """Return the arrays of one sample in the layout of the schema. Hold the lock."""
+        cpus = self._schema["cpus"]
+        fields = len(self._schema["cpu_fields"])
+        counters = np.full((len(cpus), fields), MISSING, dtype=np.int64)
+        utilisation = np.full(len(cpus), np.nan)
+        if sample.cpu is not None:
+            if list(sample.cpu.names) == cpus and sample.cpu.counters.shape[1] >= fields:
+                counters[:] = sample.cpu.counters[:, :fields]
+                if sample.cpu.utilisation is not None:
+                    utilisation[:] = sample.cpu.utilisation
+            else:
+                self._warn_ignored("cpu", set(sample.cpu.names) - set(cpus))
+                indexes = {name: index for index, name in enumerate(sample.cpu.names)}
+                width = min(fields, sample.cpu.counters.shape[1])
+                for column, name in enumerate(cpus):
+                    index = indexes.get(name)
+                    if index is not None:
+                        counters[column, :width] = sample.cpu.counters[index, :width]
+                        if sample.cpu.utilisation is not None:
+                            utilisation[column] = sample.cpu.utilisation[index]
+        memory = np.full(len(self._schema["memory"]), MISSING, dtype=np.int64)
+        if sample.memory is not None:
+            if list(sample.memory.names) == self._schema["memory"]:
+                memory[:] = sample.memory.values
+            else:
+                self._warn_ignored("meminfo key", set(sample.memory.names) - set(self._schema["memory"]))
+                values = dict(zip(sample.memory.names, sample.memory.values))
+                for column, name in enumerate(self._schema["memory"]):
+                    memory[column] = values.get(name, MISSING)
+        return {"timestamp": np.array([timestamp_to_microseconds(sample.timestamp)], dtype=np.int64),
+                "cpu_counters": counters, "cpu_utilisation": utilisation, "memory": memory}
+
+    def _warn_ignored(self, kind, names):
+        """Log once for every cpu or meminfo key left out because it is not in the schema. Hold the lock."""
+        for name in sorted(names - self._ignored):
+            logging.getLogger('__collector__').warning("%s %s is not in the schema of %s and is not stored.",
+                                                       kind.capitalize(), name, self._directory)
+        self._ignored |= names
+
+    def _fsync(self):
+        """Sync the files of every series to disk. Hold the lock."""
+        self._unsynced = 0
+        try:
+            for file in self._files.values():
+                os.fsync(file.fileno())
+        except OSError as e:
+            logging.getLogger('__collector__').warning("Failed to sync %s: %s", self._directory, str(e))
+
+    def _flush(self):
+        """Write the buffered rows of every series. Hold the lock."""
+        self._last_flush = time.monotonic()
+        if not self._buffered:
+            return
+        for name, (file_name, _) in SERIES.items():
+            file = self._files.get(name)
+            if file is None:
+                file = self._files[name] = open(os.path.join(self._directory, file_name), 'ab', buffering=0)
+            view = memoryview(b"".join(self._buffers[name]))
+            while view:
+                view = view[file.write(view):]
+            self._buffers[name] = []
+        self._buffered = 0
+
+
+class ColumnarReader:
+    """Memory-mapped read access to a columnar store."""
+
+    def __init__(self, directory):
+        """Map the series of a store. Rows of a sample that was not completely written are left out."""
+        self._directory = directory
+        self._schema = _load_schema(directory)
+        if self._schema is None:
+            raise ColumnarStoreException("No columnar store in {}".format(directory))
+        self._cpu_index = {name: index for index, name in enumerate(self._schema["cpus"])}
+        self._field_index = {name: index for index, name in enumerate(self._schema["cpu_fields"])}
+        self._memory_index = {name: index for index, name in enumerate(self._schema["memory"])}
+        shapes = _row_shapes(self._schema)
+        self._rows = _complete_rows(directory, self._schema)
+        self._series = {}
+        for name, (file_name, dtype) in SERIES.items():
+            shape = (self._rows,) + shapes[name]
+            if self._rows == 0 or 0 in shape:
+                self._series[name] = np.empty(shape, dtype=dtype)
+            else:
+                self._series[name] = np.memmap(os.path.join(directory, file_name), dtype=dtype, mode='r',
+                                               shape=shape)
+
+    def __len__(self):
+        return self._rows
+
+    @property
+    def cpus(self):
+        """Names of the cpus in the store."""
+        return list(self._schema["cpus"])
+
+    @property
+    def cpu_fields(self):
+        """Names of the cpu counter fields in the store."""
+        return list(self._schema["cpu_fields"])
+
+    @property
+    def memory_keys(self):
+        """Names of the meminfo keys in the store."""
+        return list(self._schema["memory"])
+
+    @property
+    def timestamps(self):
+        """Sample timestamps as microseconds since the epoch."""
+        return self._series["timestamp"]
+
+    def range(self, start=None, end=None):
+        """Return the slice of the samples from start to end inclusive, given as ISO timestamps."""
+        timestamps = self._series["timestamp"]
+        first = 0 if start is None else int(np.searchsorted(timestamps, timestamp_to_microseconds(start), "left"))
+        last = self._rows if end is None else int(np.searchsorted(timestamps, timestamp_to_microseconds(end),
+                                                                  "right"))
+        return slice(first, max(first, last))
+
+    def series(self, name, start=None, end=None):
+        """Return a series as a view of the mapped file.
+
+        name is timestamp, memory.<key>, cpu.<cpu>.<field> or cpu.<cpu>.utilisation, e.g. cpu.cpu0.user.
+        A cpu or field may be left out to get all of them: cpu.user is samples x cpus.
+        """
+        rows = self.range(start, end)
+        parts = name.split(".")
+        try:
+            if name == "timestamp":
+                return self._series["timestamp"][rows]
+            if parts[0] == "memory" and len(parts) == 2:
+                return self._series["memory"][rows, self._memory_index[parts[1]]]
+            if parts[0] == "cpu" and len(parts) in (2, 3):
+                cpu = self._cpu_index[parts[1]] if len(parts) == 3 else slice(None)
+                if parts[-1] == "utilisation":
+                    return self._series["cpu_utilisation"][rows, cpu]
+                return self._series["cpu_counters"][rows, cpu, self._field_index[parts[-1]]]
+        except KeyError as e:
+            raise ColumnarStoreException("Unknown series {}: {} not in store".format(name, str(e)))
+        raise ColumnarStoreException("Unknown series {}".format(name))
+
+
+def _sample_from_row(row, cpu_fields):
+    """Build a Sample of the cpu and memory series of a row of a JSON data file."""
+    sample = Sample(row["timestamp"], row.get("run_id"))
+    names = [key for key, value in row.items() if key.startswith("cpu") and isinstance(value, dict)]
+    if names:
+        counters = np.array([[int(row[name].get(field, MISSING)) for field in cpu_fields] for name in names],
+                            dtype=np.int64)
+        utilisation = np.array([row[name].get("utilisation", np.nan) for name in names], dtype=np.float64)
+        sample.cpu = CpuSample(tuple(names), counters, utilisation)
+    if isinstance(row.get("memory"), dict):
+        memory = row["memory"]
+        sample.memory = MemorySample(tuple(memory), array("q", (int(value) for value in memory.values())))
+    return sample
+
+
+def convert_json(lines, directory):
+    """Append the cpu and memory series of JSON data file lines to the columnar store in directory.
+
+    Return the number of samples converted. Lines without cpu or memory data are skipped.
+    """
+    writer = ColumnarWriter(directory, durability="none")
+    converted = 0
+    try:
+        for line in lines:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            sample = _sample_from_row(row, CPU_FIELDS)
+            if sample.cpu is None and sample.memory is None:
+                continue
+            writer.append(sample)
+            converted += 1
+    finally:
+        writer.close()
+    return converted
@@ -27,7 +27,7 @@ class ElasticConfig(IConfig):
         self._user = None
         self._password = None
         self._memcpu_index = None
-        self._read_config()
+        self.read_config()
 
     @property
     def port(self):
@@ -54,7 +54,7 @@ class ElasticConfig(IConfig):
         """Getter for self._memcpu_index."""
         return self._memcpu_index
 
-    def _read_config(self):
+    def read_config(self):
         """Read the configuration from the file."""
         try:
             logging.info('Reading configuration from file.')
@@ -3,12 +3,26 @@
 # Licensed under the Apache license, version 2.0
 # SPDX-License-Identifier: Apache-2.0
 
-"""Module for handling indexing of data to Elasticsearch via an Elasticsearch client."""
+"""Module for handling indexing of data to Elasticsearch via an Elasticsearch client.
+
+Documents that cannot be delivered are kept in an ElasticSpool and replayed
+when the cluster is reachable again. Each document gets an _id derived from
+its index, run ID and timestamp, so that a replayed document replaces an
+earlier copy instead of being indexed twice.
+"""
+import atexit
+import hashlib
 import logging
+import os
+import pathlib
+import threading
+
 from elasticsearch import Elasticsearch
 from elasticsearch import helpers
 
+from datacollector.collector.batching_indexer import BatchingIndexer
 from datacollector.collector.elastic_config_parser import ElasticConfig
+from datacollector.collector.elastic_spool import ElasticSpool
 from datacollector.collector.idatabase_client import IDatabaseClient
 
 
@@ -20,12 +34,35 @@ class ReadConfigException(Exception):
     """Raised when reading a config file fails."""
 
 
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+def document_id(index, doc):
+    """Return the deterministic _id of a document: the sha1 of its index, run ID and timestamp."""
+    key = "{}/{}/{}".format(index, doc.get("run_id"), doc.get("timestamp"))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
 class ElasticIndexer(IDatabaseClient):
-    """Class for handling data uploading from collectors to elasticsearch."""
+    """Class for handling data uploading from collectors to elasticsearch.
+
+    One indexer is shared by the records of all nodes and main collectors of the process, see shared().
+    The Elasticsearch client is thread-safe
+    and keeps a pool of elastic_pool_size connections. At most as many requests are sent at once, so that
+    concurrent node collectors wait for a pooled connection instead of opening and discarding extra ones.
+    """
+
+    _shared = None
+    _shared_refs = 0
+    _exit_registered = False
+    _shared_lock = threading.Lock()
 
-    def __init__(self):
+    def __init__(self, collector_config=None):
         """Initialize connection parameters. Create and read using ElasticConfig.
-        Initialize an Elasticsearch-client from elasticsearch-package."""
+        Initialize an Elasticsearch-client from elasticsearch-package.
+
+        With elastic_spool enabled in the collector_config, undelivered documents are spooled to disk.
+        """
         super().__init__()
         self._host = None
         self._port = None
@@ -36,8 +73,102 @@ class ElasticIndexer(IDatabaseClient):
         self._elastic_config = ElasticConfig('elastic')
         self.read_config_parameters()
 
+        pool_size = collector_config.elastic_pool_size if collector_config is not None else 10
         self._es_client = Elasticsearch([{'host': self._host, 'port': self._port}],
-                                        http_auth=(self._user, self._password))
+                                        http_auth=(self._user, self._password), maxsize=pool_size)
+        self._requests = threading.BoundedSemaphore(pool_size)
+        self._spool = None
+        self._spool_threshold = 1.0
+        if collector_config is not None and collector_config.elastic_spool:
+            directory = collector_config.elastic_spool_directory or os.path.join(
+                pathlib.Path(__file__).parent.parent.absolute().__str__(), 'spool')
+            self._spool = ElasticSpool(directory, collector_config.elastic_spool_max_bytes,
+                                       collector_config.elastic_spool_segment_bytes,
+                                       collector_config.elastic_replay_batch,
+                                       collector_config.elastic_replay_interval)
+            self._spool.start_replay(self._replay)
+            self._spool_threshold = collector_config.backpressure_spool_threshold
+        self._batcher = None
+        if collector_config is not None and collector_config.elastic_batching:
+            self._batcher = BatchingIndexer(self.index_actions, self._spool_or_drop,
+                                            collector_config.elastic_queue_size, collector_config.elastic_batch_size,
+                                            collector_config.elastic_batch_bytes,
+                                            collector_config.elastic_flush_latency, collector_config.elastic_workers)
+
+    @classmethod
+    def shared(cls, collector_config=None):
+        """Return the process-wide indexer and add a reference to it. Pair each call with release_shared().
+
+        The indexer is created with the given config on the first call after the last reference was released.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(collector_config)
+                if not cls._exit_registered:
+                    atexit.register(cls._close_at_exit)
+                    cls._exit_registered = True
+            cls._shared_refs += 1
+            return cls._shared
+
+    @classmethod
+    def release_shared(cls):
+        """Remove a reference to the process-wide indexer. The last one closes it."""
+        with cls._shared_lock:
+            cls._shared_refs = max(cls._shared_refs - 1, 0)
+            if cls._shared_refs or cls._shared is None:
+                return
+            indexer, cls._shared = cls._shared, None
+        indexer.close()
+
+    @classmethod
+    def _close_at_exit(cls):
+        """Close the process-wide indexer at process exit, whatever references are left."""
+        with cls._shared_lock:
+            indexer, cls._shared = cls._shared, None
+            cls._shared_refs = 0
+        if indexer is not None:
+            indexer.close()
+
+    def lag(self):
+        """Return the highest lag of the batching queue and the spool, 0 to 1."""
+        return max(self._batcher.lag() if self._batcher is not None else 0.0, self._spool_lag())
+
+    def _spool_lag(self):
+        """Return the lag of the spool: 0 up to backpressure_spool_threshold of its disk budget, 1 when it is full.
+
+        Below the threshold the spool holds undelivered documents safely, which is no reason to collect less.
+        """
+        if self._spool is None or self._spool_threshold >= 1.0:
+            return 0.0
+        return max(0.0, self._spool.lag() - self._spool_threshold) / (1.0 - self._spool_threshold)
+
+    def metrics(self):
+        """Return a dict of the queue metrics of the batcher and the counters of the spool, where enabled."""
+        metrics = {}
+        if self._batcher is not None:
+            metrics.update(self._batcher.metrics())
+        if self._spool is not None:
+            metrics.update({"spool_" + name: value for name, value in self._spool.counters().items()})
+            metrics["spool_pending"] = self._spool.pending
+        return metrics
+
+    def close(self):
+        """Send queued documents, then close the spool and the connections of the client."""
+        if self._batcher is not None:
+            self._batcher.close()
+        if self._spool is not None:
+            self._spool.close()
+        self._es_client.transport.close()
+
+    @property
+    def spool(self):
+        """Public access for spool. None if spooling is disabled."""
+        return self._spool
+
+    @property
+    def batcher(self):
+        """Public access for batcher. None if documents are sent from the calling thread."""
+        return self._batcher
 
     def read_config_parameters(self):
         """Read the config variables from the ElasticConfig-object."""
@@ -51,24 +182,77 @@ class ElasticIndexer(IDatabaseClient):
             logging.exception("Failed to read Elastic configuration: ", str(e))
             raise
 
+    def _send(self, actions, timeout, max_retries):
+        """Send bulk actions. Return the actions that failed with a retryable status.
+
+        Actions refused for other reasons, e.g. a mapping error, would fail again and are logged and dropped.
+        Raises if the request itself fails.
+        """
+        with self._requests:
+            _success, errors = helpers.bulk(self._es_client, actions, request_timeout=timeout,
+                                            max_retries=max_retries, raise_on_error=False)
+        if not errors:
+            return []
+        failed = {}
+        for error in errors:
+            result = next(iter(error.values()))
+            failed[result.get("_id")] = result.get("status")
+        retry = [action for action in actions if failed.get(action["_id"]) in RETRYABLE_STATUSES]
+        rejected = len(failed) - len(retry)
+        if rejected:
+            logging.getLogger('__collector__').error("Elasticsearch rejected %s documents: %s", rejected,
+                                                     str(errors[0])[:500])
+            if self._spool is not None:
+                self._spool.count_rejected(rejected)
+        return retry
+
     def _bulk(self, index, docs, timeout, max_retries):
         """Bulk index given data to given Elasticsearch index."""
+        self.index_actions([self._action(index, doc) for doc in docs], timeout, max_retries)
+
+    @staticmethod
+    def _action(index, doc):
+        """Return the bulk action indexing a document with its deterministic _id."""
+        return {"_index": index, "_id": document_id(index, doc), "_source": doc}
+
+    def index_actions(self, actions, timeout=60, max_retries=5):
+        """Send bulk actions. Actions that cannot be delivered are spooled.
+
+        While the spool holds documents, new ones are appended behind them without a request, so that the
+        cluster is not waited for on every sample.
+        """
+        if self._spool is not None and self._spool.pending:
+            self._spool.append(actions)
+            return
         try:
             logging.getLogger('__collector__').info("Indexing to Elasticsearch.")
-            _success, _errors = helpers.bulk(
-                self._es_client,
-                docs,
-                index=index,
-                request_timeout=timeout,
-                max_retries=max_retries,
-            )
+            retry = self._send(actions, timeout, max_retries)
         except Exception as e:
             logging.getLogger('__collector__').exception("Failed to index data in _bulk(): %s", str(e))
+            retry = actions
+        if retry:
+            self._spool_or_drop(retry)
+
+    def _spool_or_drop(self, actions):
+        """Append actions that cannot be sent now to the spool, or log them as lost if spooling is disabled."""
+        if self._spool is not None:
+            self._spool.append(actions)
+        else:
+            logging.getLogger('__collector__').warning("Lost %s documents, spooling is disabled.", len(actions))
+
+    def _replay(self, actions):
+        """Send a batch of spooled actions. Raise if the batch must be retried."""
+        retry = self._send(actions, timeout=60, max_retries=0)
+        if retry:
+            raise ElasticException("{} documents of the replayed batch failed".format(len(retry)))
 
     def upload_data(self, data, index):
         """Choose an appropriate method depending on the passed data and index.
         Call bulk-function to index data to Elasticsearch.
         """
         if index == "memcpu_data":
+            if self._batcher is not None:
+                self._batcher.put(self._action(self._memcpu_index, data))
+                return
             data_list = [data]
             self._bulk(self._memcpu_index, data_list, timeout=60, max_retries=5)
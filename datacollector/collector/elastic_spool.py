@@ -0,0 +1,265 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Disk-backed spool of Elasticsearch documents that could not be delivered.
+
+The spool is an append-only queue of segment files spool.<sequence>.jsonl,
+each line a bulk action with the target _index, a deterministic _id and the
+_source document. A replay thread sends the oldest segment in batches once
+the cluster accepts them again and removes it when it has been delivered.
+As the documents have fixed ids, a batch sent twice, e.g. after a restart in
+the middle of a segment, overwrites the same documents instead of adding
+duplicates.
+
+The size of the spool is bounded: when it exceeds its budget, the oldest
+segments are evicted and their documents are counted as lost.
+"""
+import json
+import logging
+import os
+import re
+import threading
+
+from datacollector.collector.file_sink import FileSink
+from datacollector.collector.reconnect_policy import BackoffPolicy
+
+SEGMENT_PATTERN = re.compile(r"^spool\.(\d{6})\.jsonl$")
+
+
+class ElasticSpoolException(Exception):
+    """Raised when the spool directory cannot be used."""
+
+
+def _segment_name(sequence):
+    """Return the file name of a spool segment."""
+    return "spool.{:06d}.jsonl".format(sequence)
+
+
+def _action_line(action):
+    """Serialize a bulk action as one line. A _source already serialized to a JSON string is embedded as is."""
+    source = action.get("_source")
+    if not isinstance(source, str):
+        return json.dumps(action)
+    metadata = json.dumps({key: value for key, value in action.items() if key != "_source"})
+    return "{}{}\"_source\": {}}}".format(metadata[:-1], ", " if len(metadata) > 2 else "", source)
+
+
+class ElasticSpool:
+    """Segmented on-disk queue of bulk actions with a replay thread."""
+
+    def __init__(self, directory, max_bytes=1024 ** 3, segment_bytes=16 * 1024 ** 2, replay_batch=5000,
+                 replay_interval=60.0):
+        """Initialize spool. Segments left by an earlier run are queued for replay.
+
+        max_bytes: disk budget of all segments, the oldest are evicted above it.
+        segment_bytes: size that closes the active segment.
+        replay_batch: actions sent per bulk request on replay.
+        replay_interval: maximum seconds between replay attempts while the cluster is unreachable.
+        """
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._segment_bytes = max(1, min(segment_bytes, max_bytes))
+        self._replay_batch = max(1, replay_batch)
+        self._backoff = BackoffPolicy(base=1.0, cap=replay_interval)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._segments = {}
+        self._active = None
+        self._sink = None
+        self._thread = None
+        self._deliver = None
+        self._closed = False
+        self._spooled = 0
+        self._replayed = 0
+        self._evicted = 0
+        self._rejected = 0
+        try:
+            os.makedirs(directory, exist_ok=True)
+            for name in sorted(os.listdir(directory)):
+                match = SEGMENT_PATTERN.match(name)
+                if match:
+                    path = os.path.join(directory, name)
+                    with open(path, "rb") as file:
+                        documents = sum(1 for _ in file)
+                    self._segments[int(match.group(1))] = [os.path.getsize(path), documents]
+        except OSError as e:
+            raise ElasticSpoolException("Cannot use spool directory {}: {}".format(directory, str(e)))
+        self._next_sequence = max(self._segments, default=0) + 1
+
+    @property
+    def directory(self):
+        """Public access for directory."""
+        return self._directory
+
+    @property
+    def pending(self):
+        """Number of spooled documents waiting for replay."""
+        with self._lock:
+            return sum(documents for _, documents in self._segments.values())
+
+    @property
+    def pending_bytes(self):
+        """Size of the spool segments on disk."""
+        with self._lock:
+            return sum(size for size, _ in self._segments.values())
+
+    def lag(self):
+        """Return the share of the disk budget used by the spool, 0 to 1."""
+        return min(1.0, self.pending_bytes / self._max_bytes) if self._max_bytes > 0 else 0.0
+
+    def counters(self):
+        """Return a dict of the documents spooled, replayed, evicted and rejected on replay."""
+        with self._lock:
+            return {"spooled": self._spooled, "replayed": self._replayed, "evicted": self._evicted,
+                    "rejected": self._rejected}
+
+    def append(self, actions):
+        """Add bulk actions to the end of the spool, evicting the oldest segments above the disk budget."""
+        with self._lock:
+            if self._closed:
+                raise ElasticSpoolException("Append to closed spool {}".format(self._directory))
+            for action in actions:
+                if self._active is None:
+                    self._open_segment()
+                line = _action_line(action)
+                self._sink.write_line(line)
+                segment = self._segments[self._active]
+                segment[0] += len(line.encode("utf-8")) + 1
+                segment[1] += 1
+                self._spooled += 1
+                if segment[0] >= self._segment_bytes:
+                    self._close_segment()
+            self._evict()
+            self._wakeup.notify_all()
+
+    def start_replay(self, deliver):
+        """Start the replay thread once. deliver(actions) sends a batch and raises if it must be retried."""
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._deliver = deliver
+                self._thread = threading.Thread(target=self._replay, name="ElasticSpoolReplay", daemon=True)
+                self._thread.start()
+
+    def count_rejected(self, count):
+        """Count documents the cluster refused on replay and that are not retried."""
+        with self._lock:
+            self._rejected += count
+
+    def close(self):
+        """Stop the replay thread and close the active segment. Spooled documents stay for the next run."""
+        with self._lock:
+            self._closed = True
+            if self._active is not None:
+                self._close_segment()
+            self._wakeup.notify_all()
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=10)
+
+    def _open_segment(self):
+        """Start a new active segment. Hold the lock."""
+        self._active = self._next_sequence
+        self._next_sequence += 1
+        self._segments[self._active] = [0, 0]
+        self._sink = FileSink(os.path.join(self._directory, _segment_name(self._active)), durability="flush")
+
+    def _close_segment(self):
+        """Close the active segment, leaving it for replay. Hold the lock."""
+        self._sink.close()
+        self._sink = None
+        self._active = None
+
+    def _evict(self):
+        """Remove the oldest segments while the spool exceeds its budget. Hold the lock."""
+        while self._segments and sum(size for size, _ in self._segments.values()) > self._max_bytes:
+            oldest = min(self._segments)
+            if oldest == self._active:
+                self._close_segment()
+            size, documents = self._segments.pop(oldest)
+            self._remove(oldest)
+            self._evicted += documents
+            logging.getLogger('__collector__').warning(
+                "Elasticsearch spool over %s bytes, evicted %s documents.", self._max_bytes, documents)
+
+    def _remove(self, sequence):
+        """Delete a segment file. Hold the lock."""
+        try:
+            os.remove(os.path.join(self._directory, _segment_name(sequence)))
+        except FileNotFoundError:
+            pass
+
+    def _next_segment(self):
+        """Wait for a segment to replay and return its sequence, None when closed. Hold the lock."""
+        while not self._closed:
+            if self._segments:
+                oldest = min(self._segments)
+                if oldest == self._active:
+                    self._close_segment()
+                return oldest
+            self._wakeup.wait()
+        return None
+
+    def _replay(self):
+        """Send spooled segments in order, oldest first, until the spool is closed."""
+        attempt = 0
+        offset = 0
+        current = None
+        while True:
+            with self._lock:
+                sequence = self._next_segment()
+                if sequence is None:
+                    return
+            if sequence != current:
+                current, offset = sequence, 0
+            try:
+                batch, offset_after = self._read_batch(sequence, offset)
+                if batch:
+                    self._deliver(batch)
+            except Exception as e:
+                attempt += 1
+                delay = self._backoff.delay(attempt)
+                logging.getLogger('__collector__').info("Replay of Elasticsearch spool failed, retry in %.1f s: %s",
+                                                        delay, str(e))
+                # Only close() ends the backoff early, new documents must not trigger a retry.
+                self._stop.wait(delay)
+                continue
+            attempt = 0
+            offset = offset_after
+            with self._lock:
+                self._replayed += len(batch)
+                segment = self._segments.get(sequence)
+                if segment is not None:
+                    segment[1] = max(0, segment[1] - len(batch))
+                if not batch and segment is not None and sequence != self._active:
+                    self._segments.pop(sequence)
+                    self._remove(sequence)
+
+    def _read_batch(self, sequence, offset):
+        """Read up to replay_batch actions of a segment from a byte offset. Return them and the offset after them.
+
+        A segment evicted while it was replayed reads as empty. Unreadable lines are counted as rejected.
+        """
+        batch = []
+        corrupt = 0
+        try:
+            with open(os.path.join(self._directory, _segment_name(sequence)), "rb") as file:
+                file.seek(offset)
+                while len(batch) < self._replay_batch:
+                    line = file.readline()
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+                    try:
+                        batch.append(json.loads(line))
+                    except ValueError:
+                        corrupt += 1
+        except FileNotFoundError:
+            return [], offset
+        if corrupt:
+            self.count_rejected(corrupt)
+            logging.getLogger('__collector__').warning("Skipped %s unreadable lines of spool segment %s.", corrupt,
+                                                       _segment_name(sequence))
+        return batch, offset
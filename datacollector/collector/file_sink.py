@@ -0,0 +1,318 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Buffered append-only file sink for the samples of a node.
+
+One file handle is kept open for the whole collection. Serialized samples
+are buffered and written to the file when the buffer exceeds a byte count
+or a time since the last write has passed. The durability policy decides
+how far each sample is pushed after it is buffered:
+
+none: samples stay in the buffer until it is written by size or time
+flush: every sample is written to the operating system at once
+fsync: like flush, and the file is synced to disk every fsync_every samples
+
+RotatingFileSink also starts a new segment when the active one reaches a
+size or age, see segments.py.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from datacollector.collector.segments import (MANIFEST_SUFFIX, SegmentCompressor, SegmentException,
+                                              SegmentManifest, segment_name)
+
+DURABILITY_POLICIES = ("none", "flush", "fsync")
+
+
+class FileSinkException(Exception):
+    """Raised when writing to a closed sink or with an unknown durability policy."""
+
+
+class FileSink:
+    """Keeps one open file per node and writes samples as JSON lines."""
+
+    def __init__(self, path, buffer_bytes=65536, flush_interval=1.0, durability="flush", fsync_every=10):
+        """Initialize sink. The file is opened for appending on the first write.
+
+        buffer_bytes: buffered bytes that trigger a write.
+        flush_interval: seconds after which buffered samples are written, checked when a sample is added.
+        durability: none, flush or fsync.
+        fsync_every: samples between syncs to disk with the fsync policy.
+        """
+        if durability not in DURABILITY_POLICIES:
+            raise FileSinkException("Unknown durability policy: {}".format(durability))
+        self._path = path
+        self._buffer_bytes = buffer_bytes
+        self._flush_interval = flush_interval
+        self._durability = durability
+        self._fsync_every = max(1, fsync_every)
+        self._file = None
+        self._buffer = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self._unsynced = 0
+        self._closed = False
+        self._lock = threading.RLock()
+        self._bytes_written = 0
+        self._flushes = 0
+        self._fsyncs = 0
+        self._busy = 0.0
+        self._lag_checked = time.monotonic()
+        self._write_started = None
+
+    @property
+    def path(self):
+        """Public access for path."""
+        return self._path
+
+    @property
+    def closed(self):
+        """Check if the sink has been closed."""
+        return self._closed
+
+    @property
+    def bytes_written(self):
+        """Bytes written to the file."""
+        return self._bytes_written
+
+    @property
+    def flushes(self):
+        """Number of writes of the buffer to the file."""
+        return self._flushes
+
+    @property
+    def fsyncs(self):
+        """Number of syncs of the file to disk."""
+        return self._fsyncs
+
+    def write(self, row):
+        """Serialize a sample dict as one JSON line and add it to the buffer."""
+        self.write_line(json.dumps(row))
+
+    def write_line(self, line):
+        """Add a line of text to the buffer, writing and syncing it as the policy requires. Return its size in bytes."""
+        data = (line + "\n").encode("utf-8")
+        with self._lock:
+            if self._closed:
+                raise FileSinkException("Write to closed sink {}".format(self._path))
+            self._buffer.append(data)
+            self._buffered += len(data)
+            self._unsynced += 1
+            if (self._durability != "none" or self._buffered >= self._buffer_bytes
+                    or time.monotonic() - self._last_flush >= self._flush_interval):
+                self._flush()
+            if self._durability == "fsync" and self._unsynced >= self._fsync_every:
+                self._fsync()
+        return len(data)
+
+    def lag(self):
+        """Return the share of the time spent writing and syncing since the previous call, 0 to 1.
+
+        A write still in progress is included. The lock is not taken, so a blocked write cannot block the caller.
+        """
+        now = time.monotonic()
+        busy, self._busy = self._busy, 0.0
+        started = self._write_started
+        if started is not None:
+            busy += now - max(started, self._lag_checked)
+        elapsed, self._lag_checked = now - self._lag_checked, now
+        return min(1.0, busy / elapsed) if elapsed > 0 else 0.0
+
+    def rotate_if_due(self):
+        """Start a new segment if the current one is due for rotation. Return True if rotated.
+
+        A plain FileSink never rotates.
+        """
+        return False
+
+    def flush(self):
+        """Write buffered samples to the file."""
+        with self._lock:
+            if not self._closed:
+                self._flush()
+
+    def close(self):
+        """Write buffered samples, sync them to disk unless the policy is none, and close the file."""
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                self._flush()
+                if self._durability != "none" and self._unsynced:
+                    self._fsync()
+            finally:
+                self._closed = True
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+
+    def _flush(self):
+        """Write the buffer to the file with one system call. Hold the lock."""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        if self._file is None:
+            self._file = open(self._path, 'ab', buffering=0)
+        data = b"".join(self._buffer)
+        view = memoryview(data)
+        self._write_started = time.monotonic()
+        try:
+            while view:
+                view = view[self._file.write(view):]
+        finally:
+            self._busy += time.monotonic() - self._write_started
+            self._write_started = None
+        self._buffer = []
+        self._buffered = 0
+        self._bytes_written += len(data)
+        self._flushes += 1
+
+    def _fsync(self):
+        """Sync the file to disk. Hold the lock."""
+        self._unsynced = 0
+        if self._file is None:
+            return
+        self._write_started = time.monotonic()
+        try:
+            os.fsync(self._file.fileno())
+            self._fsyncs += 1
+        except OSError as e:
+            logging.getLogger('__collector__').warning("Failed to sync %s: %s", self._path, str(e))
+        finally:
+            self._busy += time.monotonic() - self._write_started
+            self._write_started = None
+
+
+class RotatingFileSink(FileSink):
+    """FileSink starting a new segment by size or age and compressing the rotated segments in the background."""
+
+    def __init__(self, path, buffer_bytes=65536, flush_interval=1.0, durability="flush", fsync_every=10,
+                 rotate_bytes=0, rotate_interval=0.0, compression="none", compressor=None, on_rotate=None):
+        """Initialize sink writing to path, which must end with .json.
+
+        rotate_bytes: segment size that starts a new segment, 0 for no limit.
+        rotate_interval: segment age in seconds that starts a new segment, 0 for no limit.
+        compression: none, gzip or lzma for the rotated segments.
+        compressor: SegmentCompressor to use, the shared one by default.
+        on_rotate(): called after every rotation, before the first line of the new segment is written.
+        """
+        super().__init__(path, buffer_bytes, flush_interval, durability, fsync_every)
+        directory, file_name = os.path.split(path)
+        self._name = file_name[:-len(".json")]
+        self._rotate_bytes = rotate_bytes
+        self._rotate_interval = rotate_interval
+        self._compression = compression
+        self._compressor = compressor if compressor is not None else SegmentCompressor.shared()
+        self._manifest = SegmentManifest.open(directory, self._name)
+        self._segment_bytes = os.path.getsize(path) if os.path.exists(path) else 0
+        self._segment_samples = 0
+        self._segment_start = None
+        self._segment_end = None
+        self._segment_opened = time.monotonic()
+        self._rotations = 0
+        self._on_rotate = on_rotate
+        self._rotation_checked = False
+        self._resume_compression()
+
+    @property
+    def manifest(self):
+        """Public access for manifest."""
+        return self._manifest
+
+    @property
+    def rotations(self):
+        """Number of segments rotated by this sink."""
+        return self._rotations
+
+    def write(self, row):
+        """Serialize a sample dict as one JSON line, rotating the segment first if it is due.
+
+        If rotate_if_due() was called since the previous write, e.g. before encoding the row against the segment,
+        its decision stands and the row goes to the segment it left active.
+        """
+        line = json.dumps(row)
+        with self._lock:
+            if not self._rotation_checked:
+                self.rotate_if_due()
+            self._rotation_checked = False
+            self._segment_bytes += self.write_line(line)
+            self._segment_samples += 1
+            timestamp = row.get("timestamp")
+            if self._segment_start is None:
+                self._segment_start = timestamp
+            self._segment_end = timestamp
+
+    def close(self):
+        """Close the active segment, then wait until the rotated segments have been compressed.
+
+        Waiting keeps a stopping Agent from leaving half-written compressed files behind.
+        """
+        super().close()
+        if self._compression != "none":
+            self._compressor.join()
+
+    def rotate_if_due(self):
+        """Rotate the active segment if it has reached its size or age. Return True if rotated."""
+        with self._lock:
+            self._rotation_checked = True
+            if self._closed or self._segment_bytes == 0:
+                return False
+            if ((self._rotate_bytes > 0 and self._segment_bytes >= self._rotate_bytes)
+                    or (self._rotate_interval > 0
+                        and time.monotonic() - self._segment_opened >= self._rotate_interval)):
+                self._rotate()
+                return True
+            return False
+
+    def _rotate(self):
+        """Close the active segment, rename it after its sequence and queue it for compression. Hold the lock."""
+        self._flush()
+        if self._durability != "none":
+            self._fsync()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        segment = self._manifest.add(self._segment_start, self._segment_end, self._segment_samples,
+                                     self._segment_bytes)
+        os.replace(self._path, os.path.join(self._manifest.directory, segment["file"]))
+        if self._compression != "none":
+            self._compressor.submit(self._manifest, segment, self._compression)
+        self._segment_bytes = 0
+        self._segment_samples = 0
+        self._segment_start = None
+        self._segment_end = None
+        self._segment_opened = time.monotonic()
+        self._rotations += 1
+        if self._on_rotate is not None:
+            self._on_rotate()
+
+    def _resume_compression(self):
+        """Queue rotated segments of the node left uncompressed by an earlier run.
+
+        Every run writes to its own directory, so the run directories next to the one of the sink are searched too.
+        """
+        if self._compression == "none":
+            return
+        directory = os.path.abspath(self._manifest.directory)
+        parent = os.path.dirname(directory)
+        try:
+            runs = sorted(os.path.join(parent, entry) for entry in os.listdir(parent))
+        except OSError:
+            runs = []
+        for run in [directory] + [run for run in runs if run != directory]:
+            if not os.path.exists(os.path.join(run, self._name + MANIFEST_SUFFIX)):
+                continue
+            try:
+                manifest = self._manifest if run == directory else SegmentManifest.open(run, self._name)
+            except SegmentException as e:
+                logging.getLogger('__collector__').warning("Not resuming compression in %s: %s", run, str(e))
+                continue
+            for segment in manifest.segments():
+                if segment["file"] == segment_name(self._name, segment["sequence"]) and os.path.exists(
+                        os.path.join(run, segment["file"])):
+                    self._compressor.submit(manifest, segment, self._compression)
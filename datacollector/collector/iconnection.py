@@ -25,6 +25,8 @@ class IConnection(ABC):
         self._hostname = hostname
         self._password = password
         self._key = pkey
+        self._payload_received = 0
+        self._payload_decoded = 0
 
     @property
     def hostname(self):
@@ -41,11 +43,33 @@ class IConnection(ABC):
         """Public access for password."""
         return self._password
 
+    @property
+    def payload_received(self):
+        """Bytes of command output received from the node as channel payload, before decompression.
+
+        SSH framing, encryption and other channels of a shared transport are not included.
+        """
+        return self._payload_received
+
+    @property
+    def payload_decoded(self):
+        """Bytes of command output after decompression."""
+        return self._payload_decoded
+
+    def count_payload(self, received, decoded=None):
+        """Add received payload bytes to the counters. decoded defaults to received for uncompressed output."""
+        self._payload_received += received
+        self._payload_decoded += received if decoded is None else decoded
+
     @abstractmethod
     def is_active(self):
         """Check if connection is active."""
         pass
 
+    def test_connection(self):
+        """Simple test for the connection. Return True if connection works."""
+        return self.is_active()
+
     @abstractmethod
     def close_session(self):
         """Close the connection."""
@@ -65,6 +89,34 @@ class IConnection(ABC):
         except Exception as e:
             raise e
 
+    def execute_lines(self, command):
+        """Execute command and return an iterator over its output lines.
+
+        Connections able to read the output incrementally yield the lines as they are received.
+        """
+        return iter(self.execute(command))
+
+    def execute_batch(self, batch):
+        """Execute a BatchedCommand in one invocation.
+
+        Return a dict of section name -> output lines.
+        """
+        return batch.split(self.execute(batch.command))
+
+    def execute_batch_stream(self, batch):
+        """Execute a BatchedCommand in one invocation, demultiplexing its output while it is received.
+
+        Return an iterator of (name, lines) pairs as in BatchedCommand.iter_sections().
+        """
+        return batch.iter_sections(self.execute_lines(batch.command))
+
+    def open_stream(self, command):
+        """Start a long-running command and return a channel for reading its output incrementally.
+
+        Implement in connections that support push mode collection.
+        """
+        raise NotImplementedError("{} does not support streaming".format(type(self).__name__))
+
     @abstractmethod
     def _execute_command(self, command):
         """Execute command on the remote host.
@@ -10,10 +10,16 @@ import pathlib
 import time
 import uuid
 from abc import ABC, abstractmethod
-from threading import Event, Thread
+from collections import deque
+from datetime import datetime
+from threading import Event, Lock, Thread
+
+from paramiko import SSHException
 
 from datacollector.collector.any_event import AnyEvent
-from datacollector.collector.sshconnection import TooManyRetriesException
+from datacollector.collector.inventory import NodeStatus
+from datacollector.collector.reconnect_policy import BackoffPolicy, CircuitBreaker
+from datacollector.collector.stream_sampler import StreamClosedException
 
 
 class CollectionFailedException(Exception):
@@ -33,14 +39,36 @@ class INodeCollector(ABC, Thread):
     Abstract methods to be implemented.
     """
 
-    def __init__(self, main_collector, connection):
-        """Initialize node collector."""
+    DURATION_HISTORY = 10000
+
+    def __init__(self, main_collector, connection, name=None):
+        """Initialize node collector. Name defaults to the hostname of the connection."""
         super().__init__()
         self._main_collector = main_collector
         self._connection = connection
+        self._node_name = name if name is not None else connection.hostname
+        self.status = NodeStatus.PENDING
         self.events = self._create_events()
         self.collecting = False
         self.success = False
+        self._streaming = False
+        self._connected = Event()
+        self._reconnect_pending = False
+        self._reconnect_attempt = 0
+        config = main_collector.collector_config
+        self._backoff = BackoffPolicy(config.reconnect_base_delay, config.reconnect_max_delay)
+        self._breaker = CircuitBreaker(config.breaker_failure_threshold, config.breaker_reset_timeout)
+        self.phase_offset = main_collector.scheduler.phase_offset(self._node_name)
+        self._scheduled_time = None
+        self._coalesce = config.overrun_policy == "coalesce"
+        self._in_flight = False
+        self._pending_time = None
+        self._collection_lock = Lock()
+        self._collections = 0
+        self._overruns = 0
+        self._samples = 0
+        self._reconnects = 0
+        self._durations = deque(maxlen=self.DURATION_HISTORY)
         self._node_run_id = self._create_node_run_id()
         self._create_dirs()
 
@@ -75,6 +103,23 @@ class INodeCollector(ABC, Thread):
         """Getter for self._connection."""
         return self._connection
 
+    @property
+    def main_collector(self):
+        """Getter for self._main_collector."""
+        return self._main_collector
+
+    @property
+    def node_name(self):
+        """Getter for self._node_name."""
+        return self._node_name
+
+    @property
+    def scheduled_timestamp(self):
+        """Scheduled tick of the current collection as an ISO-8601 UTC string, None if not scheduled."""
+        if self._scheduled_time is None:
+            return None
+        return datetime.utcfromtimestamp(self._scheduled_time).isoformat()
+
     @property
     def node_run_id(self):
         """Getter for self._node_run_id."""
@@ -90,27 +135,175 @@ class INodeCollector(ABC, Thread):
         """Interface for other threads to set stop event."""
         self._stop_event.set()
 
-    def collect(self):
-        """Interface for other threads to set collect event."""
+    def close_record(self):
+        """Release files held for writing data after the collector has stopped. Implement in class extensions."""
+
+    def sink_lag(self):
+        """Return the lag of the sinks of the node, 0 when idle to 1 when saturated. Implement in class extensions."""
+        return 0.0
+
+    @property
+    def in_flight(self):
+        """Check if a collection of the node has been started and not finished."""
+        return self._in_flight
+
+    @property
+    def collections(self):
+        """Number of collections started for the node."""
+        return self._collections
+
+    @property
+    def samples(self):
+        """Number of successful collections of the node."""
+        return self._samples
+
+    @property
+    def reconnects(self):
+        """Number of successful reconnects of the node."""
+        return self._reconnects
+
+    def collection_durations(self):
+        """Return the durations in seconds of the latest successful collections of the node."""
+        return list(self._durations)
+
+    @property
+    def overruns(self):
+        """Number of ticks that arrived while the previous collection of the node was still in flight."""
+        return self._overruns
+
+    def collect(self, scheduled_time=None):
+        """Interface for other threads to set collect event.
+
+        scheduled_time is the tick (epoch seconds) the collection belongs to.
+        Return False if the node overran, see begin_collection.
+        """
+        if not self.begin_collection(scheduled_time):
+            return False
         self._collect_event.set()
+        return True
 
-    def _connect_to_node(self):
-        """Create a separate connection for the collector."""
-        try:
+    def begin_collection(self, scheduled_time=None):
+        """Mark a collection of the node in flight. Return False if the previous one is still in flight.
 
-            if self._main_collector.lock_status:
-                while self._main_collector.lock_status:
-                    time.sleep(0.5)
-            self._main_collector.lock_connections()
-            self._connection.connect(via=None)
-            self._main_collector.unlock_connections()
+        An overrun is counted and, depending on the overrun policy, the tick is either skipped
+        or coalesced: the latest overrun tick is collected right after the ongoing collection.
+        """
+        with self._collection_lock:
+            if self._in_flight:
+                self._overruns += 1
+                if self._coalesce:
+                    self._pending_time = scheduled_time
+                overrun = True
+            else:
+                self._in_flight = True
+                self._scheduled_time = scheduled_time
+                self._collections += 1
+                overrun = False
+        if overrun:
+            logging.getLogger('__collector__').warning("%s: new collect ordered before last one was finished, %s.",
+                                                       self._node_name, "coalescing" if self._coalesce else "skipping")
+        return not overrun
+
+    def _end_collection(self):
+        """Mark the collection finished. Return True if a coalesced tick has to be collected next."""
+        with self._collection_lock:
+            if self._pending_time is not None and not self._stop_event.is_set():
+                self._scheduled_time = self._pending_time
+                self._pending_time = None
+                self._collections += 1
+                return True
+            self._pending_time = None
+            self._in_flight = False
+            return False
+
+    def connect_and_test(self):
+        """Connect to the node and test the connection. Return True if the node is ready for collection.
+
+        If the node is not ready, reconnect attempts continue in the background.
+        """
+        ready = self._connect_to_node()
+        if not ready:
+            self._schedule_reconnect()
+        return ready
+
+    def reconnect(self):
+        """Make one reconnect attempt. Called by the reconnect scheduler of the main collector."""
+        self._reconnect_pending = False
+        if self._stop_event.is_set() or self._connected.is_set():
+            return
+        if self._connect_to_node():
+            logging.getLogger('__collector__').info("%s reconnected after %s attempts.",
+                                                    self._node_name, self._reconnect_attempt + 1)
+            self._reconnect_attempt = 0
+            self._reconnects += 1
+        else:
+            self._reconnect_attempt += 1
+            self._schedule_reconnect()
+
+    def collect_now(self, scheduled_time=None):
+        """Run one collection in the calling thread. Return False if the node overran.
+
+        Used by engines that schedule collections without running the node collector as a thread.
+        """
+        if not self.begin_collection(scheduled_time):
+            return False
+        self.run_collection()
+        return True
 
-        except TooManyRetriesException:
-            self._main_collector.unlock_connections()
-            self.stop()
-        except Exception:
-            self._main_collector.unlock_connections()
-            self.stop()
+    def run_collection(self):
+        """Run a collection started with begin_collection in the calling thread, and any coalesced tick after it."""
+        self._handle_collect_event()
+
+    @property
+    def stopped(self):
+        """Check if the node collector has been stopped."""
+        return self._stop_event.is_set()
+
+    @property
+    def degraded(self):
+        """Check if the circuit breaker of the node is open."""
+        return self._breaker.degraded
+
+    def _connect_to_node(self):
+        """Make one connection attempt once admitted by the main collector. Return True on success."""
+        try:
+            self.status = NodeStatus.CONNECTING
+            with self._main_collector.admission.admit(self._node_name):
+                self._connection.connect(via=None)
+            if not self._connection.test_connection():
+                raise NoConnectionException
+        except Exception as e:
+            self._breaker.record_failure()
+            self.status = NodeStatus.DEGRADED if self._breaker.degraded else NodeStatus.RECONNECTING
+            logging.getLogger('__collector__').warning("%s connection attempt failed (%s in a row): %s",
+                                                       self._node_name, self._breaker.failures,
+                                                       str(e) or type(e).__name__)
+            return False
+        self._breaker.record_success()
+        self.status = NodeStatus.RUNNING
+        self._connected.set()
+        return True
+
+    def _connection_lost(self):
+        """Mark the connection lost and reconnect in the background instead of on the collection path."""
+        if not self._connected.is_set():
+            return
+        self._connected.clear()
+        self._breaker.record_failure()
+        self.status = NodeStatus.DEGRADED if self._breaker.degraded else NodeStatus.RECONNECTING
+        self._schedule_reconnect()
+
+    def _schedule_reconnect(self):
+        """Schedule the next reconnect attempt with jittered exponential backoff.
+
+        While the circuit breaker is open, the attempt waits for the breaker reset timeout.
+        """
+        if self._reconnect_pending or self._stop_event.is_set():
+            return
+        self._reconnect_pending = True
+        delay = max(self._backoff.delay(self._reconnect_attempt), self._breaker.retry_after())
+        logging.getLogger('__collector__').info("%s next reconnect attempt in %.1fs.", self._node_name, delay)
+        self._main_collector.reconnector.schedule(self.reconnect, delay)
 
     def run(self):
         """Handle waiting and collect cycle.
@@ -121,16 +314,18 @@ class INodeCollector(ABC, Thread):
         """
         logging.getLogger('__collector__').info("Started thread for: %s", self._connection.hostname)
 
+        if not self.connect_and_test():
+            logging.getLogger('__collector__').warning("%s not connected, retrying in background.",
+                                                       self._node_name)
         try:
-            self._connect_to_node()
-            if self._connection.test_connection():
-                self._wait_and_handle_events()
+            if self._streaming:
+                self._consume_stream()
             else:
-                raise NoConnectionException
-        except NoConnectionException:
-            logging.getLogger('__collector__').exception("%s NoConnection exception:",
-                                                         self._connection.hostname)
+                self._wait_and_handle_events()
+        except UnhandledException:
+            logging.getLogger('__collector__').exception("%s unhandled exception:", self._node_name)
         logging.getLogger('__collector__').info("%s finished.", self._connection.hostname)
+        self.status = NodeStatus.STOPPED
         self.stop()
 
     def _wait_and_handle_events(self):
@@ -145,11 +340,73 @@ class INodeCollector(ABC, Thread):
         except Exception:
             raise UnhandledException()
 
+    def _consume_stream(self):
+        """Consume frames from a remote sampler until stop event is set.
+
+        A dead stream, or a transport error while starting or reading the sampler, closes the sampler,
+        the node is reconnected and a new sampler is started, as in poll mode.
+        """
+        while not self._stop_event.is_set():
+            if not self._connected.wait(timeout=1):
+                continue
+            sampler = self._create_stream_sampler()
+            try:
+                sampler.start()
+                for frame in sampler.frames(self._stop_event):
+                    self._handle_frame(frame)
+                    if self.success:
+                        self._samples += 1
+            except (StreamClosedException, SSHException, EOFError, OSError, AttributeError) as e:
+                logging.getLogger('__collector__').warning("%s sampler stream lost: %s. Reconnecting.",
+                                                           self._connection.hostname, str(e) or type(e).__name__)
+                sampler.close()
+                self._connection_lost()
+            except Exception:
+                raise UnhandledException()
+            finally:
+                sampler.close()
+
+    def _create_stream_sampler(self):
+        """Create a StreamSampler for push mode collection. Implement in class extensions using push mode."""
+        raise NotImplementedError
+
+    def _handle_frame(self, frame):
+        """Ingest a single frame received in push mode. Implement in class extensions using push mode."""
+        raise NotImplementedError
+
     def _handle_collect_event(self):
-        """Handle collecting event wraps the collecting function."""
+        """Handle collecting event wraps the collecting function.
+
+        Runs until no coalesced tick is pending.
+        """
+        try:
+            self._collect_once()
+            while self._end_collection():
+                self._collect_once()
+        except BaseException:
+            with self._collection_lock:
+                self._in_flight = False
+                self._pending_time = None
+            raise
+
+    def _collect_once(self):
+        """Collect once and report to the main collector.
+
+        A node without a connection skips the collection immediately while it reconnects in the background.
+        """
+        if not self._connected.is_set():
+            self.success = False
+            logging.getLogger('__collector__').debug("%s not connected, skipping collection.", self._node_name)
+            self._main_collector.node_finished()
+            return
         self.collecting = True
         logging.getLogger('__collector__').info("%s started collecting.", self._connection.hostname)
+        started = time.monotonic()
+        self.success = False
         self._try_collect()
+        if self.success:
+            self._samples += 1
+            self._durations.append(time.monotonic() - started)
         self.collecting = False
         logging.getLogger('__collector__').info("%s finished collecting, success: %s.",
                                                 self._connection.hostname, self.success)
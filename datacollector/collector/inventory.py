@@ -0,0 +1,162 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Inventory of target devices (nodes) handled by a MainCollector.
+
+Nodes are read either from every section of device_config.ini or from a
+separate inventory file. An inventory file ending with .csv has a header row
+and one node per line:
+
+name,hostname,port,username,password
+drone-1,10.0.0.1,22,user,secret
+
+An optional connection column (or key in an ini-file) selects the connection
+type: ssh (default) or local, which reads /proc of the collector host itself.
+
+Any other inventory file is read as an ini-file with one section per node,
+in the same format as device_config.ini.
+
+A row or section without a hostname, with a port that is not a number or
+with an unknown connection type is logged and skipped.
+"""
+import configparser
+import csv
+import logging
+import pathlib
+
+CONNECTION_TYPES = ("ssh", "local")
+
+
+class InventoryException(Exception):
+    """Raised when the inventory cannot be read."""
+
+
+class NodeStatus:
+    """Status values of a node collector."""
+    PENDING = "pending"
+    CONNECTING = "connecting"
+    RUNNING = "running"
+    RECONNECTING = "reconnecting"
+    DEGRADED = "degraded"
+    FAILED = "failed"
+    STOPPED = "stopped"
+
+
+class NodeEntry:
+    """Connection parameters of a single node."""
+
+    __slots__ = ("name", "hostname", "port", "username", "password", "connection")
+
+    def __init__(self, name, hostname, port, username, password, connection=None):
+        self.name = name
+        self.hostname = hostname
+        self.port = int(port) if port else 22
+        self.username = username
+        self.password = password
+        self.connection = connection.lower() if connection else "ssh"
+
+
+class Inventory:
+    """Reads node entries from device_config.ini or an inventory file."""
+
+    def __init__(self, inventory_file=None):
+        """Initialize inventory. Without inventory_file, every section of device_config.ini is a node."""
+        absp = pathlib.Path(__file__).parent.parent.absolute()
+        abspath = absp.__str__()
+        if inventory_file:
+            path = pathlib.Path(inventory_file)
+            if not path.is_absolute():
+                path = pathlib.Path(abspath + '/config/') / path
+        else:
+            path = pathlib.Path(abspath + '/config/' + 'device_config.ini')
+        self._path = path
+        self._nodes = []
+        self.read_config()
+
+    @property
+    def nodes(self):
+        """Public access for the list of NodeEntry-objects."""
+        return self._nodes
+
+    @property
+    def path(self):
+        """Public access for the inventory file path."""
+        return self._path
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def read_config(self):
+        """Read the node entries from the inventory file."""
+        try:
+            logging.info('Reading inventory from %s.', self._path)
+            if self._path.suffix.lower() == ".csv":
+                nodes = self._read_csv()
+            else:
+                nodes = self._read_ini()
+        except Exception as e:
+            raise InventoryException("Cannot read inventory {}: {}".format(self._path, str(e)))
+        self._nodes = self._unique(nodes)
+        logging.info("Inventory contains %s nodes.", len(self._nodes))
+
+    def _read_csv(self):
+        """Read nodes from a csv-file with a header row."""
+        nodes = []
+        with open(self._path, newline='') as file:
+            reader = csv.DictReader(file)
+            for row in reader:
+                hostname = (row.get("hostname") or "").strip()
+                node = self._entry("line {}".format(reader.line_num), (row.get("name") or hostname).strip(),
+                                   hostname, (row.get("port") or "").strip(), (row.get("username") or "").strip(),
+                                   row.get("password") or "", (row.get("connection") or "").strip())
+                if node is not None:
+                    nodes.append(node)
+        return nodes
+
+    def _read_ini(self):
+        """Read nodes from an ini-file with one section per node."""
+        config_parser = configparser.ConfigParser(inline_comment_prefixes=(';',))
+        if not config_parser.read(self._path):
+            raise InventoryException("File not found")
+        nodes = []
+        for name in config_parser.sections():
+            section = config_parser[name]
+            node = self._entry("section " + name, name, section.get("hostname", "").strip(),
+                               section.get("port", "").strip(), section.get("username", "").strip(),
+                               section.get("password", ""), section.get("connection", "").strip())
+            if node is not None:
+                nodes.append(node)
+        return nodes
+
+    @staticmethod
+    def _entry(location, name, hostname, port, username, password, connection):
+        """Create a NodeEntry, or log and return None if the values at location are malformed."""
+        if not hostname:
+            logging.warning("Inventory %s has no hostname, skipping.", location)
+            return None
+        if connection and connection.lower() not in CONNECTION_TYPES:
+            logging.warning("Inventory %s has unknown connection type %s, skipping.", location, connection)
+            return None
+        try:
+            return NodeEntry(name, hostname, port, username, password, connection)
+        except ValueError:
+            logging.warning("Inventory %s has invalid port %s, skipping.", location, port)
+            return None
+
+    @staticmethod
+    def _unique(nodes):
+        """Drop entries with a duplicate name."""
+        seen = set()
+        unique = []
+        for node in nodes:
+            if node.name in seen:
+                logging.warning("Duplicate node %s in inventory, skipping.", node.name)
+                continue
+            seen.add(node.name)
+            unique.append(node)
+        return unique
@@ -0,0 +1,139 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Connection to the collector host itself.
+
+Commands are not run in a shell. The commands used by the node collectors
+are answered by reading /proc directly, with the same output as on a remote
+node. Open file descriptors are kept and re-read with pread, so repeated
+collections do not open the files again.
+"""
+import errno
+import logging
+import os
+
+from datacollector.collector.iconnection import IConnection
+from datacollector.collector.process_table import PROCESS_COMMAND
+
+LOCAL_HOSTNAME = "localhost"
+PROC = "/proc"
+
+
+class UnsupportedCommandException(Exception):
+    """Raised when a command cannot be answered without a shell."""
+
+
+class LocalConnection(IConnection):
+    """Reads /proc of the collector host without spawning subprocesses."""
+
+    def __init__(self, hostname=LOCAL_HOSTNAME, max_open_files=1024):
+        """Initialize. At most max_open_files file descriptors are kept open for reuse."""
+        super().__init__(hostname, None, None, None)
+        self._max_open_files = max_open_files
+        self._files = {}
+        self._active = False
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+        self._handlers = {"echo hello": lambda: ["hello\n"], PROCESS_COMMAND: self._read_processes}
+
+    def is_active(self):
+        """Check if the connection is open."""
+        return self._active
+
+    def connect(self, via=None):
+        """Open the connection. There is nothing to connect to."""
+        self._active = True
+
+    def close_session(self):
+        """Close the connection and all kept file descriptors."""
+        self._active = False
+        for path in list(self._files):
+            self._close_file(path)
+
+    def execute_batch(self, batch):
+        """Answer each section of a BatchedCommand directly, without framing the output."""
+        return {name: self._execute_command(command) for name, command in batch.sections}
+
+    def execute_batch_stream(self, batch):
+        """Answer each section of a BatchedCommand in turn as (name, lines) pairs."""
+        return ((name, iter(self._execute_command(command))) for name, command in batch.sections)
+
+    def _execute_command(self, command):
+        """Answer a command supported without a shell: cat of a file, the process command or echo hello."""
+        handler = self._handlers.get(command)
+        if handler is not None:
+            return handler()
+        if command.startswith("cat ") and " " not in command[4:].strip():
+            return self._read_lines(command[4:].strip())
+        raise UnsupportedCommandException("Command not supported by LocalConnection: {}".format(command))
+
+    def _read_processes(self):
+        """Return the same lines as PROCESS_COMMAND: cpu line, page size, stat lines and statm lines."""
+        stat_lines = []
+        statm_lines = []
+        pids = [entry for entry in os.listdir(PROC) if entry.isdigit()]
+        for pid in sorted(pids, key=int):
+            stat = self._read_file("{}/{}/stat".format(PROC, pid))
+            statm = self._read_file("{}/{}/statm".format(PROC, pid))
+            if stat is None or statm is None:
+                continue
+            stat_lines.append(stat)
+            statm_lines.append("{}/{}/statm:{}".format(PROC, pid, statm))
+        self._evict_ended(set(pids))
+        cpu = self._read_lines(PROC + "/stat")[0]
+        return [cpu, "pagesize {}\n".format(self._page_size)] + stat_lines + statm_lines
+
+    def _read_lines(self, path):
+        """Return the lines of a file, raising FileNotFoundError like cat would fail."""
+        data = self._read_file(path)
+        if data is None:
+            raise FileNotFoundError(errno.ENOENT, "No such file", path)
+        return data.splitlines(True)
+
+    def _read_file(self, path):
+        """Read a whole file through a kept file descriptor. Return None if the file no longer exists."""
+        fd = self._files.get(path)
+        cached = fd is not None
+        keep = cached or len(self._files) < self._max_open_files
+        try:
+            if fd is None:
+                fd = os.open(path, os.O_RDONLY)
+            chunks = []
+            offset = 0
+            while True:
+                chunk = os.pread(fd, 65536, offset)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                offset += len(chunk)
+        except OSError as e:
+            if fd is not None:
+                self._close_file(path, fd)
+            if e.errno in (errno.ENOENT, errno.ESRCH):
+                # A kept descriptor may belong to an ended process whose pid was reused.
+                return self._read_file(path) if cached else None
+            raise
+        if keep:
+            self._files[path] = fd
+        else:
+            os.close(fd)
+        return b"".join(chunks).decode("utf-8", errors="replace")
+
+    def _close_file(self, path, fd=None):
+        """Close the file descriptor of a path."""
+        fd = self._files.pop(path, fd)
+        if fd is None:
+            return
+        try:
+            os.close(fd)
+        except OSError as e:
+            logging.getLogger('__collector__').debug("Failed to close %s: %s", path, str(e))
+
+    def _evict_ended(self, pids):
+        """Close kept file descriptors of processes that have ended."""
+        prefix = PROC + "/"
+        for path in list(self._files):
+            parts = path[len(prefix):].split("/")
+            if path.startswith(prefix) and len(parts) == 2 and parts[0].isdigit() and parts[0] not in pids:
+                self._close_file(path)
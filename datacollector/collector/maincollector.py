@@ -6,11 +6,21 @@
 """Class for handling collector threads."""
 import logging
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from threading import Event, Thread
 
-from datacollector.collector.connection_config_parser import ConnectionConfig
+from datacollector.collector.admission import AdmissionController
+from datacollector.collector.backpressure import BackpressureController
+from datacollector.collector.collector_config_parser import CollectorConfig
+from datacollector.collector.elastic_indexer import ElasticIndexer
+from datacollector.collector.inventory import Inventory
+from datacollector.collector.localconnection import LocalConnection
 from datacollector.collector.memcpunodecollector import MemCpuNodeCollector
+from datacollector.collector.reconnect_policy import ReconnectScheduler
+from datacollector.collector.scheduler import AlignedScheduler
+from datacollector.collector.ssh_pool import SshTransportPool
 from datacollector.collector.sshconnection import SshConnection
 
 
@@ -25,19 +35,40 @@ class NoNodesException(Exception):
 class MainCollector(Thread):
     """Maincollector class."""
 
-    def __init__(self, agent):
+    def __init__(self, agent, collector_config=None):
         """Initialize main collector."""
         super().__init__(daemon=True)
         self.agent = agent
         self.stop = False
         self.name = "{addition}-{default}".format(addition=type(self).__name__, default=self.name)
         self._config = None
-        self._reconnect_lock = False
+        if collector_config is None:
+            collector_config = CollectorConfig('collector')
+        self._collector_config = collector_config
+        self._ssh_pool = None
+        if self._collector_config.ssh_pool:
+            self._ssh_pool = SshTransportPool.shared()
+            self._ssh_pool.idle_timeout = self._collector_config.ssh_pool_idle_timeout
+        # Held until run() ends, so that the indexer outlives the records of this collector.
+        self._elastic = ElasticIndexer.shared(self._collector_config) if self._collector_config.index_to_elastic \
+            else None
+        self._admission = AdmissionController(self._collector_config.max_concurrent_handshakes,
+                                              self._collector_config.handshake_rate,
+                                              self._collector_config.handshake_burst)
+        self._reconnector = ReconnectScheduler(self._collector_config.reconnect_workers)
         self._stop_event = Event()
         self._collect_interval = agent.collect_interval
+        self._scheduler = AlignedScheduler(self._collect_interval, self._collector_config.align_ticks,
+                                           self._collector_config.phase_spread)
         self._start_time = agent.collect_start_time
         self._collect_start_time = datetime.min
         self._node_collectors = []
+        self._backpressure = None
+        if self._collector_config.backpressure:
+            self._backpressure = BackpressureController(self._collector_config.backpressure_actions,
+                                                        self._collector_config.backpressure_high,
+                                                        self._collector_config.backpressure_low,
+                                                        self._collector_config.backpressure_max_stretch)
 
     @property
     def collect_interval(self):
@@ -50,22 +81,79 @@ class MainCollector(Thread):
         return self._start_time
 
     @property
-    def lock_status(self):
-        """Public access for lock_status"""
-        return self._reconnect_lock
+    def admission(self):
+        """Public access for the AdmissionController gating connection attempts."""
+        return self._admission
 
     @property
     def config(self):
         """Public access for config."""
         return self._config
 
-    def lock_connections(self):
-        """Set reconnect_lock to True."""
-        self._reconnect_lock = True
+    @property
+    def node_collectors(self):
+        """Public access for node_collectors."""
+        return self._node_collectors
+
+    @property
+    def collector_config(self):
+        """Public access for collector_config."""
+        return self._collector_config
+
+    def node_statuses(self):
+        """Return a dict of node name -> status of each node collector."""
+        return {collector.node_name: collector.status for collector in self._node_collectors}
+
+    def status_counts(self):
+        """Return a dict of status -> number of node collectors with the status."""
+        return dict(Counter(collector.status for collector in self._node_collectors))
+
+    def add_node(self, node):
+        """Create and start a node collector for a NodeEntry while the collector is running."""
+        if any(collector.node_name == node.name for collector in self._node_collectors):
+            logging.warning("Node %s already exists, not adding.", node.name)
+            return None
+        collector = self._create_node_collector(node)
+        if collector is not None:
+            self._node_collectors.append(collector)
+            self._start_node_collector(collector)
+        return collector
+
+    @property
+    def scheduler(self):
+        """Public access for the AlignedScheduler computing collection ticks."""
+        return self._scheduler
+
+    @property
+    def backpressure(self):
+        """Public access for the BackpressureController, None if backpressure is disabled."""
+        return self._backpressure
+
+    def backpressure_counts(self):
+        """Return a dict of the backpressure decisions taken and the current pressure, empty if disabled."""
+        return self._backpressure.counters() if self._backpressure is not None else {}
+
+    @property
+    def reconnector(self):
+        """Public access for the ReconnectScheduler running background reconnects."""
+        return self._reconnector
+
+    def overrun_counts(self):
+        """Return a dict of node name -> number of ticks the node overran the collect interval."""
+        return {collector.node_name: collector.overruns for collector in self._node_collectors}
+
+    def payload_counts(self):
+        """Return a dict of node name -> (payload bytes received, payload bytes after decompression)."""
+        return {collector.node_name: (collector.connection.payload_received, collector.connection.payload_decoded)
+                for collector in self._node_collectors}
 
-    def unlock_connections(self):
-        """Set reconnect_lock to False."""
-        self._reconnect_lock = False
+    def lagging_nodes(self):
+        """Return names of the nodes that have overrun the collect interval at least once."""
+        return [collector.node_name for collector in self._node_collectors if collector.overruns]
+
+    def admission_wait_times(self):
+        """Return a dict of node name -> seconds the node waited for its last connection admission."""
+        return self._admission.wait_times()
 
     def node_finished(self):
         """Interface for NodeCollector threads to report when they have finished.
@@ -79,10 +167,24 @@ class MainCollector(Thread):
     def run(self):
         """Check when we can stop. See _run method."""
         logging.info("%s started.", self.name)
-        while not self.stop:
-            self._run()
+        self._reconnector.start()
+        try:
+            while not self.stop:
+                self._run()
+        finally:
+            self._reconnector.stop()
+            self._release_shared()
         logging.info("%s finished.", self.name)
 
+    def _release_shared(self):
+        """Release the process-wide SSH pool and indexer. Other main collectors of the process keep using them."""
+        if self._ssh_pool is not None:
+            SshTransportPool.release_shared()
+            self._ssh_pool = None
+        if self._elastic is not None:
+            ElasticIndexer.release_shared()
+            self._elastic = None
+
     def signal_stop(self):
         """Call after StopCollector message."""
         logging.debug("%s Received stop signal", self.name)
@@ -114,10 +216,11 @@ class MainCollector(Thread):
             self._start_node_collectors()
             self.agent._reconnect_start_time = None
             self.agent._reconnect = False
-            self._collect()  # Trigger first collection immediately.
-            while not self._stop_event.wait(timeout=self._collect_interval) and self._node_collectors != []:
-                self._collect()
-            self._collect()  # Collect last time after stop event has been set.
+            tick = self._scheduler.first_tick()
+            while not self._scheduler.wait_until(tick, self._stop_event) and self._node_collectors != []:
+                self._collect(tick)
+                tick = self._scheduler.next_tick(tick)
+            self._collect(time.time(), use_offsets=False)  # Collect last time after stop event has been set.
             time.sleep(self._collect_interval)
             self._stop_node_collectors()
         except Exception as e:
@@ -125,54 +228,81 @@ class MainCollector(Thread):
             self.stop = True
 
     def _create_node_collectors(self):
+        """Create NodeCollectors with implemented IConnection-objects for every node in the inventory.
+
+        Node collectors are created in parallel, limited by start_concurrency.
+        """
         logging.info("Creating NodeCollectors...")
-        """Create NodeCollectors with implemented ConnectionConfig- and IConnection-objects."""
-        self._config = ConnectionConfig('device')
-        self._node_collectors.append(MemCpuNodeCollector(self, SshConnection(self._config.hostname, self._config.port,
-                                                                             self._config.username,
-                                                                             self._config.password)))
+        self._config = Inventory(self._collector_config.inventory_file)
+        with ThreadPoolExecutor(max_workers=self._collector_config.start_concurrency) as executor:
+            collectors = list(executor.map(self._create_node_collector, self._config.nodes))
+        self._node_collectors.extend(collector for collector in collectors if collector is not None)
+
+    def _create_node_collector(self, node):
+        """Create a NodeCollector for a single NodeEntry. Return None if creation fails."""
+        try:
+            if node.connection == "local":
+                connection = LocalConnection(node.hostname)
+            else:
+                connection = SshConnection(node.hostname, node.port, node.username, node.password,
+                                           pool=self._ssh_pool, retries=1,
+                                           compression=self._collector_config.compression,
+                                           compression_level=self._collector_config.compression_level)
+            return MemCpuNodeCollector(self, connection, name=node.name)
+        except Exception as e:
+            logging.error("Cannot create NodeCollector for %s: %s", node.name, str(e))
+            return None
 
     def _start_node_collectors(self):
-        logging.info("Starting NodeCollectors...")
+        logging.info("Starting %s NodeCollectors...", len(self._node_collectors))
         if not self._node_collectors:
             raise NoNodesException
 
         for collector in self._node_collectors:
-            collector.start()
+            self._start_node_collector(collector)
+
+    def _start_node_collector(self, collector):
+        """Start a single NodeCollector thread."""
+        collector.start()
 
-    def _collect(self):
+    def _collect(self, scheduled_time, use_offsets=True):
         """Distribute collect command to all NodeCollector threads.
 
-        If last collection is still ongoing, skips the new
-        incoming request.
-        There is some delay between starting collectors,
-        so that ssh connections get time to authenticate themselves.
+        A node whose last collection is still ongoing skips or coalesces the new
+        request by itself, without affecting other nodes.
+        Each node is triggered at the scheduled tick plus its phase offset,
+        and receives the scheduled tick to record next to its sample time.
         """
         if not self._check_alive_collectors():
             self.signal_stop()
-
-        if not self._all_nodes_finished():
-            logging.warning(
-                "New collect ordered before last one was finished, skipping.")
+        if use_offsets and not self._admit_tick(scheduled_time):
             return
 
         logging.info("Triggering new collection for all nodes.")
         self._collect_start_time = datetime.utcnow()
-        for collector in self._node_collectors:
-            collector.collect()
+        for collector in sorted(self._node_collectors, key=lambda node: node.phase_offset):
+            if use_offsets and collector.phase_offset > 0:
+                self._scheduler.wait_until(scheduled_time + collector.phase_offset, self._stop_event)
+            collector.collect(scheduled_time)
+
+    def _admit_tick(self, scheduled_time):
+        """Update the backpressure with the highest lag of the sinks. Return False if the tick is not collected."""
+        if self._backpressure is None:
+            return True
+        self._backpressure.update(max((collector.sink_lag() for collector in self._node_collectors), default=0.0))
+        return self._backpressure.admit(scheduled_time, self._collect_interval, len(self._node_collectors))
 
     def _stop_node_collectors(self):
-        """Set stop flag for each NodeCollector thread and then waits for them to join."""
+        """Set stop flag for each NodeCollector thread, wait for them to join and close their data files."""
         logging.info("%s stopping node collector threads.", self.name)
         for collector in self._node_collectors:
             collector.connection.close_session()
             collector.stop()
         for collector in self._node_collectors:
             collector.join()
+            collector.close_record()
         logging.info("%s all node collectors stopped.", self.name)
 
     def _check_alive_collectors(self):
-        for collector in self._node_collectors:
-            if not collector.isAlive():
-                return False
-        return True
+        """Check that at least one NodeCollector thread is alive. A single failed node does not stop the others."""
+        return any(collector.is_alive() for collector in self._node_collectors)
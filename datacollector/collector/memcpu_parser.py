@@ -5,48 +5,67 @@
 
 """Functionality for modifying data to be indexed to Elasticsearch.
 Calculates CPU utilization based on collected data.
+
+The CPU counters of a node are kept as a NumPy array of cores x fields, and
+the utilisation of all cores is calculated with one vectorized delta.
 """
+import numpy as np
+
+CPU_FIELDS = ("user", "nice", "system", "idle", "iowait", "irq", "softirq", "steal", "guest", "guest_nice")
+IDLE_COLUMNS = [3, 4]
+BUSY_COLUMNS = [0, 1, 2, 5, 6, 7]
 
 
 class CpuUtilisationCalculationException(Exception):
     """Raised when CPU utilisation calculation fails."""
 
 
-class MemCpuParser:
-    """Provides functionalities for parsing MEMCPU data."""
+def parse_cpu_counters(lines):
+    """Parse cpu lines of /proc/stat into the cpu names and a cores x fields int64 array.
 
-    def __init__(self):
-        self.run_id = None
-        self._prevcpus = None
-        self._no_of_cpus = None
+    Return a tuple (names, counters).
+    """
+    fields = [line.split() for line in lines]
+    try:
+        counters = np.array([values[1:] for values in fields], dtype=np.int64).reshape(len(fields), -1)
+    except ValueError:
+        raise CpuUtilisationCalculationException("Malformed cpu lines")
+    return tuple(values[0] for values in fields), counters
 
-    def get_number_of_cpus(self, row):
-        """Calculate number of cpu-objects in given dict.
 
-        Number is utilised in calculation of CPU utilisation.
-        """
-        self._no_of_cpus = 0
-        for obj in row:
-            if obj.startswith("cpu"):
-                self._no_of_cpus += 1
+def cpu_counters_from_row(row):
+    """Build the cpu names and counter array from the cpu dicts of a data row."""
+    names = tuple(name for name in row if name.startswith("cpu"))
+    fields = [field for field in CPU_FIELDS if field in row[names[0]]] if names else []
+    try:
+        counters = np.array([[row[name][field] for field in fields] for name in names], dtype=np.int64)
+    except (KeyError, ValueError, TypeError):
+        raise CpuUtilisationCalculationException("Malformed cpu data")
+    return names, counters.reshape(len(names), len(fields))
 
-    def create_prevcpus_dict(self):
-        """Create a dict of cpu-objects. Set parameter values to zero.
 
-        The dict is utilised to keep track of previous cpu-objects
-        used in CPU utilisation calculation.
+def cpu_utilisation_array(counters, previous):
+    """Calculate the utilisation of every core from the current and previous counters.
 
-        Return the dict.
-        """
-        self._prevcpus = {}
-        prevcpu = {"name": "cpu", "user": 0, "nice": 0, "system": 0, "idle": 0,
-                   "iowait": 0, "irq": 0, "softirq": 0, "steal": 0, "guest": 0}
-        self._prevcpus["cpu"] = prevcpu
-        for n in range(self._no_of_cpus - 1):
-            name = "cpu" + str(n)
-            tempprev = prevcpu.copy()
-            tempprev["name"] = name
-            self._prevcpus[name] = tempprev
+    Works on arrays of any leading shape, the last axis being the fields. Return an array of percentages.
+    A core without cpu time elapsed since the previous counters, e.g. with samples less than a clock tick apart,
+    has a utilisation of 0.
+    """
+    if counters.shape[-1] <= BUSY_COLUMNS[-1]:
+        raise CpuUtilisationCalculationException("Too few cpu fields")
+    delta = counters - previous
+    idled = delta[..., IDLE_COLUMNS].sum(axis=-1)
+    totald = idled + delta[..., BUSY_COLUMNS].sum(axis=-1)
+    return np.divide(totald - idled, totald, out=np.zeros(totald.shape), where=totald != 0) * 100
+
+
+class MemCpuParser:
+    """Provides functionalities for parsing MEMCPU data."""
+
+    def __init__(self):
+        self.run_id = None
+        self._prev_names = None
+        self._prev_counters = None
 
     def cpu_utilisation(self, cpu, prevcpu):
         """Calculate CPU utilisation.
@@ -92,54 +111,59 @@ class MemCpuParser:
         else:
             return utilisation
 
-    def modify_memcpu_data_row(self, json_row):
+    def previous_counters(self, names, counters):
+        """Return the counters of the previous sample for the given cpus.
+
+        Zeros are returned for the first sample or when the cpus have changed,
+        making the utilisation an average since boot.
+        """
+        if self._prev_names != names or self._prev_counters.shape != counters.shape:
+            return np.zeros_like(counters)
+        return self._prev_counters
+
+    def modify_memcpu_data_row(self, json_row, counters=None, utilisation=None):
         """Parse MEM/CPU information from json_row-dict.
 
-        Call cpu_utilisation() for CPU utilisation calculation.
-        prevcpus-dict includes previous CPU dicts for calculating utilisation.
+        counters is the (names, counters) tuple of the cpus in the row, built from the cpu dicts if not given.
+        utilisation is the already calculated utilisation of the cpus, calculated here if not given.
         Save parsed variables and CPU utilisation to a dict.
 
         Return resulting dict.
         """
         final = {"timestamp": json_row["timestamp"],
-                 "run_id": json_row["run_id"],
-                 "memory": json_row["memory"]}
-
-        # Parse CPU dicts from json_row
-        for obj in json_row:
-            if obj.startswith("cpu"):
-                final[obj] = json_row[obj]
-
-        # Handle current and previous CPU dicts
-        # Call cpu_utilisation() for utilisation values calculation
-        nprevcpus = {}
-        for cpu in self._prevcpus:
-            nprevcpus[cpu] = self._prevcpus[cpu]
-            utilisation = self.cpu_utilisation(final[cpu], nprevcpus[cpu])
-            nprevcpus[cpu] = final[cpu]
-            final[cpu]["utilisation"] = utilisation
-
-        self._prevcpus = nprevcpus
+                 "run_id": json_row["run_id"]}
+        if "scheduled_timestamp" in json_row:
+            final["scheduled_timestamp"] = json_row["scheduled_timestamp"]
+        if "memory" in json_row:
+            final["memory"] = json_row["memory"]
+
+        # Partial sample without CPU data
+        if "cpu" not in json_row:
+            return final
+
+        names, values = counters if counters is not None else cpu_counters_from_row(json_row)
+        if utilisation is None:
+            utilisation = cpu_utilisation_array(values, self.previous_counters(names, values))
+        for name, value in zip(names, utilisation.tolist()):
+            final[name] = json_row[name]
+            final[name]["utilisation"] = value
+
+        self._prev_names = names
+        self._prev_counters = values
         return final
 
-    def handle_memcpu_data_row(self, data_row):
+    def handle_memcpu_data_row(self, data_row, counters=None):
         """Call correct methods for handling MEM/CPU data row (dict).
 
-        Calculate number of cpus in row if None.
-        Based on no of cpus, create previous cpus dicts for utilisation calculation if None.
+        Rows of partial samples may have no CPU data.
+        counters is the (names, counters) tuple parsed with parse_cpu_counters(), optional.
 
         Return parsed MEM/CPU data row.
         """
-        # Get number of cpu-objects
-        if self._no_of_cpus is None:
-            self.get_number_of_cpus(data_row)
-
-        # Create dict of cpu-objects for tracking
-        # previous cpu-objects used in CPU utilisation calculation
-        if self._prevcpus is None:
-            self.create_prevcpus_dict()
-
-        # Parse MEM/CPU data row
-        parsed_row = self.modify_memcpu_data_row(data_row)
+        return self.modify_memcpu_data_row(data_row, counters)
 
-        return parsed_row
+    def update_utilisation(self, cpu):
+        """Calculate the utilisation of a CpuSample in place and keep its counters for the next sample."""
+        cpu.utilisation = cpu_utilisation_array(cpu.counters, self.previous_counters(cpu.names, cpu.counters))
+        self._prev_names = cpu.names
+        self._prev_counters = cpu.counters
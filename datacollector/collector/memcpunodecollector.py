@@ -5,11 +5,17 @@
 
 """Implementation from INodeCollector-class for handling collection from a node."""
 import logging
+import time
+import zlib
 from datetime import datetime
 from paramiko import SSHException
 
+from datacollector.collector.batched_command import BatchFramingException, BatchedCommand
 from datacollector.collector.inodecollector import INodeCollector
 from datacollector.collector.memcpurecord import MemCpuRecord
+from datacollector.collector.process_table import PROCESS_COMMAND
+from datacollector.collector.scheduler import SourceSchedule
+from datacollector.collector.stream_sampler import StreamSampler
 
 
 class CollectionFailedException(Exception):
@@ -29,33 +35,105 @@ class MemCpuNodeCollector(INodeCollector):
     Extends INodeCollector.
     """
 
-    def __init__(self, main_collector, connection):
+    COMMANDS = (("cpu", "cat /proc/stat"),
+                ("memory", "cat /proc/meminfo"),
+                ("process", PROCESS_COMMAND))
+
+    def __init__(self, main_collector, connection, name=None):
         """Initialize node collector."""
-        super().__init__(main_collector, connection)
+        super().__init__(main_collector, connection, name)
         self._connection = connection
         self._record = MemCpuRecord(connection.hostname, self)
+        self._batch_commands = main_collector.collector_config.batch_commands
+        self._batch = BatchedCommand(self.COMMANDS)
+        self._batches = {tuple(self._batch.names): self._batch}
+        self._sources = SourceSchedule(self._source_intervals(main_collector))
+        self._streaming = main_collector.collector_config.collect_mode == "stream"
+        self._stream_interval_ms = main_collector.collector_config.stream_interval_ms
+
+    def _source_intervals(self, main_collector):
+        """Return (name, interval) pairs of the metric sources. Interval 0 means every collect interval."""
+        config = main_collector.collector_config
+        intervals = {"cpu": config.cpu_interval, "memory": config.memory_interval,
+                     "process": config.process_interval}
+        return [(name, intervals[name] or main_collector.collect_interval) for name, _ in self.COMMANDS]
 
     def _try_collect(self):
-        """Call data collection and ingestion methods."""
+        """Call data collection and ingestion methods for the metric sources that are due."""
+        scheduled_time = time.time() if self._scheduled_time is None else self._scheduled_time
         try:
-            cpu_data = self._collect_cpu()
-            mem_data = self._collect_mem()
-            process_data = self._collect_process_mem()
-            timestamp = datetime.utcnow().isoformat()
-            self._record.ingest_data(timestamp, cpu_data, mem_data, process_data)
+            names = self._sources.due(scheduled_time)
+            backpressure = self._main_collector.backpressure
+            if "process" in names and backpressure is not None and backpressure.drop_process:
+                names.remove("process")
+                backpressure.count_process_dropped()
+                self._sources.mark_collected(["process"], scheduled_time)
+            if not names:
+                self.success = True
+                return
+            if self._batch_commands:
+                self._collect_batched(names)
+            else:
+                collect = {"cpu": self._collect_cpu, "memory": self._collect_mem,
+                           "process": self._collect_process_mem}
+                sections = {name: collect[name]() for name in names}
+                timestamp = datetime.utcnow().isoformat()
+                self._record.ingest_sections(timestamp, sections, self.scheduled_timestamp)
+            self._sources.mark_collected(names, scheduled_time)
             self.success = True
-        except ConnectionResetError or AttributeError:
+        except (ConnectionResetError, AttributeError, EOFError, OSError):
             logging.error("%s collecting Failed", self._connection.hostname)
-            self._connect_to_node()
+            self._connection_lost()
 
         except SSHException:
             logging.error("%s collecting Failed", self._connection.hostname)
-            self._connect_to_node()
+            self._connection_lost()
+
+        except (BatchFramingException, zlib.error) as e:
+            logging.error("%s collecting Failed: %s", self._connection.hostname, str(e))
 
         except Exception as e:
             logging.error("%s collecting Failed: %s", self._connection.hostname, str(e))
             raise UnhandledException()
 
+    def _collect_batched(self, names):
+        """Collect the given metric sources with a single remote invocation.
+
+        The sections are parsed while the output is received.
+        """
+        self._record.ingest_stream(self._connection.execute_batch_stream(self._batch_for(names)),
+                                   self.scheduled_timestamp)
+
+    def _batch_for(self, names):
+        """Return the BatchedCommand merging the given sources. Batches are cached per combination."""
+        key = tuple(names)
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = BatchedCommand([command for command in self.COMMANDS if command[0] in names])
+            self._batches[key] = batch
+        return batch
+
+    def close_record(self):
+        """Write buffered samples and close the data file."""
+        self._record.close()
+
+    def sink_lag(self):
+        """Return the lag of the data file and Elasticsearch of the node."""
+        return self._record.lag()
+
+    def _create_stream_sampler(self):
+        """Create a remote sampler running all metric sources every stream interval."""
+        return StreamSampler(self._connection, self._batch, self._stream_interval_ms)
+
+    def _handle_frame(self, frame):
+        """Ingest a frame received from the remote sampler."""
+        try:
+            self._record.ingest_sections(frame.timestamp, frame.sections)
+            self.success = True
+        except Exception as e:
+            self.success = False
+            logging.error("%s ingesting frame failed: %s", self._connection.hostname, str(e))
+
     def _collect_cpu(self):
         """Collect current cpu data."""
         try:
@@ -77,7 +155,7 @@ class MemCpuNodeCollector(INodeCollector):
     def _collect_process_mem(self):
         """Collect current process data."""
         try:
-            data = self._connection.execute('top -b -n 1')
+            data = self._connection.execute(PROCESS_COMMAND)
             if data is not None:
                 return data
         except Exception as e:
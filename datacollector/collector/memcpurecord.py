@@ -4,13 +4,18 @@
 # SPDX-License-Identifier: Apache-2.0
 
 """Class handles parsing and writing data into a json file."""
-import json
 import logging
 import pathlib
+from datetime import datetime
 
+from datacollector.collector.columnar_store import COLUMNS_SUFFIX, ColumnarWriter
 from datacollector.collector.elastic_indexer import ElasticIndexer
+from datacollector.collector.file_sink import FileSink, RotatingFileSink
 from datacollector.collector.irecord import IRecord
 from datacollector.collector.memcpu_parser import MemCpuParser
+from datacollector.collector.process_delta import ProcessDeltaEncoder
+from datacollector.collector.process_table import ProcessTable
+from datacollector.collector.sample import CpuSample, MemorySample, Sample
 
 
 class MemCpuRecord(IRecord):
@@ -24,66 +29,156 @@ class MemCpuRecord(IRecord):
         self._abspath = self._absp.__str__()
         self._destination = self._abspath + '/data/'
         self._collector = collector
-        self._json = {}
+        self._previous_cpu = None
+        self._previous_memory = None
         self._parser = MemCpuParser()
-        self._elastic = ElasticIndexer()
+        self._process_table = ProcessTable()
+        self._process_encoder = None
+        config = collector.main_collector.collector_config
+        path = self._destination + collector.node_run_id + '/' + filename + '.json'
+        if config.file_rotate_bytes > 0 or config.file_rotate_interval > 0:
+            self._sink = RotatingFileSink(path, config.file_buffer_bytes, config.file_flush_interval,
+                                          config.file_durability, config.file_fsync_every, config.file_rotate_bytes,
+                                          config.file_rotate_interval, config.file_compression,
+                                          on_rotate=self._start_segment)
+        else:
+            self._sink = FileSink(path, config.file_buffer_bytes, config.file_flush_interval,
+                                  config.file_durability, config.file_fsync_every)
+        self._columns = None
+        self._json_series = config.file_format != "columnar"
+        if config.file_format in ("columnar", "both"):
+            self._columns = ColumnarWriter(path[:-len('.json')] + COLUMNS_SUFFIX, config.file_buffer_bytes,
+                                           config.file_flush_interval, config.file_durability,
+                                           config.file_fsync_every)
+        self._elastic = ElasticIndexer.shared(config) if config.index_to_elastic else None
+        if config.process_delta:
+            self._process_encoder = ProcessDeltaEncoder(config.process_keyframe_interval,
+                                                        config.process_cpu_threshold,
+                                                        config.process_memory_threshold)
 
-    def ingest_data(self, timestamp, cpu_data, mem_data, process_data):
+    def ingest_data(self, timestamp, cpu_data, mem_data, process_data, scheduled_timestamp=None):
         """Ingest data to the record class and write it into a file.
         Pass the data to ElasticWriter.
+
+        Sources that were not collected are given as None and left out of the sample.
+        scheduled_timestamp is the tick the sample was scheduled for, stored next to the actual timestamp.
+        The data is parsed once into a compact Sample, converted to a dict only when written.
+        """
+        sections = (("cpu", cpu_data), ("memory", mem_data), ("process", process_data))
+        parsed = self._parse_sections((name, lines) for name, lines in sections if lines is not None)
+        self._ingest_parsed(timestamp, parsed, scheduled_timestamp)
+
+    def ingest_sections(self, timestamp, sections, scheduled_timestamp=None):
+        """Ingest the demultiplexed sections of a batched collection.
+
+        Each section is passed to the parser matching its name. Missing sections make a partial sample.
+        """
+        self.ingest_data(timestamp, sections.get("cpu"), sections.get("memory"), sections.get("process"),
+                         scheduled_timestamp)
+
+    def ingest_stream(self, sections, scheduled_timestamp=None):
+        """Parse sections while their output is still being received, then write the sample.
+
+        sections is an iterator of (name, lines) pairs, as returned by IConnection.execute_batch_stream().
+        The timestamp is taken when the output has ended, as for a collection read as a whole.
+        """
+        parsed = self._parse_sections(sections)
+        self._ingest_parsed(datetime.utcnow().isoformat(), parsed, scheduled_timestamp)
+
+    def _parse_sections(self, sections):
+        """Parse (name, lines) pairs. Return a dict of name -> CpuSample, MemorySample or list of processes."""
+        parsers = {"cpu": self._parse_cpu_data, "memory": self._parse_mem_data, "process": self._parse_process_data}
+        parsed = {}
+        for name, lines in sections:
+            parse = parsers.get(name)
+            if parse is not None:
+                parsed[name] = parse(lines)
+        return parsed
+
+    def _ingest_parsed(self, timestamp, parsed, scheduled_timestamp):
+        """Calculate CPU utilisation of parsed sections and write the sample to the file and Elasticsearch.
+
+        The process table is encoded last, right before the write, so that a sample that fails earlier does not
+        advance the delta encoder. If the write fails, the next process table is written as a keyframe.
         """
-        self._json = {"timestamp": timestamp, "run_id": self._collector.node_run_id}
-        self._parse_cpu_data(cpu_data)
-        self._json["memory"] = self._parse_mem_data(mem_data)
-        parsed_memcpu = self._parser.handle_memcpu_data_row(self._json)
-        self._elastic.upload_data(parsed_memcpu, index="memcpu_data")
-        self._json = parsed_memcpu
-        self._parse_process_data(process_data)
-        self._write_to_file(self._json)
+        self._sink.rotate_if_due()
+        sample = Sample(timestamp, self._collector.node_run_id, scheduled_timestamp)
+        sample.cpu = parsed.get("cpu")
+        sample.memory = parsed.get("memory")
+        if sample.cpu is not None:
+            self._parser.update_utilisation(sample.cpu)
+        if ("cpu" in parsed or "memory" in parsed) and self._elastic is not None:
+            self._elastic.upload_data(sample.to_dict(process=False), index="memcpu_data")
+        if self._columns is not None and (sample.cpu is not None or sample.memory is not None):
+            self._columns.append(sample)
+        if "process" in parsed:
+            sample.process = self._encode_processes(parsed["process"])
+        if self._json_series or sample.process is not None:
+            try:
+                self._write_to_file(sample.to_dict(series=self._json_series))
+            except Exception:
+                if sample.process is not None and self._process_encoder is not None:
+                    self._process_encoder.force_keyframe()
+                raise
 
     def _parse_cpu_data(self, cpu_data):
         """Check data format from manual.
 
         http://man7.org/linux/man-pages/man5/proc.5.html.
+
+        Return a CpuSample of the cpu lines, None if there are none.
         """
-        for row in cpu_data:
-            if 'cpu' in row:
-                temp = row.split()
-                self._json[temp[0]] = {"user": temp[1], "nice": temp[2],
-                                      "system": temp[3], "idle": temp[4],
-                                      "iowait": temp[5], "irq": temp[6],
-                                      "softirq": temp[6], "steal": temp[7],
-                                      "guest": temp[8], "guest_nice": temp[9]}
+        lines = [row for row in cpu_data if row.startswith("cpu")]
+        if not lines:
+            return None
+        cpu = CpuSample.from_lines(lines, self._previous_cpu)
+        self._previous_cpu = cpu
+        return cpu
 
     def _parse_mem_data(self, data):
         """Check data format from manual.
 
         http://man7.org/linux/man-pages/man5/proc.5.html.
         """
-        mem_data = {}
-        for row in data:
-            temp = row.split()
-            mem_data[temp[0].strip(':')] = temp[1]
-        return mem_data
+        memory = MemorySample.from_lines(data, self._previous_memory)
+        self._previous_memory = memory
+        return memory
 
     def _parse_process_data(self, data):
-        """Parse process data."""
-        meta = data[3].lower().split()
-        process_number = 0
-        for row in data[4:]:
-            temp = row.split()
-            if len(temp) < len(meta):
-                continue
-            process = {}
-            for i in range(len(meta)):
-                if meta[i] == "command":
-                    process[meta[i]] = " ".join(temp[i:])
-                else:
-                    process[meta[i]] = temp[i]
-            self._json["process_{}".format(process_number)] = process
-            process_number = process_number + 1
+        """Parse raw /proc/[pid]/stat and statm data with the pid-keyed process table. Return the processes."""
+        return self._process_table.update(data)
+
+    def _encode_processes(self, processes):
+        """Return the process keys of the sample.
+
+        In incremental mode, only the changes to the previously written process table are stored between keyframes.
+        """
+        if self._process_encoder is not None:
+            return self._process_encoder.encode(processes)
+        return {"process_{}".format(process_number): process for process_number, process in enumerate(processes)}
+
+    def _start_segment(self):
+        """Start the process data of a new data file segment with a keyframe.
+
+        Called by the sink on every rotation, so that each segment can be decoded without the earlier segments.
+        """
+        if self._process_encoder is not None:
+            self._process_encoder.force_keyframe()
+
+    def lag(self):
+        """Return the highest lag of the data file and Elasticsearch, 0 to 1."""
+        return max(self._sink.lag(), self._elastic.lag() if self._elastic is not None else 0.0)
+
+    def close(self):
+        """Write buffered samples, close the data file and columnar store and release the shared indexer."""
+        try:
+            self._sink.close()
+        finally:
+            if self._columns is not None:
+                self._columns.close()
+            if self._elastic is not None:
+                self._elastic = None
+                ElasticIndexer.release_shared()
 
     def _write_to_file(self, data):
-        file = open(self._destination + self._collector.node_run_id
-                    + '/' + self._filename + '.json', 'a+')
-        file.write(json.dumps(data) + "\n")
+        self._sink.write(data)
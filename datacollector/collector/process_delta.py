@@ -0,0 +1,117 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Incremental encoding of the process table.
+
+A keyframe sample stores the full process table as process_0..n and sets
+"process_keyframe": true. The samples between keyframes store only the
+difference to the process table known by the reader:
+
+"process_delta": {"added": [...], "changed": [...], "removed": ["1234", ...]}
+
+A process is changed when its command, state, parent or thread count changed,
+or its CPU usage or resident memory moved past a threshold since it was last
+written. ProcessDeltaDecoder rebuilds the full process_0..n snapshot of each
+sample from the keyframe and the deltas after it.
+"""
+
+DELTA_KEY = "process_delta"
+KEYFRAME_KEY = "process_keyframe"
+PROCESS_PREFIX = "process_"
+IDENTITY_FIELDS = ("command", "state", "ppid", "threads")
+
+
+class ProcessDeltaException(Exception):
+    """Raised when a delta sample cannot be applied."""
+
+
+def _ordered(processes):
+    """Return processes ordered by pid."""
+    return sorted(processes, key=lambda process: int(process["pid"]))
+
+
+def _snapshot_keys(processes):
+    """Return a dict of process_0..n -> process for the processes ordered by pid."""
+    return {PROCESS_PREFIX + str(number): process for number, process in enumerate(_ordered(processes))}
+
+
+class ProcessDeltaEncoder:
+    """Keeps the process table last written for a node and encodes new tables as keyframes or deltas."""
+
+    def __init__(self, keyframe_interval=10, cpu_threshold=1.0, memory_threshold=1024):
+        """Initialize encoder.
+
+        keyframe_interval: number of samples between full keyframes.
+        cpu_threshold: change of cpu (%) that makes a process changed.
+        memory_threshold: change of resident memory (KiB) that makes a process changed.
+        """
+        self._keyframe_interval = max(1, keyframe_interval)
+        self._cpu_threshold = cpu_threshold
+        self._memory_threshold = memory_threshold
+        self._reference = {}
+        self._samples = 0
+
+    def force_keyframe(self):
+        """Make the next encoded sample a keyframe, e.g. at the start of a new data file segment."""
+        self._samples = 0
+
+    def encode(self, processes):
+        """Return the keys to add to a sample for the given list of process dicts."""
+        keyframe = self._samples % self._keyframe_interval == 0
+        self._samples += 1
+        if keyframe:
+            self._reference = {process["pid"]: process for process in processes}
+            encoded = _snapshot_keys(processes)
+            encoded[KEYFRAME_KEY] = True
+            return encoded
+
+        current = {process["pid"]: process for process in processes}
+        added = [process for pid, process in current.items() if pid not in self._reference]
+        changed = [process for pid, process in current.items()
+                   if pid in self._reference and self._changed(self._reference[pid], process)]
+        removed = [pid for pid in self._reference if pid not in current]
+        for process in added + changed:
+            self._reference[process["pid"]] = process
+        for pid in removed:
+            del self._reference[pid]
+        return {DELTA_KEY: {"added": _ordered(added), "changed": _ordered(changed), "removed": removed}}
+
+    def _changed(self, previous, process):
+        """Check if a process differs from its last written state past the thresholds."""
+        if any(previous.get(field) != process.get(field) for field in IDENTITY_FIELDS):
+            return True
+        if (previous.get("cpu") is None) != (process.get("cpu") is None):
+            return True
+        if process.get("cpu") is not None and abs(process["cpu"] - previous["cpu"]) >= self._cpu_threshold:
+            return True
+        return abs(process.get("res", 0) - previous.get("res", 0)) >= self._memory_threshold
+
+
+class ProcessDeltaDecoder:
+    """Rebuilds full process snapshots from keyframe and delta samples of one node, read in order."""
+
+    def __init__(self):
+        self._snapshot = None
+
+    def decode(self, row):
+        """Return the sample with a delta replaced by the full process_0..n snapshot.
+
+        Samples without process data are returned unchanged.
+        """
+        if row.pop(KEYFRAME_KEY, False):
+            self._snapshot = {process["pid"]: process for key, process in row.items()
+                              if key.startswith(PROCESS_PREFIX)}
+            return row
+        delta = row.pop(DELTA_KEY, None)
+        if delta is None:
+            return row
+        if self._snapshot is None:
+            raise ProcessDeltaException("Process delta before the first keyframe")
+        for pid in delta["removed"]:
+            self._snapshot.pop(pid, None)
+        for process in delta["added"] + delta["changed"]:
+            self._snapshot[process["pid"]] = process
+        row.update(_snapshot_keys(self._snapshot.values()))
+        return row
@@ -0,0 +1,118 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Process table built from raw /proc/[pid]/stat and /proc/[pid]/statm lines.
+
+All processes are read with one remote command. Its output contains the
+aggregate cpu line of /proc/stat, the page size, one /proc/[pid]/stat line
+per process and one statm line per process prefixed with its path:
+
+cpu  74608 2520 24433 1117073 6176 4054 0 0 0 0
+pagesize 4096
+1 (systemd) S 0 1 1 0 -1 4194560 ...
+/proc/1/statm:42134 3182 2117 242 0 5009 0
+
+CPU usage of a process is calculated locally from the difference of its
+utime + stime to the previous collection, relative to the total CPU time of
+the node. Previous values are kept in a table keyed by pid, and pids that no
+longer exist are evicted.
+"""
+import logging
+
+PROCESS_COMMAND = ("head -n 1 /proc/stat; echo \"pagesize $(getconf PAGESIZE 2>/dev/null || echo 4096)\"; "
+                   "cat /proc/[0-9]*/stat 2>/dev/null; grep -H '' /proc/[0-9]*/statm 2>/dev/null || true")
+
+STATM_PREFIX = "/proc/"
+
+
+class ProcessParseException(Exception):
+    """Raised when process data cannot be parsed."""
+
+
+class ProcessTable:
+    """Keeps per-pid CPU time between collections and turns raw /proc lines into process dicts."""
+
+    def __init__(self):
+        self._previous = {}
+        self._previous_total = None
+        self._evicted = 0
+
+    def __len__(self):
+        return len(self._previous)
+
+    @property
+    def evicted(self):
+        """Number of pids evicted from the table because the process ended."""
+        return self._evicted
+
+    def update(self, lines):
+        """Parse the output lines of PROCESS_COMMAND and return a list of process dicts ordered by pid.
+
+        cpu is the share (%) of the total CPU time of the node used by the process since the
+        previous collection, None on the first collection of the process. Memory sizes are in KiB.
+        """
+        total = None
+        page_kib = 4
+        stats = {}
+        statms = {}
+        for line in lines:
+            if line.startswith("cpu"):
+                total = sum(int(value) for value in line.split()[1:])
+            elif line.startswith("pagesize"):
+                page_kib = int(line.split()[1]) // 1024
+            elif line.startswith(STATM_PREFIX):
+                path, _, values = line.partition(":")
+                statms[path.split("/")[2]] = values.split()
+            elif line.strip():
+                pid, stat = self._parse_stat(line)
+                stats[pid] = stat
+        if total is None:
+            raise ProcessParseException("Missing cpu line in process data")
+
+        total_delta = total - self._previous_total if self._previous_total is not None else 0
+        current = {}
+        processes = []
+        for pid in sorted(stats, key=int):
+            stat = stats[pid]
+            ticks = stat["utime"] + stat["stime"]
+            previous = self._previous.get(pid)
+            cpu = None
+            if previous is not None and previous[0] == stat["starttime"] and total_delta > 0:
+                cpu = round(max(0, ticks - previous[1]) * 100.0 / total_delta, 2)
+            current[pid] = (stat["starttime"], ticks)
+            process = {"pid": pid, "ppid": stat["ppid"], "command": stat["command"], "state": stat["state"],
+                       "threads": stat["threads"], "utime": stat["utime"], "stime": stat["stime"], "cpu": cpu}
+            statm = statms.get(pid)
+            if statm is not None and len(statm) >= 3:
+                process["virt"] = int(statm[0]) * page_kib
+                process["res"] = int(statm[1]) * page_kib
+                process["shr"] = int(statm[2]) * page_kib
+            processes.append(process)
+
+        evicted = len(set(self._previous) - set(current))
+        if evicted:
+            self._evicted += evicted
+            logging.getLogger('__collector__').debug("Evicted %s ended processes from process table.", evicted)
+        self._previous = current
+        self._previous_total = total
+        return processes
+
+    @staticmethod
+    def _parse_stat(line):
+        """Parse a /proc/[pid]/stat line. The command is enclosed in parentheses and may contain spaces.
+
+        http://man7.org/linux/man-pages/man5/proc.5.html.
+        """
+        start = line.find("(")
+        end = line.rfind(")")
+        if start < 0 or end < start:
+            raise ProcessParseException("Invalid stat line: {}".format(line.strip()))
+        fields = line[end + 2:].split()
+        if len(fields) < 20:
+            raise ProcessParseException("Invalid stat line: {}".format(line.strip()))
+        pid = line[:start].strip()
+        return pid, {"command": line[start + 1:end], "state": fields[0], "ppid": fields[1],
+                     "utime": int(fields[11]), "stime": int(fields[12]), "threads": int(fields[17]),
+                     "starttime": int(fields[19])}
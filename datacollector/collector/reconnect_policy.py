@@ -0,0 +1,146 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Reconnect policy for node connections.
+
+BackoffPolicy gives jittered exponential delays between connection attempts.
+CircuitBreaker marks a node degraded after repeated failures and holds off
+further attempts for a while. ReconnectScheduler runs reconnect attempts in
+the background, so that a flapping node never blocks a collection cycle.
+"""
+import heapq
+import itertools
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Thread
+
+
+class BackoffPolicy:
+    """Exponential backoff with full jitter."""
+
+    def __init__(self, base=1.0, cap=60.0, multiplier=2.0, rng=None):
+        """Initialize policy. Delays are given in seconds. rng is a random.Random, the module's by default."""
+        self._base = base
+        self._cap = cap
+        self._multiplier = multiplier
+        self._rng = rng if rng is not None else random
+
+    def delay(self, attempt):
+        """Return a random delay for the given attempt number, starting from 0."""
+        ceiling = min(self._cap, self._base * (self._multiplier ** min(attempt, 32)))
+        return self._rng.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """Circuit breaker counting consecutive connection failures of a node.
+
+    closed: attempts are allowed.
+    open: threshold reached, the node is degraded and attempts wait for the reset timeout.
+    half-open: reset timeout passed, a single attempt decides between closed and open.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=300.0, clock=time.monotonic):
+        """Initialize breaker. Reset timeout is given in seconds, as measured by clock."""
+        self._failure_threshold = max(1, failure_threshold)
+        self._reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+
+    @property
+    def state(self):
+        """Current state of the breaker."""
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._clock() - self._opened_at >= self._reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    @property
+    def degraded(self):
+        """True while the breaker is not closed."""
+        return self._opened_at is not None
+
+    @property
+    def failures(self):
+        """Number of consecutive failures."""
+        return self._failures
+
+    def retry_after(self):
+        """Seconds until an attempt is allowed again. 0 if allowed now."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._reset_timeout - (self._clock() - self._opened_at))
+
+    def record_success(self):
+        """Close the breaker."""
+        self._failures = 0
+        self._opened_at = None
+
+    def record_failure(self):
+        """Count a failure. Open the breaker at the threshold, or again after a failed half-open attempt."""
+        self._failures += 1
+        if self._failures >= self._failure_threshold:
+            self._opened_at = self._clock()
+
+
+class ReconnectScheduler:
+    """Runs delayed reconnect callbacks on a small worker pool."""
+
+    def __init__(self, workers=4, clock=time.monotonic):
+        """Initialize scheduler with the given number of worker threads. Delays are measured by clock."""
+        self._clock = clock
+        self._condition = Condition()
+        self._heap = []
+        self._sequence = itertools.count()
+        self._workers = workers
+        self._executor = None
+        self._thread = None
+        self._stopped = False
+
+    def start(self):
+        """Start the scheduler thread."""
+        self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="Reconnect")
+        self._thread = Thread(target=self._run, name="ReconnectScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the scheduler. Pending callbacks are dropped."""
+        with self._condition:
+            self._stopped = True
+            self._heap = []
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def schedule(self, callback, delay):
+        """Run callback after delay seconds."""
+        with self._condition:
+            if self._stopped:
+                return
+            heapq.heappush(self._heap, (self._clock() + delay, next(self._sequence), callback))
+            self._condition.notify_all()
+
+    def _run(self):
+        """Submit due callbacks to the worker pool."""
+        while True:
+            with self._condition:
+                while not self._stopped and (not self._heap or self._heap[0][0] > self._clock()):
+                    timeout = self._heap[0][0] - self._clock() if self._heap else None
+                    self._condition.wait(timeout)
+                if self._stopped:
+                    return
+                _, _, callback = heapq.heappop(self._heap)
+            try:
+                self._executor.submit(callback)
+            except RuntimeError as e:
+                logging.getLogger('__collector__').debug("Reconnect not submitted: %s", str(e))
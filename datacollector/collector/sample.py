@@ -0,0 +1,116 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Compact in-memory representation of a collected MEM/CPU sample.
+
+Values are parsed once into integers: the cpu counters into a NumPy array of
+cores x fields and the memory values into an array of 64-bit integers. The
+names of the cpus and memory keys are shared between the samples of a node
+while they do not change. A sample is converted to the dict format of the
+data files and Elasticsearch only when it is written, with to_dict().
+"""
+from array import array
+
+from datacollector.collector.memcpu_parser import CPU_FIELDS, parse_cpu_counters
+
+
+class SampleParseException(Exception):
+    """Raised when collected data cannot be parsed into a sample."""
+
+
+class CpuSample:
+    """Counters of the aggregate cpu and each core, and their utilisation once calculated."""
+
+    __slots__ = ("names", "counters", "utilisation")
+
+    def __init__(self, names, counters, utilisation=None):
+        """Initialize with a tuple of cpu names and a cores x fields int64 array of counters."""
+        self.names = names
+        self.counters = counters
+        self.utilisation = utilisation
+
+    @classmethod
+    def from_lines(cls, lines, previous=None):
+        """Parse the cpu lines of /proc/stat. The names of a previous sample are reused if unchanged."""
+        names, counters = parse_cpu_counters(lines)
+        if previous is not None and previous.names == names:
+            names = previous.names
+        return cls(names, counters)
+
+    def to_dict(self):
+        """Return a dict of cpu name -> dict of counters as strings and the utilisation."""
+        fields = CPU_FIELDS[:self.counters.shape[1]]
+        utilisation = self.utilisation.tolist() if self.utilisation is not None else None
+        cpus = {}
+        for index, (name, values) in enumerate(zip(self.names, self.counters.tolist())):
+            cpu = dict(zip(fields, map(str, values)))
+            if utilisation is not None:
+                cpu["utilisation"] = utilisation[index]
+            cpus[name] = cpu
+        return cpus
+
+
+class MemorySample:
+    """Values of /proc/meminfo in kB, or in pages for the HugePages counts."""
+
+    __slots__ = ("names", "values")
+
+    def __init__(self, names, values):
+        """Initialize with a tuple of meminfo keys and an array of their values."""
+        self.names = names
+        self.values = values
+
+    @classmethod
+    def from_lines(cls, lines, previous=None):
+        """Parse the lines of /proc/meminfo. The names of a previous sample are reused if unchanged."""
+        names = []
+        values = array("q")
+        try:
+            for line in lines:
+                temp = line.split()
+                names.append(temp[0].strip(':'))
+                values.append(int(temp[1]))
+        except (IndexError, ValueError):
+            raise SampleParseException("Malformed meminfo line: {}".format(line))
+        names = tuple(names)
+        if previous is not None and previous.names == names:
+            names = previous.names
+        return cls(names, values)
+
+    def to_dict(self):
+        """Return a dict of meminfo key -> value as string."""
+        return dict(zip(self.names, map(str, self.values)))
+
+
+class Sample:
+    """One sample of a node. Sources that were not collected are None."""
+
+    __slots__ = ("timestamp", "run_id", "scheduled_timestamp", "cpu", "memory", "process")
+
+    def __init__(self, timestamp, run_id, scheduled_timestamp=None):
+        """Initialize an empty sample."""
+        self.timestamp = timestamp
+        self.run_id = run_id
+        self.scheduled_timestamp = scheduled_timestamp
+        self.cpu = None
+        self.memory = None
+        self.process = None
+
+    def to_dict(self, process=True, series=True):
+        """Return the sample in the format of the data files.
+
+        process: include the process keys. Samples indexed to Elasticsearch leave them out.
+        series: include the memory and cpu keys. They are left out when stored in a columnar store.
+        """
+        row = {"timestamp": self.timestamp, "run_id": self.run_id}
+        if self.scheduled_timestamp is not None:
+            row["scheduled_timestamp"] = self.scheduled_timestamp
+        if series and self.memory is not None:
+            row["memory"] = self.memory.to_dict()
+        if series and self.cpu is not None:
+            row.update(self.cpu.to_dict())
+        if process and self.process is not None:
+            row.update(self.process)
+        return row
@@ -0,0 +1,115 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Drift-free scheduling of collection ticks.
+
+Ticks are absolute points in time. With alignment, they fall on whole multiples
+of the interval since the epoch (e.g. every whole 5 s), so samples from different
+nodes and runs share the same scheduled timestamps. Without alignment, ticks
+follow the first tick at exact interval steps. Either way, the time spent collecting
+does not accumulate as drift.
+
+SourceSchedule decides which metric sources of a node are due on a tick, so that
+each source can be collected at its own interval.
+"""
+import math
+import time
+import zlib
+
+
+class AlignedScheduler:
+    """Computes absolute collection ticks and per-node phase offsets."""
+
+    def __init__(self, interval, align=True, phase_spread=0.0):
+        """Initialize scheduler.
+
+        interval: seconds between ticks.
+        align: align ticks to whole multiples of the interval since the epoch.
+        phase_spread: fraction of the interval (0-1) over which node phase offsets are spread.
+        """
+        self._interval = float(interval)
+        self._align = align
+        self._phase_spread = min(max(phase_spread, 0.0), 1.0)
+
+    @property
+    def interval(self):
+        """Public access for interval."""
+        return self._interval
+
+    def first_tick(self, now=None):
+        """Return the first tick at or after now."""
+        now = time.time() if now is None else now
+        if not self._align:
+            return now
+        return math.ceil(now / self._interval) * self._interval
+
+    def next_tick(self, previous, now=None):
+        """Return the first tick after the previous tick that has not yet passed.
+
+        Ticks missed because of a late wakeup are skipped, not fired in a burst.
+        """
+        now = time.time() if now is None else now
+        tick = previous + self._interval
+        if tick <= now:
+            tick += math.ceil((now - tick) / self._interval) * self._interval
+            if tick <= now:
+                tick += self._interval
+        return tick
+
+    def phase_offset(self, name):
+        """Return a deterministic phase offset in seconds for a node name.
+
+        Offsets stay the same between runs, so samples of a node keep their position within the interval.
+        """
+        if self._phase_spread <= 0:
+            return 0.0
+        fraction = (zlib.crc32(name.encode()) % 10000) / 10000.0
+        return fraction * self._phase_spread * self._interval
+
+    @staticmethod
+    def wait_until(deadline, stop_event):
+        """Wait until deadline (epoch seconds) or until stop_event is set. Return True if stop_event was set."""
+        return stop_event.wait(timeout=max(0.0, deadline - time.time()))
+
+
+class SourceSchedule:
+    """Tracks which metric sources are due, each source with its own interval.
+
+    A source is due once per window of its interval. Windows are whole multiples of
+    the interval since the epoch, so a source with a 60 s interval is collected on the
+    first tick of every minute. A source that was not collected successfully stays due
+    on the following ticks of its window.
+    """
+
+    def __init__(self, intervals):
+        """Initialize with an iterable of (name, interval in seconds) pairs. Order of names is kept."""
+        self._intervals = [(name, float(interval)) for name, interval in intervals]
+        self._windows = {}
+
+    @property
+    def intervals(self):
+        """Public access for the (name, interval) pairs."""
+        return self._intervals
+
+    def due(self, scheduled_time=None):
+        """Return the names of the sources due at scheduled_time.
+
+        Sources stay due until mark_collected is called for their window.
+        """
+        scheduled_time = time.time() if scheduled_time is None else scheduled_time
+        return [name for name, interval in self._intervals
+                if self._windows.get(name) != self._window(scheduled_time, interval)]
+
+    def mark_collected(self, names, scheduled_time=None):
+        """Mark the window of scheduled_time collected for the given sources."""
+        scheduled_time = time.time() if scheduled_time is None else scheduled_time
+        for name, interval in self._intervals:
+            if name in names:
+                self._windows[name] = self._window(scheduled_time, interval)
+
+    @staticmethod
+    def _window(scheduled_time, interval):
+        """Return the window of scheduled_time for a source interval."""
+        return math.floor(scheduled_time / interval) if interval > 0 else scheduled_time
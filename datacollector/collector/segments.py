@@ -0,0 +1,255 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Rotated segments of a node data file and their manifest.
+
+The active segment keeps the name of the data file, <host>.json. A rotated
+segment is renamed to <host>.<sequence>.json and compressed in the
+background to <host>.<sequence>.json.gz or .json.xz. The manifest
+<host>.manifest.json lists the rotated segments in order:
+
+{"segments": [{"sequence": 1, "file": "host.000001.json.gz", "start": "2021-05-04T10:00:00.123456",
+               "end": "2021-05-04T10:59:59.456789", "samples": 3600, "offset": 0, "bytes": 7340032}]}
+
+start and end are the timestamps of the first and last sample. offset and
+bytes locate the uncompressed segment within the whole data of the node.
+Readers can skip the segments outside a requested time range.
+"""
+import gzip
+import json
+import logging
+import lzma
+import os
+import queue
+import shutil
+import threading
+import weakref
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "lzma": ".xz"}
+MANIFEST_SUFFIX = ".manifest.json"
+SEGMENT_SUFFIX = ".json"
+
+
+class SegmentException(Exception):
+    """Raised when a segment or the manifest cannot be read or written."""
+
+
+def segment_name(name, sequence):
+    """Return the file name of a rotated segment of the data file <name>.json."""
+    return "{}.{:06d}{}".format(name, sequence, SEGMENT_SUFFIX)
+
+
+def open_segment(path):
+    """Open a segment for reading text, decompressing it by its suffix."""
+    if path.endswith(COMPRESSION_SUFFIXES["gzip"]):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(COMPRESSION_SUFFIXES["lzma"]):
+        return lzma.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_data_lines(directory, name, start=None, end=None):
+    """Yield the lines of the data file <name>.json of a node in order, rotated segments first.
+
+    Segments whose samples all lie before start or after end (ISO timestamps) are skipped.
+    The lines of the segments read are not filtered.
+    """
+    for segment in SegmentManifest.load(directory, name):
+        if start is not None and segment["end"] is not None and segment["end"] < start:
+            continue
+        if end is not None and segment["start"] is not None and segment["start"] > end:
+            continue
+        path = _existing_segment(os.path.join(directory, segment["file"]))
+        if path is None:
+            logging.getLogger('__collector__').warning("Segment %s is missing.", segment["file"])
+            continue
+        with open_segment(path) as file:
+            yield from file
+    active = os.path.join(directory, name + SEGMENT_SUFFIX)
+    if os.path.exists(active):
+        with open(active, encoding="utf-8") as file:
+            yield from file
+
+
+def _existing_segment(path):
+    """Return the path of a segment, or of its compressed file if it was compressed after the manifest was read."""
+    for candidate in [path] + [path + suffix for suffix in COMPRESSION_SUFFIXES.values()]:
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+class SegmentManifest:
+    """Thread-safe list of the rotated segments of one data file, saved next to it."""
+
+    _open = weakref.WeakValueDictionary()
+    _open_lock = threading.Lock()
+
+    def __init__(self, directory, name):
+        """Initialize. An existing manifest is loaded so that sequences continue after a restart."""
+        self._directory = directory
+        self._name = name
+        self._path = os.path.join(directory, name + MANIFEST_SUFFIX)
+        self._lock = threading.Lock()
+        self._segments = self.load(directory, name)
+
+    @classmethod
+    def open(cls, directory, name):
+        """Return the manifest of the data file <name>.json in directory, shared by its users in the process.
+
+        A manifest written through two instances would lose the entries added through the other one.
+        """
+        path = os.path.abspath(os.path.join(directory, name + MANIFEST_SUFFIX))
+        with cls._open_lock:
+            manifest = cls._open.get(path)
+            if manifest is None:
+                manifest = cls(directory, name)
+                cls._open[path] = manifest
+            return manifest
+
+    @property
+    def path(self):
+        """Public access for path."""
+        return self._path
+
+    @property
+    def directory(self):
+        """Public access for directory."""
+        return self._directory
+
+    @staticmethod
+    def load(directory, name):
+        """Return the segment entries of a manifest, an empty list if there is none."""
+        path = os.path.join(directory, name + MANIFEST_SUFFIX)
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path, encoding="utf-8") as file:
+                return json.load(file)["segments"]
+        except (OSError, ValueError, KeyError) as e:
+            raise SegmentException("Cannot read manifest {}: {}".format(path, str(e)))
+
+    def segments(self):
+        """Return a copy of the segment entries."""
+        with self._lock:
+            return [dict(segment) for segment in self._segments]
+
+    def add(self, start, end, samples, size):
+        """Add a rotated segment after the last one and save the manifest. Return its entry."""
+        with self._lock:
+            sequence = self._segments[-1]["sequence"] + 1 if self._segments else 1
+            offset = self._segments[-1]["offset"] + self._segments[-1]["bytes"] if self._segments else 0
+            entry = {"sequence": sequence, "file": segment_name(self._name, sequence), "start": start, "end": end,
+                     "samples": samples, "offset": offset, "bytes": size}
+            self._segments.append(entry)
+            self._save()
+            return dict(entry)
+
+    def replace_file(self, sequence, file):
+        """Point a segment entry to a new file, e.g. after compression, and save the manifest."""
+        with self._lock:
+            for segment in self._segments:
+                if segment["sequence"] == sequence:
+                    segment["file"] = file
+            self._save()
+
+    def _save(self):
+        """Write the manifest atomically. Hold the lock."""
+        temporary = self._path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({"segments": self._segments}, file)
+        os.replace(temporary, self._path)
+
+
+class SegmentCompressor:
+    """Compresses rotated segments in a background thread, one at a time.
+
+    The thread runs while segments are queued and ends when the queue is empty.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._queued = set()
+        self._compressed = 0
+
+    @classmethod
+    def shared(cls):
+        """Return the process-wide compressor instance."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @property
+    def compressed(self):
+        """Number of segments compressed."""
+        return self._compressed
+
+    @property
+    def pending(self):
+        """Number of segments waiting for compression."""
+        return self._queue.qsize()
+
+    def submit(self, manifest, segment, compression, level=6):
+        """Queue a segment entry of a manifest for compression with gzip or lzma. A segment is queued only once."""
+        if compression not in COMPRESSION_SUFFIXES:
+            raise SegmentException("Unknown compression: {}".format(compression))
+        key = (manifest.path, segment["sequence"])
+        with self._lock:
+            if key in self._queued:
+                return
+            self._queued.add(key)
+            self._queue.put((manifest, segment, compression, level))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="SegmentCompressor", daemon=True)
+                self._thread.start()
+
+    def join(self):
+        """Wait until all queued segments have been compressed and the thread has ended."""
+        self._queue.join()
+        with self._lock:
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _run(self):
+        """Compress queued segments until the queue is empty."""
+        while True:
+            with self._lock:
+                try:
+                    manifest, segment, compression, level = self._queue.get_nowait()
+                except queue.Empty:
+                    self._thread = None
+                    return
+            try:
+                self._compress(manifest, segment, compression, level)
+            except (OSError, SegmentException) as e:
+                logging.getLogger('__collector__').warning("Failed to compress segment %s: %s", segment["file"],
+                                                           str(e))
+            finally:
+                with self._lock:
+                    self._queued.discard((manifest.path, segment["sequence"]))
+                self._queue.task_done()
+
+    def _compress(self, manifest, segment, compression, level):
+        """Compress a segment to a temporary file, then replace the plain segment with it."""
+        source = os.path.join(manifest.directory, segment["file"])
+        target = source + COMPRESSION_SUFFIXES[compression]
+        temporary = target + ".tmp"
+        if compression == "gzip":
+            output = gzip.open(temporary, "wb", compresslevel=level)
+        else:
+            output = lzma.open(temporary, "wb", preset=level)
+        with open(source, "rb") as file, output:
+            shutil.copyfileobj(file, output, 1024 * 1024)
+        os.replace(temporary, target)
+        manifest.replace_file(segment["sequence"], os.path.basename(target))
+        os.remove(source)
+        self._compressed += 1
@@ -0,0 +1,195 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Process-wide pool of authenticated SSH transports.
+
+Connections to the same (hostname, port, username) with the same credentials
+share one paramiko.SSHClient. Every command runs on its own channel of the
+shared transport, so several collectors and metric types for a host pay the
+SSH handshake only once. Released transports stay open for an idle timeout
+and are reused by later connections, e.g. after an Agent restart.
+
+A transport that failed is invalidated: later acquires open a new one, and
+the failed one is closed when its last holder releases it.
+"""
+import atexit
+import hashlib
+import logging
+import time
+from threading import Lock
+
+import paramiko
+
+
+class _PoolEntry:
+    """Shared client and reference count for a single pool key."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.client = None
+        self.refs = 0
+        self.released_at = None
+        self.stale = False
+
+    def is_active(self):
+        """Check if the client has an active transport."""
+        if self.client is None:
+            return False
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def close(self):
+        """Close the client."""
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+
+class SshTransportPool:
+    """Pool of SSH clients keyed by (hostname, port, username, credential fingerprint)."""
+
+    _shared = None
+    _shared_refs = 0
+    _shared_lock = Lock()
+
+    def __init__(self, idle_timeout=300):
+        """Initialize pool. Idle timeout is given in seconds."""
+        self._idle_timeout = idle_timeout
+        self._lock = Lock()
+        self._entries = {}
+        self._stale = []
+
+    @classmethod
+    def shared(cls):
+        """Return the process-wide pool instance and add a reference to it. Pair each call with release_shared()."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+                atexit.register(cls._shared.close_idle)
+            cls._shared_refs += 1
+            return cls._shared
+
+    @classmethod
+    def release_shared(cls):
+        """Remove a reference to the process-wide pool. The last one closes the transports that have no holders."""
+        with cls._shared_lock:
+            cls._shared_refs = max(cls._shared_refs - 1, 0)
+            if cls._shared_refs or cls._shared is None:
+                return
+            pool = cls._shared
+        pool.close_idle()
+
+    @property
+    def idle_timeout(self):
+        """Public access for idle_timeout."""
+        return self._idle_timeout
+
+    @idle_timeout.setter
+    def idle_timeout(self, value):
+        """Setter for idle_timeout."""
+        self._idle_timeout = value
+
+    @staticmethod
+    def key(hostname, port, username, password=None, pkey=None):
+        """Create a pool key. Connections with other credentials for the same user get their own transport.
+
+        The credentials are kept only as a SHA-256 fingerprint.
+        """
+        digest = hashlib.sha256()
+        digest.update((password or "").encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(pkey.asbytes() if pkey is not None else b"")
+        return hostname, int(port), username, digest.hexdigest()
+
+    def acquire(self, key, **connect_kwargs):
+        """Return a connected client for the key, connecting with connect_kwargs if needed.
+
+        Each acquire must be paired with a release.
+        """
+        self._reap_idle()
+        while True:
+            with self._lock:
+                entry = self._entries.setdefault(key, _PoolEntry())
+            with entry.lock:
+                if self._entries.get(key) is entry:
+                    return self._acquire_entry(key, entry, connect_kwargs)
+
+    @staticmethod
+    def _acquire_entry(key, entry, connect_kwargs):
+        """Connect the entry if needed and add a reference. Called with entry lock held."""
+        if not entry.is_active():
+            entry.close()
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            hostname, port, username, _ = key
+            client.connect(hostname=hostname, port=port, username=username, **connect_kwargs)
+            entry.client = client
+            logging.getLogger('__collector__').info("Opened pooled SSH transport to %s:%s", hostname, port)
+        entry.refs += 1
+        entry.released_at = None
+        return entry.client
+
+    def release(self, key, client=None):
+        """Release a client acquired for the key. The transport is kept open until idle timeout.
+
+        client is the client returned by acquire, needed to release a client invalidated in the meantime.
+        An invalidated client is closed by its last release.
+        """
+        with self._lock:
+            entry = next((stale for stale in self._stale if client is not None and stale.client is client),
+                         self._entries.get(key))
+        if entry is None:
+            return
+        with entry.lock:
+            entry.refs = max(entry.refs - 1, 0)
+            if entry.refs > 0:
+                return
+            entry.released_at = time.monotonic()
+            if entry.stale:
+                entry.close()
+        if entry.stale:
+            with self._lock:
+                if entry in self._stale:
+                    self._stale.remove(entry)
+
+    def invalidate(self, key, client=None):
+        """Stop handing out the shared client of the key, e.g. after its transport has failed.
+
+        The next acquire opens a new transport. The invalidated client stays open for its other holders until
+        the last of them releases it. client is the client returned by acquire; if the key already has another
+        client, it is left alone.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (client is not None and entry.client is not client):
+                return
+            del self._entries[key]
+            self._stale.append(entry)
+        with entry.lock:
+            entry.stale = True
+            if entry.refs > 0:
+                return
+            entry.close()
+        with self._lock:
+            self._stale.remove(entry)
+
+    def close_idle(self):
+        """Close all transports that have no holders."""
+        self._reap_idle(idle_timeout=0)
+
+    def _reap_idle(self, idle_timeout=None):
+        """Close and remove entries that have been unused longer than the idle timeout."""
+        if idle_timeout is None:
+            idle_timeout = self._idle_timeout
+        now = time.monotonic()
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.refs == 0 and entry.released_at is not None and now - entry.released_at >= idle_timeout:
+                    if entry.lock.acquire(blocking=False):
+                        try:
+                            entry.close()
+                            del self._entries[key]
+                        finally:
+                            entry.lock.release()
@@ -4,14 +4,19 @@
 # SPDX-License-Identifier: Apache-2.0
 
 """Class to handle connection related information and functions."""
+import codecs
 import io
+import logging
 import platform
 import socket
 import subprocess
+import time
+import zlib
 
 import paramiko
 
 from datacollector.collector.iconnection import IConnection
+from datacollector.collector.reconnect_policy import BackoffPolicy
 
 
 class TerminalConnectionException(Exception):
@@ -22,16 +27,36 @@ class TooManyRetriesException(Exception):
     """This exception is raised when there is error with ssh connection."""
 
 
+COMPRESSORS = {"gzip": "gzip -c -{level}"}
+
+
 class SshConnection(IConnection):
     """Provides terminal and some functionality for specific node."""
 
-    def __init__(self, hostname, port, username, password, pkey=None):
-        """Initialize."""
+    def __init__(self, hostname, port, username, password, pkey=None, pool=None, retries=4, backoff=None,
+                 compression=None, compression_level=1):
+        """Initialize.
+
+        If an SshTransportPool is given, the SSH client is shared with other connections
+        to the same hostname, port and username with the same credentials.
+        Connect makes up to retries attempts, waiting for the delays of backoff (a BackoffPolicy) in between.
+        With compression (e.g. "gzip"), command output is compressed on the node if the compressor
+        is found there, and decompressed while it is received.
+        """
         super().__init__(hostname, port, username, password, pkey=None)
-        self._ssh_client = paramiko.SSHClient()
-        self._ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self._pool = pool
+        self._pool_key = None
+        self._ssh_client = None
+        if pool is None:
+            self._ssh_client = paramiko.SSHClient()
+            self._ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         self._transport = None
-        self._retries = 4
+        self._retries = retries
+        self._backoff = backoff if backoff is not None else BackoffPolicy(base=0.5, cap=8.0)
+        self._compression = compression if compression in COMPRESSORS else None
+        self._compression_level = compression_level
+        self._compress = False
+        self._compressor_checked = False
 
     @property
     def hostname(self):
@@ -48,6 +73,11 @@ class SshConnection(IConnection):
         """Public access for password."""
         return self._password
 
+    @property
+    def compressed(self):
+        """Check if command output is compressed on the node."""
+        return self._compress
+
     def is_active(self):
         """Check if transport is active."""
         return self._transport.is_active()
@@ -78,8 +108,13 @@ class SshConnection(IConnection):
             return False
 
     def close_session(self):
-        """Close the ssh connection."""
-        self._ssh_client.close()
+        """Close the ssh connection. A pooled connection releases its shared client instead."""
+        if self._pool_key is not None:
+            self._pool.release(self._pool_key, self._ssh_client)
+            self._pool_key = None
+            self._ssh_client = None
+        elif self._ssh_client is not None:
+            self._ssh_client.close()
 
     def execute(self, command):
         """Wrap the execution function."""
@@ -89,19 +124,21 @@ class SshConnection(IConnection):
             raise e
 
     def connect(self, via=None):
-        """Handle connecting and reconnecting."""
-        while self._retries > 0:
-            self._retries = self._retries - 1
+        """Handle connecting and reconnecting. Attempts are separated by jittered exponential backoff."""
+        for attempt in range(self._retries):
+            if attempt > 0:
+                time.sleep(self._backoff.delay(attempt - 1))
             try:
                 self._open_session(via)
                 if self.test_connection():
                     self._transport = self._ssh_client.get_transport()
-                    self._retries = 4
+                    self._detect_compressor()
                     return
                 else:
-                    pass
-            except socket.timeout:
-                pass
+                    self._discard_session()
+            except (socket.timeout, TerminalConnectionException) as e:
+                if attempt == self._retries - 1:
+                    raise TooManyRetriesException(str(e))
 
         raise TooManyRetriesException
 
@@ -113,24 +150,32 @@ class SshConnection(IConnection):
     def _open_session(self, via=None):
         """Opens ssh channel, either directly or via an open channel.
         Chooses password or private key for authentication.
+        Direct connections are taken from the pool when one is given.
         """
         try:
             if via is None:
-                self._ssh_client.connect(hostname=self._hostname, port=self._port,
-                                         username=self._username, password=self._password,
-                                         timeout=5, allow_agent=False, look_for_keys=False)
+                connect_kwargs = dict(password=self._password, timeout=5, allow_agent=False, look_for_keys=False)
             else:
                 if self._key is not None:
-                    self._ssh_client.connect(hostname=self._hostname, port=self._port,
-                                             username=self._username, pkey=self._key,
-                                             timeout=5, allow_agent=False, look_for_keys=False, sock=via)
+                    connect_kwargs = dict(pkey=self._key, timeout=5, allow_agent=False, look_for_keys=False,
+                                          sock=via)
                 else:
                     if self._password is not None:
-                        self._ssh_client.connect(hostname=self._hostname, port=self._port,
-                                                 username=self._username, password=self._password,
-                                                 timeout=5, allow_agent=False, look_for_keys=False, sock=via)
+                        connect_kwargs = dict(password=self._password, timeout=5, allow_agent=False,
+                                              look_for_keys=False, sock=via)
                     else:
                         raise paramiko.ssh_exception.AuthenticationException
+            if self._pool is not None and via is None:
+                self.close_session()
+                key = self._pool.key(self._hostname, self._port, self._username, self._password)
+                self._ssh_client = self._pool.acquire(key, **connect_kwargs)
+                self._pool_key = key
+            else:
+                if self._ssh_client is None:
+                    self._ssh_client = paramiko.SSHClient()
+                    self._ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                self._ssh_client.connect(hostname=self._hostname, port=self._port, username=self._username,
+                                         **connect_kwargs)
         except (TimeoutError, socket.error):
             raise TerminalConnectionException("Timeout when connecting with ssh to {ip}".format(ip=self._hostname))
         except (
@@ -144,6 +189,27 @@ class SshConnection(IConnection):
         except Exception as e:
             raise TerminalConnectionException("Error when opening channel to target. Error:" + str(e))
 
+    def _detect_compressor(self):
+        """Check once whether the configured compressor exists on the node. Fall back to plain output if not."""
+        if self._compression is None or self._compressor_checked:
+            return
+        try:
+            found = self._read_output("command -v {}".format(self._compression))
+        except Exception as e:
+            logging.getLogger('__collector__').warning("%s compressor detection failed: %s", self._hostname, str(e))
+            return
+        self._compressor_checked = True
+        self._compress = bool(found)
+        if not self._compress:
+            logging.getLogger('__collector__').warning("%s has no %s, receiving plain output.", self._hostname,
+                                                       self._compression)
+
+    def _discard_session(self):
+        """Drop a session that failed the connection test so the next attempt opens a new transport."""
+        if self._pool_key is not None:
+            self._pool.invalidate(self._pool_key, self._ssh_client)
+            self.close_session()
+
     def _ping_via_open_channel(self, ip_address):
         """Send ping command through open channel. Returns boolean."""
         output = self._execute_command("ping -c 1 -w 1 %s" % ip_address)
@@ -162,9 +228,107 @@ class SshConnection(IConnection):
         except Exception:
             return False
 
+    def open_stream(self, command):
+        """Start a long-running command on its own channel and return the channel."""
+        channel = self._ssh_client.get_transport().open_session()
+        channel.exec_command(command)
+        return channel
+
     def _execute_command(self, command):
-        """Execute command on the remote host."""
+        """Execute command on the remote host.
+
+        Compressed output that cannot be decompressed disables compression and runs the command again uncompressed.
+        """
+        if not self._compress:
+            return self._read_output(command)
+        try:
+            return self._read_output(self._compressed_command(command), zlib.decompressobj(16 + zlib.MAX_WBITS))
+        except zlib.error as e:
+            self._disable_compression(e)
+            return self._read_output(command)
+
+    def execute_lines(self, command):
+        """Execute command on the remote host and yield its output lines as they are received.
+
+        Invalid compressed output before the first line falls back to uncompressed output like execute().
+        Later it disables compression and raises zlib.error, as the lines already yielded cannot be taken back.
+        """
+        if not self._compress:
+            yield from self._iter_output(command)
+            return
+        started = False
+        try:
+            for line in self._iter_output(self._compressed_command(command), zlib.decompressobj(16 + zlib.MAX_WBITS)):
+                started = True
+                yield line
+        except zlib.error as e:
+            self._disable_compression(e)
+            if started:
+                raise
+            yield from self._iter_output(command)
+
+    def _compressed_command(self, command):
+        """Return the command with its output piped through the compressor."""
+        return "({}) | {}".format(command, COMPRESSORS[self._compression].format(level=self._compression_level))
+
+    def _disable_compression(self, error):
+        """Receive plain output from now on."""
+        logging.getLogger('__collector__').warning("%s compressed output is invalid (%s), receiving plain output.",
+                                                   self._hostname, str(error))
+        self._compress = False
+
+    def _read_output(self, command, decompressor=None):
+        """Run command and read its output in chunks as they arrive, decompressing them if a decompressor is given.
+
+        Return the output lines. Received bytes are added to the payload counters.
+        """
+        return list(self._iter_output(command, decompressor))
+
+    def _iter_output(self, command, decompressor=None):
+        """Run command and yield complete output lines as the chunks containing them arrive.
+
+        Only the last incomplete line is kept between chunks. Received bytes are added to the payload counters
+        when the output ends or the reader stops early, in which case the channel is closed.
+        """
         stdin, stdout, stderr = self._ssh_client.exec_command(command)
-        stdout.channel.recv_exit_status()
-        output = stdout.readlines()
-        return output
+        channel = stdout.channel
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        received = 0
+        decoded = 0
+        finished = False
+        try:
+            while True:
+                chunk = channel.recv(32768)
+                if not chunk:
+                    break
+                received += len(chunk)
+                if decompressor is not None:
+                    chunk = decompressor.decompress(chunk)
+                decoded += len(chunk)
+                lines = (pending + decoder.decode(chunk)).split("\n")
+                pending = lines.pop()
+                for line in lines:
+                    yield line + "\n"
+            tail = b""
+            if decompressor is not None:
+                tail = decompressor.flush()
+                decoded += len(tail)
+            yield from self._split_lines(pending + decoder.decode(tail, final=True))
+            channel.recv_exit_status()
+            finished = True
+        finally:
+            self.count_payload(received, decoded)
+            if not finished:
+                channel.close()
+
+    @staticmethod
+    def _split_lines(text):
+        """Split text into lines keeping the line endings, like readlines."""
+        if not text:
+            return []
+        lines = [line + "\n" for line in text.split("\n")]
+        last = lines.pop()
+        if last != "\n":
+            lines.append(last[:-1])
+        return lines
@@ -0,0 +1,114 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Functionality for push mode collection over a single long-lived remote process.
+
+The remote process runs a BatchedCommand in a loop and prints a frame marker line
+after every snapshot. The output is consumed incrementally and split into frames.
+"""
+import codecs
+import logging
+import socket
+import time
+from datetime import datetime
+
+from datacollector.collector.batched_command import BatchFramingException
+
+FRAME_END = "#DC-FRAME"
+
+
+class StreamClosedException(Exception):
+    """Raised when the remote sampler stream has ended or stopped sending data."""
+
+
+class Frame:
+    """One framed snapshot received from the remote sampler."""
+
+    __slots__ = ("timestamp", "sections")
+
+    def __init__(self, timestamp, sections):
+        self.timestamp = timestamp
+        self.sections = sections
+
+
+class StreamSampler:
+    """Starts the remote sampler loop on a connection and yields frames from its output."""
+
+    def __init__(self, connection, batch, interval_ms, dead_timeout=None):
+        """Initialize sampler.
+
+        dead_timeout is the time in seconds without any output after which the
+        stream is considered dead. Defaults to three sampling intervals, at least 5 seconds.
+        """
+        self._connection = connection
+        self._batch = batch
+        self._interval_ms = interval_ms
+        if dead_timeout is None:
+            dead_timeout = max(3 * interval_ms / 1000.0, 5.0)
+        self._dead_timeout = dead_timeout
+        self._channel = None
+        self._frames_skipped = 0
+
+    @property
+    def command(self):
+        """Public access for the remote sampler loop command."""
+        return "while :; do {batch}; echo '{frame}'; sleep {interval}; done".format(
+            batch=self._batch.command, frame=FRAME_END, interval=self._interval_ms / 1000.0)
+
+    @property
+    def frames_skipped(self):
+        """Number of frames skipped because their sections could not be split."""
+        return self._frames_skipped
+
+    def start(self):
+        """Start the remote sampler process."""
+        self._channel = self._connection.open_stream(self.command)
+        self._channel.settimeout(min(1.0, self._dead_timeout))
+
+    def close(self):
+        """Stop the remote sampler process by closing its channel."""
+        if self._channel is not None:
+            try:
+                self._channel.close()
+            except Exception as e:
+                logging.getLogger('__collector__').debug("Failed to close sampler channel: %s", str(e))
+            self._channel = None
+
+    def frames(self, stop_event):
+        """Yield Frame-objects as they arrive until stop_event is set.
+
+        Raise StreamClosedException if the remote process exits or stays silent
+        longer than the dead timeout. A frame with broken section framing is logged and skipped.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        lines = []
+        last_data = time.monotonic()
+        while not stop_event.is_set():
+            try:
+                chunk = self._channel.recv(32768)
+            except socket.timeout:
+                if time.monotonic() - last_data > self._dead_timeout:
+                    raise StreamClosedException("No data from sampler in {}s".format(self._dead_timeout))
+                continue
+            if not chunk:
+                raise StreamClosedException("Sampler stream closed by remote host")
+            last_data = time.monotonic()
+            self._connection.count_payload(len(chunk))
+            pending += decoder.decode(chunk)
+            *complete, pending = pending.split("\n")
+            for line in complete:
+                if line == FRAME_END:
+                    try:
+                        sections = self._batch.split(lines)
+                    except BatchFramingException as e:
+                        self._frames_skipped += 1
+                        logging.getLogger('__collector__').warning("%s skipped sampler frame: %s",
+                                                                   self._connection.hostname, str(e))
+                    else:
+                        yield Frame(datetime.utcnow().isoformat(), sections)
+                    lines = []
+                else:
+                    lines.append(line + "\n")
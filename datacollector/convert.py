@@ -0,0 +1,63 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Script for converting JSON data files of a collection run to columnar stores.
+
+The cpu and memory series of each <host>.json, including its rotated
+segments, are written to <host>.columns next to it. The JSON files are kept.
+
+Example:
+python -m datacollector.convert datacollector/data/Datacollector_022_2020-11-24T08-57-20 --hosts node1 node2
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import time
+
+from datacollector.collector.columnar_store import COLUMNS_SUFFIX, convert_json
+from datacollector.collector.segments import MANIFEST_SUFFIX, iter_data_lines
+
+SEGMENT_PATTERN = re.compile(r"\.\d{6}\.json$")
+
+
+def data_file_names(folder):
+    """Return the host names of the data files in a run folder."""
+    names = set()
+    for entry in os.listdir(folder):
+        if entry.endswith(MANIFEST_SUFFIX):
+            names.add(entry[:-len(MANIFEST_SUFFIX)])
+        elif entry.endswith(".json") and not SEGMENT_PATTERN.search(entry):
+            names.add(entry[:-len(".json")])
+    return sorted(names)
+
+
+def parse_arguments():
+    """Parse converter arguments."""
+    parser = argparse.ArgumentParser(description='Convert JSON data files to columnar stores.')
+    parser.add_argument('folder', help='Folder of a collection run.')
+    parser.add_argument('--hosts', nargs='+', help='Hosts to convert, all by default.')
+    parser.add_argument('--force', action='store_true', help='Replace existing columnar stores.')
+    return parser.parse_args()
+
+
+def main():
+    """Convert the data files and print the samples converted per host."""
+    args = parse_arguments()
+    for name in args.hosts or data_file_names(args.folder):
+        target = os.path.join(args.folder, name + COLUMNS_SUFFIX)
+        if os.path.exists(target):
+            if not args.force:
+                print("{}: {} exists, skipped. Use --force to replace it.".format(name, target), file=sys.stderr)
+                continue
+            shutil.rmtree(target)
+        begin = time.monotonic()
+        converted = convert_json(iter_data_lines(args.folder, name), target)
+        print("{}: {} samples in {:.1f} s".format(name, converted, time.monotonic() - begin))
+
+
+if __name__ == "__main__":
+    main()
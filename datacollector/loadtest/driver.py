@@ -0,0 +1,185 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Load test driver running an Agent against a local emulated device fleet.
+
+The LoadTestServer runs in a separate process, so the measured CPU usage is
+that of the collector only. The full collection pipeline is used: SSH
+connections, batched commands, MemCpuRecord and the data files. Indexing to
+Elasticsearch is disabled unless --elastic is given.
+
+Reports startup time, achieved samples per second, collection latency
+percentiles, collector CPU usage, the number of nodes a single fully used
+core could sustain, and reconnect counts under fault injection.
+
+Example:
+python -m datacollector.loadtest.driver --devices 100 500 --interval 1 --duration 60 --disconnect-rate 0.001
+"""
+import argparse
+import csv
+import logging
+import multiprocessing
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from datacollector.collector.agent import Agent
+from datacollector.collector.collector_config_parser import CollectorConfig
+from datacollector.collector.inventory import NodeStatus
+from datacollector.loadtest.ssh_server import PASSWORD, FaultProfile, LoadTestServer, add_fault_arguments
+
+
+def _serve(devices, fault_settings, ports, stop_event, results):
+    """Run a LoadTestServer in a separate process until stop_event is set."""
+    logging.basicConfig(level=logging.ERROR)
+    server = LoadTestServer(devices, faults=FaultProfile(**fault_settings))
+    server.start()
+    ports.put(server.port)
+    stop_event.wait()
+    results.put(server.counters())
+    server.stop()
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile of a list of values, None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))]
+
+
+def _write_inventory(directory, port, names):
+    """Write a csv inventory of the emulated devices. Return its path."""
+    path = os.path.join(directory, "loadtest_inventory.csv")
+    with open(path, "w", newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["name", "hostname", "port", "username", "password"])
+        for name in names:
+            writer.writerow([name, "127.0.0.1", port, name, PASSWORD])
+    return path
+
+
+def _remove_data(run_id):
+    """Remove the data folders written by the node collectors of a run."""
+    data = pathlib.Path(__file__).parent.parent.absolute() / "data"
+    for folder in data.glob(run_id + "_*"):
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def run_load_test(devices, engine, interval, duration, fault_settings, collect_mode="poll", compression="none",
+                  elastic=False, startup_timeout=300.0, keep_data=False):
+    """Run an Agent against an emulated fleet of the given size. Return a dict of measurements."""
+    context = multiprocessing.get_context("spawn")
+    ports = context.Queue()
+    results = context.Queue()
+    stop_server = context.Event()
+    server = context.Process(target=_serve, args=(devices, fault_settings, ports, stop_server, results), daemon=True)
+    server.start()
+    port = ports.get(timeout=120)
+
+    directory = tempfile.mkdtemp(prefix="dc_loadtest_")
+    run_id = "LoadTest_" + datetime.strftime(datetime.utcnow(), "%Y-%m-%dT%H-%M-%S") + "_" + engine
+    config = CollectorConfig('collector')
+    config.update(engine=engine, collect_mode=collect_mode, compression=compression, index_to_elastic=elastic,
+                  inventory_file=_write_inventory(directory, port, ["device-{}".format(n) for n in range(devices)]))
+    agent = Agent(datetime.now(), datetime.utcnow() + timedelta(days=1), interval, run_id, config)
+    try:
+        startup_begin = time.monotonic()
+        agent.start()
+        collectors = []
+        while time.monotonic() - startup_begin < startup_timeout:
+            collectors = agent.adapter.node_collectors if agent.adapter is not None else []
+            if len(collectors) == devices and all(collector.samples > 0 for collector in collectors):
+                break
+            time.sleep(0.1)
+        startup = time.monotonic() - startup_begin
+
+        samples_begin = {collector: collector.samples for collector in collectors}
+        reconnects_begin = sum(collector.reconnects for collector in collectors)
+        received_begin = sum(collector.connection.payload_received for collector in collectors)
+        peak_threads = threading.active_count()
+        cpu_begin = time.process_time()
+        wall_begin = time.monotonic()
+        while time.monotonic() - wall_begin < duration:
+            time.sleep(0.5)
+            peak_threads = max(peak_threads, threading.active_count())
+        wall = time.monotonic() - wall_begin
+        cpu = time.process_time() - cpu_begin
+
+        latencies = []
+        samples = 0
+        for collector in collectors:
+            count = collector.samples - samples_begin[collector]
+            samples += count
+            if count > 0:
+                latencies.extend(collector.collection_durations()[-count:])
+        reconnects = sum(collector.reconnects for collector in collectors) - reconnects_begin
+        received = sum(collector.connection.payload_received for collector in collectors) - received_begin
+        statuses = agent.adapter.status_counts() if agent.adapter is not None else {}
+        overruns = sum(agent.adapter.overrun_counts().values()) if agent.adapter is not None else 0
+    finally:
+        agent.shutdown()
+        agent.join()
+        stop_server.set()
+        shutil.rmtree(directory, ignore_errors=True)
+        if not keep_data:
+            _remove_data(run_id)
+    server_counters = results.get(timeout=30)
+    server.join(timeout=30)
+
+    rate = samples / wall
+    expected = devices / interval
+    cpu_fraction = cpu / wall
+    return {"engine": engine, "devices": devices, "startup": startup, "rate": rate, "expected": expected,
+            "p50": (percentile(latencies, 0.5) or 0) * 1000, "p90": (percentile(latencies, 0.9) or 0) * 1000,
+            "p99": (percentile(latencies, 0.99) or 0) * 1000, "max": max(latencies, default=0) * 1000,
+            "cpu": cpu_fraction * 100, "threads": peak_threads,
+            "nodes_per_core": (rate * interval) / cpu_fraction if cpu_fraction > 0 else float("inf"),
+            "bytes_per_sample": received / samples if samples else 0, "overruns": overruns,
+            "reconnects": reconnects, "disconnects": server_counters["disconnects"],
+            "running": statuses.get(NodeStatus.RUNNING, 0), "server": server_counters}
+
+
+def parse_arguments():
+    """Parse load test arguments."""
+    parser = argparse.ArgumentParser(description='Run the collector against an emulated device fleet.')
+    parser.add_argument('--devices', type=int, nargs='+', default=[100], help='Fleet sizes.')
+    parser.add_argument('--engines', nargs='+', default=["threaded"], help='Engines to run.')
+    parser.add_argument('--interval', type=float, default=1.0, help='Collect interval in seconds.')
+    parser.add_argument('--duration', type=float, default=30.0, help='Measurement duration in seconds.')
+    parser.add_argument('--collect-mode', default="poll", help='poll or stream.')
+    parser.add_argument('--compression', default="none", help='none or gzip.')
+    parser.add_argument('--elastic', action='store_true', help='Index samples to Elasticsearch.')
+    parser.add_argument('--keep-data', action='store_true', help='Keep the data files written by the run.')
+    parser.add_argument('--startup-timeout', type=float, default=300.0, help='Maximum time to wait for startup.')
+    add_fault_arguments(parser)
+    return parser.parse_args()
+
+
+def main():
+    """Run the load tests and print a result table."""
+    args = parse_arguments()
+    logging.basicConfig(level=logging.ERROR)
+    fault_settings = {"latency": args.latency, "jitter": args.jitter, "bandwidth": args.bandwidth,
+                      "auth_failure_rate": args.auth_failure_rate, "disconnect_rate": args.disconnect_rate,
+                      "truncate_rate": args.truncate_rate, "seed": args.seed}
+    print("{:<9} {:>7} {:>8} {:>10} {:>10} {:>8} {:>8} {:>8} {:>8} {:>6} {:>8} {:>10} {:>9} {:>10} {:>11}".format(
+        "engine", "devices", "startup", "samples/s", "expected/s", "p50 ms", "p90 ms", "p99 ms", "max ms", "cpu%",
+        "threads", "nodes/core", "B/sample", "overruns", "reconn/drops"))
+    for devices in args.devices:
+        for engine in args.engines:
+            result = run_load_test(devices, engine, args.interval, args.duration, fault_settings, args.collect_mode,
+                                   args.compression, args.elastic, args.startup_timeout, args.keep_data)
+            print("{engine:<9} {devices:>7} {startup:>7.1f}s {rate:>10.1f} {expected:>10.1f} {p50:>8.1f} "
+                  "{p90:>8.1f} {p99:>8.1f} {max:>8.1f} {cpu:>6.1f} {threads:>8} {nodes_per_core:>10.0f} "
+                  "{bytes_per_sample:>9.0f} {overruns:>10} {reconnects:>5}/{disconnects:<5}".format(**result))
+
+
+if __name__ == "__main__":
+    main()
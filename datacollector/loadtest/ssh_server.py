@@ -0,0 +1,294 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Local paramiko SSH server emulating a fleet of devices for load tests.
+
+All devices share one listening port. The username selects the device, so
+every device gets its own SSH transport on the collector side. Commands are
+answered by a SyntheticDevice after the configured latency, at the
+configured bandwidth, and faults are injected with the configured rates.
+
+Example, serving 500 devices on port 2222:
+python -m datacollector.loadtest.ssh_server --devices 500 --port 2222
+"""
+import argparse
+import logging
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import paramiko
+
+from datacollector.collector.stream_sampler import FRAME_END
+from datacollector.loadtest.synthetic_device import SyntheticDevice
+
+DEVICE_PREFIX = "device-"
+PASSWORD = "loadtest"
+STREAM_PREFIX = "while :; do "
+STREAM_SUFFIX = "; sleep "
+
+
+class FaultProfile:
+    """Latency, bandwidth and fault injection settings of the emulated devices."""
+
+    def __init__(self, latency=0.02, jitter=0.0, bandwidth=0, auth_failure_rate=0.0, disconnect_rate=0.0,
+                 truncate_rate=0.0, seed=None):
+        """Initialize profile.
+
+        latency: seconds before a command starts answering. jitter: random extra latency, up to this many seconds.
+        bandwidth: bytes per second per channel, 0 for unlimited.
+        auth_failure_rate: probability that a login fails.
+        disconnect_rate: probability that a command drops the whole connection instead of answering.
+        truncate_rate: probability that a command answers only half of its output and closes the channel.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.auth_failure_rate = auth_failure_rate
+        self.disconnect_rate = disconnect_rate
+        self.truncate_rate = truncate_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def happens(self, rate):
+        """Return True with the given probability."""
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    def delay(self):
+        """Return the latency of one command."""
+        if self.jitter <= 0:
+            return self.latency
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+
+class LoadTestServer:
+    """SSH server answering commands for a number of synthetic devices."""
+
+    def __init__(self, devices, host="127.0.0.1", port=0, faults=None, workers=256, host_key=None):
+        """Initialize server with devices named device-0..n-1. Port 0 picks a free port."""
+        self._devices = {DEVICE_PREFIX + str(n): SyntheticDevice(DEVICE_PREFIX + str(n)) for n in range(devices)}
+        self._host = host
+        self._port = port
+        self._faults = faults if faults is not None else FaultProfile()
+        self._workers = workers
+        self._host_key = host_key if host_key is not None else paramiko.RSAKey.generate(2048)
+        self._socket = None
+        self._executor = None
+        self._stopped = threading.Event()
+        self._transports = set()
+        self._lock = threading.Lock()
+        self._counters = {"connections": 0, "auth_failures": 0, "commands": 0, "disconnects": 0,
+                          "truncated": 0, "bytes_sent": 0}
+
+    @property
+    def port(self):
+        """Port the server listens on."""
+        return self._port
+
+    @property
+    def names(self):
+        """Names of the emulated devices, used as usernames."""
+        return list(self._devices)
+
+    def counters(self):
+        """Return a dict of server side counters."""
+        with self._lock:
+            return dict(self._counters)
+
+    def start(self):
+        """Start listening and accepting connections."""
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self._host, self._port))
+        self._socket.listen(1024)
+        self._socket.settimeout(0.5)
+        self._port = self._socket.getsockname()[1]
+        self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="LoadTestCommand")
+        threading.Thread(target=self._accept, name="LoadTestAccept", daemon=True).start()
+        logging.info("Load test server emulating %s devices on %s:%s.", len(self._devices), self._host, self._port)
+
+    def stop(self):
+        """Stop accepting connections and close all transports."""
+        self._stopped.set()
+        if self._socket is not None:
+            self._socket.close()
+        with self._lock:
+            transports = list(self._transports)
+        for transport in transports:
+            transport.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def _accept(self):
+        """Accept connections until stopped. Each handshake runs in its own thread."""
+        while not self._stopped.is_set():
+            try:
+                client, _ = self._socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self._handshake, args=(client,), daemon=True).start()
+
+    def _handshake(self, client):
+        """Start an SSH server transport on an accepted socket."""
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self._host_key)
+        try:
+            transport.start_server(server=_DeviceInterface(self, transport))
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            logging.debug("Load test handshake failed: %s", str(e))
+            transport.close()
+            return
+        self._count("connections")
+        with self._lock:
+            self._transports.add(transport)
+
+    def _authenticate(self, username, password):
+        """Return the device of a valid login, None on failure."""
+        device = self._devices.get(username)
+        if device is None or password != PASSWORD or self._faults.happens(self._faults.auth_failure_rate):
+            self._count("auth_failures")
+            return None
+        return device
+
+    def _exec(self, transport, channel, device, command):
+        """Schedule a command. A stream sampler loop gets a thread of its own."""
+        if command.startswith(STREAM_PREFIX):
+            threading.Thread(target=self._serve_stream, args=(channel, device, command), daemon=True).start()
+        else:
+            self._executor.submit(self._serve_command, transport, channel, device, command)
+
+    def _serve_command(self, transport, channel, device, command):
+        """Answer a single command, injecting latency, bandwidth limits and faults."""
+        self._count("commands")
+        try:
+            time.sleep(self._faults.delay())
+            if self._faults.happens(self._faults.disconnect_rate):
+                self._count("disconnects")
+                self._drop(transport)
+                return
+            output, status = device.execute(command)
+            if self._faults.happens(self._faults.truncate_rate):
+                self._count("truncated")
+                self._send(channel, output[:len(output) // 2])
+                channel.close()
+                return
+            self._send(channel, output)
+            channel.send_exit_status(status)
+        except (OSError, EOFError, paramiko.SSHException) as e:
+            logging.debug("Load test command failed: %s", str(e))
+        finally:
+            channel.close()
+
+    def _serve_stream(self, channel, device, command):
+        """Answer a stream sampler loop until the channel is closed."""
+        body = command[len(STREAM_PREFIX):]
+        batch, _, interval = body.rpartition(STREAM_SUFFIX)
+        batch = batch[:-len("; echo '{}'".format(FRAME_END))]
+        interval = float(interval.split(";")[0])
+        try:
+            while not channel.closed and not self._stopped.is_set():
+                output, _ = device.execute(batch)
+                self._send(channel, output + (FRAME_END + "\n").encode())
+                time.sleep(interval)
+        except (OSError, EOFError, paramiko.SSHException) as e:
+            logging.debug("Load test stream ended: %s", str(e))
+        finally:
+            channel.close()
+
+    def _send(self, channel, data):
+        """Send data, limited to the configured bandwidth."""
+        bandwidth = self._faults.bandwidth
+        chunk_size = 32768 if bandwidth <= 0 else max(512, min(32768, int(bandwidth / 10)))
+        for offset in range(0, len(data), chunk_size):
+            chunk = data[offset:offset + chunk_size]
+            channel.sendall(chunk)
+            if bandwidth > 0:
+                time.sleep(len(chunk) / bandwidth)
+        self._count("bytes_sent", len(data))
+
+    def _drop(self, transport):
+        """Close a whole connection, as if the link was lost."""
+        with self._lock:
+            self._transports.discard(transport)
+        transport.close()
+
+
+class _DeviceInterface(paramiko.ServerInterface):
+    """Server side of one SSH connection."""
+
+    def __init__(self, server, transport):
+        self._server = server
+        self._transport = transport
+        self._device = None
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        self._device = self._server._authenticate(username, password)
+        return paramiko.AUTH_SUCCESSFUL if self._device is not None else paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        self._server._exec(self._transport, channel, self._device, command.decode("utf-8", errors="replace"))
+        return True
+
+
+def add_fault_arguments(parser):
+    """Add latency, bandwidth and fault injection arguments to an argument parser."""
+    parser.add_argument('--latency', type=float, default=0.02, help='Command latency in seconds.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra command latency in seconds.')
+    parser.add_argument('--bandwidth', type=float, default=0, help='Bytes per second per channel, 0 for unlimited.')
+    parser.add_argument('--auth-failure-rate', type=float, default=0.0, help='Probability of a failed login.')
+    parser.add_argument('--disconnect-rate', type=float, default=0.0,
+                        help='Probability of a command dropping the connection.')
+    parser.add_argument('--truncate-rate', type=float, default=0.0,
+                        help='Probability of a command answering truncated output.')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for fault injection.')
+
+
+def fault_profile(args):
+    """Create a FaultProfile from parsed arguments."""
+    return FaultProfile(args.latency, args.jitter, args.bandwidth, args.auth_failure_rate, args.disconnect_rate,
+                        args.truncate_rate, args.seed)
+
+
+def main():
+    """Serve devices until interrupted."""
+    parser = argparse.ArgumentParser(description='Emulate a fleet of devices over SSH.')
+    parser.add_argument('--devices', type=int, default=100, help='Number of devices.')
+    parser.add_argument('--host', default="127.0.0.1", help='Listening address.')
+    parser.add_argument('--port', type=int, default=2222, help='Listening port.')
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = LoadTestServer(args.devices, args.host, args.port, fault_profile(args))
+    server.start()
+    try:
+        while True:
+            time.sleep(10)
+            logging.info("Load test server counters: %s", server.counters())
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Synthetic Linux device answering the commands sent by the node collectors.
+
+Counters in /proc/stat and of each process advance with wall clock time under
+a randomly drifting load, memory usage drifts, and processes are started and
+ended now and then. The commands of the node collectors are recognised as
+they are built: single commands, BatchedCommand framing and output piped
+through a compressor.
+"""
+import gzip
+import random
+import re
+import threading
+import time
+
+from datacollector.collector.process_table import PROCESS_COMMAND
+
+BATCH_SECTION = re.compile(r"echo '#DC-BEGIN (?P<name>\S+)'; (?P<command>.*?); echo \"#DC-END (?P=name) \$\?\"")
+COMPRESSED = re.compile(r"^\((?P<command>.*)\) \| gzip -c -(?P<level>\d)$", re.DOTALL)
+
+CLOCK_TICKS = 100
+PAGE_SIZE = 4096
+MEM_TOTAL = 2048 * 1024
+COMMAND_NAMES = ("systemd", "kworker/0:1", "sshd", "dronectl", "telemetryd", "camera-stream", "gpsd", "mavproxy",
+                 "python3", "journald", "dbus-daemon", "chronyd")
+
+
+class SyntheticDevice:
+    """Generates /proc/stat, /proc/meminfo, process and top output of one simulated device."""
+
+    def __init__(self, name, cores=4, processes=60, churn=0.02, seed=None):
+        """Initialize device.
+
+        cores: number of CPU cores.
+        processes: number of processes at start.
+        churn: probability per process of ending on each read. Ended processes are replaced by new ones.
+        """
+        self._name = name
+        self._cores = cores
+        self._churn = churn
+        self._random = random.Random(seed if seed is not None else name)
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._last = self._started
+        self._load = self._random.uniform(0.05, 0.6)
+        self._cpu = [[0] * 10 for _ in range(cores + 1)]
+        self._mem_free = MEM_TOTAL // 2
+        self._next_pid = 1
+        self._processes = {}
+        for _ in range(processes):
+            self._spawn()
+        self._commands = {"cat /proc/stat": self.proc_stat, "cat /proc/meminfo": self.meminfo,
+                          PROCESS_COMMAND: self.process_stat, "top -b -n 1": self.top,
+                          "echo hello": lambda: "hello\n", "command -v gzip": lambda: "/bin/gzip\n"}
+
+    @property
+    def name(self):
+        """Public access for name."""
+        return self._name
+
+    def execute(self, command):
+        """Run a command. Return the output as bytes and the exit status."""
+        compressed = COMPRESSED.match(command)
+        if compressed is not None:
+            output, status = self.execute(compressed.group("command"))
+            return gzip.compress(output, compresslevel=int(compressed.group("level"))), status
+        sections = list(BATCH_SECTION.finditer(command))
+        if sections:
+            parts = []
+            for section in sections:
+                output, status = self._run(section.group("command"))
+                parts.append("#DC-BEGIN {name}\n{output}#DC-END {name} {status}\n".format(
+                    name=section.group("name"), output=output, status=status))
+            return "".join(parts).encode(), 0
+        output, status = self._run(command)
+        return output.encode(), status
+
+    def _run(self, command):
+        """Run a single command. Return output text and exit status."""
+        generate = self._commands.get(command)
+        if generate is None:
+            return "", 127
+        with self._lock:
+            self._advance()
+            return generate(), 0
+
+    def _advance(self):
+        """Advance counters by the time since the last read."""
+        now = time.time()
+        ticks = int((now - self._last) * CLOCK_TICKS)
+        if ticks <= 0:
+            return
+        self._last = now
+        self._load = min(0.95, max(0.02, self._load + self._random.uniform(-0.05, 0.05)))
+        for core in range(1, self._cores + 1):
+            busy = int(ticks * self._load * self._random.uniform(0.5, 1.5))
+            busy = min(busy, ticks)
+            user = busy * 2 // 3
+            counters = self._cpu[core]
+            counters[0] += user
+            counters[2] += busy - user
+            counters[3] += ticks - busy
+            counters[4] += self._random.randint(0, 1)
+        self._cpu[0] = [sum(values) for values in zip(*self._cpu[1:])]
+        self._mem_free = min(MEM_TOTAL, max(MEM_TOTAL // 10, self._mem_free + self._random.randint(-4096, 4096)))
+        process_ticks = ticks * self._cores * self._load
+        weights = [process["weight"] for process in self._processes.values()]
+        total_weight = sum(weights) or 1
+        for process in self._processes.values():
+            share = process_ticks * process["weight"] / total_weight
+            process["utime"] += share * 0.8
+            process["stime"] += share * 0.2
+            process["rss"] = max(64, process["rss"] + self._random.randint(-8, 8))
+        for pid in [pid for pid in self._processes if pid > 1 and self._random.random() < self._churn]:
+            del self._processes[pid]
+            self._spawn()
+
+    def _spawn(self):
+        """Start a new synthetic process."""
+        pid = self._next_pid
+        self._next_pid += self._random.randint(1, 20)
+        rss = self._random.randint(200, 20000)
+        self._processes[pid] = {"pid": pid, "command": self._random.choice(COMMAND_NAMES),
+                                "ppid": 1 if pid > 1 else 0, "state": self._random.choice("SSSSR"),
+                                "threads": self._random.randint(1, 16), "utime": 0, "stime": 0,
+                                "starttime": int((time.time() - self._started) * CLOCK_TICKS),
+                                "weight": self._random.expovariate(1.0), "rss": rss, "vsize": rss * 4,
+                                "shared": rss // 3}
+
+    def proc_stat(self):
+        """Output of cat /proc/stat."""
+        lines = []
+        for index, counters in enumerate(self._cpu):
+            name = "cpu" if index == 0 else "cpu{}".format(index - 1)
+            lines.append("{}{}{}\n".format(name, "  " if index == 0 else " ", " ".join(str(c) for c in counters)))
+        lines.append("ctxt {}\n".format(self._cpu[0][0] * 37))
+        lines.append("btime {}\n".format(int(self._started)))
+        lines.append("processes {}\n".format(self._next_pid))
+        lines.append("procs_running {}\n".format(1 + int(self._load * self._cores)))
+        return "".join(lines)
+
+    def meminfo(self):
+        """Output of cat /proc/meminfo."""
+        cached = (MEM_TOTAL - self._mem_free) // 3
+        values = (("MemTotal", MEM_TOTAL), ("MemFree", self._mem_free), ("MemAvailable", self._mem_free + cached),
+                  ("Buffers", 20480), ("Cached", cached), ("SwapCached", 0), ("Active", cached * 2),
+                  ("Inactive", cached), ("SwapTotal", 0), ("SwapFree", 0), ("Dirty", 128), ("Writeback", 0),
+                  ("AnonPages", cached), ("Mapped", cached // 2), ("Shmem", 4096), ("Slab", 40960),
+                  ("KernelStack", 2048), ("PageTables", 4096), ("CommitLimit", MEM_TOTAL // 2),
+                  ("Committed_AS", MEM_TOTAL - self._mem_free), ("VmallocTotal", 263061440))
+        return "".join("{:<16}{:>10} kB\n".format(key + ":", value) for key, value in values)
+
+    def process_stat(self):
+        """Output of the process command: cpu line, page size, stat and statm lines of every process."""
+        lines = ["cpu  " + " ".join(str(c) for c in self._cpu[0]) + "\n", "pagesize {}\n".format(PAGE_SIZE)]
+        for process in self._processes.values():
+            lines.append("{pid} ({command}) {state} {ppid} {pid} {pid} 0 -1 4194560 120 0 0 0 {utime} {stime} "
+                         "0 0 20 0 {threads} 0 {starttime} {vsize} {rss} 18446744073709551615\n".format(
+                             vsize=process["vsize"] * PAGE_SIZE, utime=int(process["utime"]),
+                             stime=int(process["stime"]), **{key: value for key, value in process.items()
+                                                             if key not in ("vsize", "utime", "stime")}))
+        for process in self._processes.values():
+            lines.append("/proc/{pid}/statm:{vsize} {rss} {shared} 1 0 {data} 0\n".format(
+                data=process["rss"] // 2, **process))
+        return "".join(lines)
+
+    def top(self):
+        """Output of top -b -n 1."""
+        cpu = self._cpu[0]
+        lines = ["top - {} up 1 day,  1 user,  load average: {:.2f}, 0.50, 0.40\n".format(
+                     time.strftime("%H:%M:%S"), self._load * self._cores),
+                 "Tasks: {} total,   1 running, {} sleeping,   0 stopped,   0 zombie\n".format(
+                     len(self._processes), len(self._processes) - 1),
+                 "%Cpu(s): {:.1f} us,  {:.1f} sy,  0.0 ni, {:.1f} id,  0.0 wa,  0.0 hi,  0.0 si,  0.0 st\n".format(
+                     *(100.0 * value / max(1, sum(cpu)) for value in (cpu[0], cpu[2], cpu[3]))),
+                 "MiB Mem :   {:.1f} total,   {:.1f} free\n".format(MEM_TOTAL / 1024, self._mem_free / 1024),
+                 "MiB Swap:      0.0 total,      0.0 free,      0.0 used.\n", "\n",
+                 "    PID USER      PR  NI    VIRT    RES    SHR S  %CPU  %MEM     TIME+ COMMAND\n"]
+        for process in self._processes.values():
+            total = int(process["utime"] + process["stime"])
+            lines.append("{:>7} root      20   0 {:>7} {:>6} {:>6} {} {:>5.1f} {:>5.1f} {:>3}:{:05.2f} {}\n".format(
+                process["pid"], process["vsize"] * 4, process["rss"] * 4, process["shared"] * 4, process["state"],
+                process["weight"], 100.0 * process["rss"] * 4 / MEM_TOTAL, total // 6000, total % 6000 / 100.0,
+                process["command"]))
+        return "".join(lines)
@@ -0,0 +1,15 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Helpers shared by the unit tests."""
+import time
+
+
+def wait_for(condition, timeout=5.0, interval=0.005):
+    """Poll condition until it is true or timeout seconds have passed. Return the last result of condition."""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(interval)
+    return condition()
@@ -0,0 +1,71 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of the connection admission controller."""
+import threading
+import time
+
+from datacollector.collector.admission import AdmissionController
+from datacollector.tests.unit.helpers import wait_for
+
+
+def test_admit_releases_slot():
+    admission = AdmissionController(max_concurrent=1)
+    with admission.admit("node0"):
+        assert admission.active == 1
+    assert admission.active == 0
+    assert "node0" in admission.wait_times()
+
+
+def test_concurrency_is_bounded():
+    admission = AdmissionController(max_concurrent=2)
+    release = threading.Event()
+    peak = []
+    lock = threading.Lock()
+
+    def connect(name):
+        with admission.admit(name):
+            with lock:
+                peak.append(admission.active)
+            release.wait(5)
+
+    threads = [threading.Thread(target=connect, args=("node{}".format(number),)) for number in range(5)]
+    for thread in threads:
+        thread.start()
+    assert wait_for(lambda: admission.active == 2 and admission.queued == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert max(peak) == 2
+    assert admission.active == 0 and admission.queued == 0
+
+
+def test_waiting_nodes_are_admitted_in_order():
+    admission = AdmissionController(max_concurrent=1)
+    admitted = []
+    admission.acquire("first")
+    threads = []
+    for number in range(4):
+        name = "node{}".format(number)
+        thread = threading.Thread(target=lambda name=name: (admission.acquire(name), admitted.append(name),
+                                                            admission.release()))
+        thread.start()
+        threads.append(thread)
+        assert wait_for(lambda: admission.queued == number + 1)
+    admission.release()
+    for thread in threads:
+        thread.join(5)
+    assert admitted == ["node0", "node1", "node2", "node3"]
+
+
+def test_rate_limits_new_handshakes():
+    admission = AdmissionController(max_concurrent=10, rate=20, burst=2)
+    begin = time.monotonic()
+    for number in range(6):
+        with admission.admit("node{}".format(number)):
+            pass
+    # Two tokens from the burst, four refilled at 20 per second.
+    assert time.monotonic() - begin >= 0.18
+    assert admission.wait_times()["node5"] > 0
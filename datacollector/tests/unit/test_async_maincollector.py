@@ -0,0 +1,109 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of AsyncMainCollector driving fake node collectors from its event loop."""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from datacollector.collector.async_maincollector import AsyncMainCollector
+from datacollector.collector.collector_config_parser import CollectorConfig
+from datacollector.collector.inventory import NodeStatus
+
+INTERVAL = 0.05
+
+
+class FakeNodeCollector:
+    """Node collector recording the collections run for it in the executor."""
+
+    def __init__(self, name, status=NodeStatus.RUNNING, phase_offset=0.0, duration=0.0, on_collect=None):
+        self.node_name = name
+        self.status = status
+        self.phase_offset = phase_offset
+        self.connection = SimpleNamespace(hostname=name, close_session=lambda: None)
+        self.stopped = False
+        self.closed = False
+        self.collections = 0
+        self.finished = 0
+        self._duration = duration
+        self._on_collect = on_collect
+
+    def connect_and_test(self):
+        return self.status == NodeStatus.RUNNING
+
+    def begin_collection(self, scheduled_time):
+        return True
+
+    def run_collection(self):
+        self.collections += 1
+        time.sleep(self._duration)
+        self.finished += 1
+        if self._on_collect is not None:
+            self._on_collect(self)
+
+    def stop(self):
+        self.stopped = True
+
+    def close_record(self):
+        self.closed = True
+
+
+@pytest.fixture
+def main_collector():
+    config = CollectorConfig("collector")
+    config.update(engine="asyncio", ssh_pool=False, index_to_elastic=False, backpressure=False, align_ticks=False,
+                  phase_spread=0.0)
+    agent = SimpleNamespace(collect_interval=INTERVAL, collect_start_time=datetime.utcnow())
+    return AsyncMainCollector(agent, config)
+
+
+def test_ticks_collect_running_nodes_only(main_collector):
+    def stop_after_three(collector):
+        if collector.collections == 3:
+            main_collector.signal_stop()
+
+    running = FakeNodeCollector("running", on_collect=stop_after_three)
+    skipped = [FakeNodeCollector(name, status=status) for name, status in
+               (("degraded", NodeStatus.DEGRADED), ("reconnecting", NodeStatus.RECONNECTING),
+                ("connecting", NodeStatus.CONNECTING))]
+    main_collector._node_collectors = [running] + skipped
+    thread = threading.Thread(target=asyncio.run, args=(main_collector._async_main(),))
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert running.collections >= 3
+    assert [collector.collections for collector in skipped] == [0, 0, 0]
+    assert all(collector.closed and collector.stopped for collector in main_collector.node_collectors)
+    assert running.status == NodeStatus.STOPPED
+    assert main_collector._in_flight == {}
+
+
+def test_finish_collections_cancels_pending_work_and_shuts_down_executor(main_collector):
+    waiting = FakeNodeCollector("waiting", phase_offset=60.0)
+    busy = FakeNodeCollector("busy", duration=3 * INTERVAL)
+    main_collector._node_collectors = [waiting, busy]
+
+    async def scenario():
+        main_collector._loop = asyncio.get_running_loop()
+        main_collector._executor = ThreadPoolExecutor(max_workers=2)
+        main_collector._collect(time.time())
+        tasks = dict(main_collector._in_flight)
+        await asyncio.sleep(INTERVAL / 5)
+        await main_collector._finish_collections()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        return tasks
+
+    tasks = asyncio.run(scenario())
+    assert tasks[waiting].cancelled()
+    assert waiting.collections == 0
+    assert busy.finished == 1
+    assert main_collector._in_flight == {}
+    with pytest.raises(RuntimeError):
+        main_collector._executor.submit(time.sleep, 0)
@@ -0,0 +1,90 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of the backpressure controller."""
+import pytest
+
+from datacollector.collector.backpressure import BackpressureController, BackpressureException
+
+
+def _state(controller):
+    return list(controller.active_actions), controller.stretch
+
+
+def test_escalates_through_the_ladder():
+    controller = BackpressureController(max_stretch=4)
+    states = []
+    for _ in range(5):
+        controller.update(0.9)
+        states.append(_state(controller))
+    assert states == [(["drop_process"], 1), (["drop_process", "stretch"], 2), (["drop_process", "stretch"], 4),
+                      (["drop_process", "stretch", "shed"], 4), (["drop_process", "stretch", "shed"], 4)]
+    assert controller.counters()["escalations"] == 4
+
+
+def test_relaxes_in_reverse_order():
+    controller = BackpressureController(max_stretch=4)
+    for _ in range(4):
+        controller.update(1.0)
+    states = []
+    for _ in range(5):
+        controller.update(0.1)
+        states.append(_state(controller))
+    assert states == [(["drop_process", "stretch"], 4), (["drop_process", "stretch"], 2), (["drop_process"], 1),
+                      ([], 1), ([], 1)]
+    assert controller.counters()["relaxations"] == 4
+
+
+def test_pressure_between_watermarks_keeps_actions():
+    controller = BackpressureController(high=0.8, low=0.5)
+    controller.update(0.8)
+    controller.update(0.6)
+    controller.update(0.79)
+    assert _state(controller) == (["drop_process"], 1)
+    controller.update(0.5)
+    assert _state(controller) == ([], 1)
+    assert controller.pressure == 0.5
+
+
+def test_stretched_ticks_stay_aligned():
+    controller = BackpressureController(actions=("stretch",))
+    controller.update(1.0)
+    assert [controller.admit(float(tick), 1.0, 3) for tick in range(100, 106)] == [True, False] * 3
+    controller.update(1.0)
+    assert [tick for tick in range(100, 110) if controller.admit(float(tick), 1.0, 3)] == [100, 104, 108]
+    assert controller.counters()["ticks_stretched"] == 3 + 7
+
+
+def test_shed_skips_every_tick():
+    controller = BackpressureController(actions=("shed",))
+    assert controller.admit(100.0, 1.0, 3)
+    controller.update(1.0)
+    assert not controller.admit(101.0, 1.0, 3)
+    counters = controller.counters()
+    assert (counters["ticks_shed"], counters["samples_shed"]) == (1, 3)
+    assert counters["actions"] == ["shed"]
+
+
+def test_drop_process_is_counted():
+    controller = BackpressureController()
+    assert not controller.drop_process
+    controller.update(0.9)
+    assert controller.drop_process
+    controller.count_process_dropped()
+    assert controller.counters()["processes_dropped"] == 1
+    assert controller.admit(100.0, 1.0, 1)
+
+
+def test_no_actions_only_measures():
+    controller = BackpressureController(actions=())
+    controller.update(1.0)
+    assert _state(controller) == ([], 1)
+    assert controller.counters()["escalations"] == 0
+    assert controller.pressure == 1.0
+
+
+def test_unknown_action_raises():
+    with pytest.raises(BackpressureException):
+        BackpressureController(actions=("drop_process", "throttle"))
@@ -0,0 +1,105 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of running several commands in one remote invocation."""
+import logging
+
+import pytest
+
+from datacollector.collector.batched_command import (BatchFramingException, BatchedCommand, SECTION_BEGIN,
+                                                     SECTION_END)
+
+COMMANDS = (("cpu", "cat /proc/stat"), ("memory", "cat /proc/meminfo"))
+
+
+def _framed(sections, status=0):
+    lines = []
+    for name, output in sections:
+        lines.append(SECTION_BEGIN + name + "\n")
+        lines.extend(output)
+        lines.append("{}{} {}\n".format(SECTION_END, name, status))
+    return lines
+
+
+def test_command_frames_each_command():
+    command = BatchedCommand(COMMANDS).command
+    assert command == ("echo '#DC-BEGIN cpu'; cat /proc/stat; echo \"#DC-END cpu $?\"; "
+                       "echo '#DC-BEGIN memory'; cat /proc/meminfo; echo \"#DC-END memory $?\"")
+
+
+def test_split_returns_sections():
+    batch = BatchedCommand(COMMANDS)
+    lines = _framed([("cpu", ["cpu 1 2 3\n", "cpu0 1 2 3\n"]), ("memory", ["MemTotal: 10 kB\n"])])
+    assert batch.split(lines) == {"cpu": ["cpu 1 2 3\n", "cpu0 1 2 3\n"], "memory": ["MemTotal: 10 kB\n"]}
+
+
+def test_empty_section():
+    batch = BatchedCommand(COMMANDS)
+    assert batch.split(_framed([("cpu", []), ("memory", [])])) == {"cpu": [], "memory": []}
+
+
+def test_missing_section_raises():
+    batch = BatchedCommand(COMMANDS)
+    with pytest.raises(BatchFramingException, match="memory"):
+        batch.split(_framed([("cpu", ["cpu 1 2 3\n"])]))
+
+
+def test_unterminated_section_raises():
+    batch = BatchedCommand(COMMANDS)
+    lines = _framed([("cpu", ["cpu 1 2 3\n"]), ("memory", ["MemTotal: 10 kB\n"])])[:-1]
+    with pytest.raises(BatchFramingException, match="not terminated"):
+        batch.split(lines)
+
+
+def test_section_interrupted_by_next_begin_raises():
+    batch = BatchedCommand(COMMANDS)
+    lines = [SECTION_BEGIN + "cpu\n", "cpu 1 2 3\n"] + _framed([("memory", [])])
+    with pytest.raises(BatchFramingException):
+        batch.split(lines)
+
+
+def test_unexpected_end_raises():
+    batch = BatchedCommand(COMMANDS)
+    with pytest.raises(BatchFramingException, match="Unexpected end"):
+        batch.split([SECTION_END + "cpu 0\n"] + _framed([("cpu", []), ("memory", [])]))
+
+
+def test_failed_command_is_logged(caplog):
+    batch = BatchedCommand(COMMANDS[:1])
+    with caplog.at_level(logging.WARNING, logger='__collector__'):
+        assert batch.split(_framed([("cpu", ["cpu 1 2 3\n"])], status=1)) == {"cpu": ["cpu 1 2 3\n"]}
+    assert "exited with status 1" in caplog.text
+
+
+def test_sections_are_yielded_while_output_is_read():
+    batch = BatchedCommand(COMMANDS)
+    read = []
+
+    def output():
+        for line in _framed([("cpu", ["cpu 1 2 3\n"]), ("memory", ["MemTotal: 10 kB\n"])]):
+            read.append(line)
+            yield line
+
+    sections = batch.iter_sections(output())
+    name, lines = next(sections)
+    assert name == "cpu"
+    assert list(lines) == ["cpu 1 2 3\n"]
+    assert len(read) == 3
+    assert [(name, list(lines)) for name, lines in sections] == [("memory", ["MemTotal: 10 kB\n"])]
+
+
+def test_unconsumed_section_lines_are_skipped():
+    batch = BatchedCommand(COMMANDS)
+    lines = _framed([("cpu", ["cpu 1 2 3\n", "cpu0 1 2 3\n"]), ("memory", ["MemTotal: 10 kB\n"])])
+    assert [name for name, _ in batch.iter_sections(lines)] == ["cpu", "memory"]
+
+
+def test_line_cut_off_by_lost_output_is_not_yielded():
+    batch = BatchedCommand(COMMANDS)
+    lines = [SECTION_BEGIN + "cpu\n", "cpu 1 2 3\n", "cpu0 1 2"]
+    name, section = next(batch.iter_sections(lines))
+    assert next(section) == "cpu 1 2 3\n"
+    with pytest.raises(BatchFramingException, match="not terminated"):
+        next(section)
@@ -0,0 +1,105 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of the batching queue of the Elasticsearch indexer."""
+import json
+import threading
+import time
+
+from datacollector.collector.batching_indexer import BatchingIndexer
+from datacollector.tests.unit.helpers import wait_for
+
+
+def _action(number):
+    return {"_index": "test", "_id": str(number), "_source": {"value": number}}
+
+
+class Recorder:
+    """send and overflow handlers recording the actions they get."""
+
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.overflowed = []
+        self._delay = delay
+        self._lock = threading.Lock()
+
+    def send(self, actions):
+        time.sleep(self._delay)
+        with self._lock:
+            self.batches.append(actions)
+
+    def overflow(self, actions):
+        with self._lock:
+            self.overflowed.extend(actions)
+
+    def sent(self):
+        with self._lock:
+            return [action for batch in self.batches for action in batch]
+
+
+def test_sends_full_batches():
+    recorder = Recorder()
+    batcher = BatchingIndexer(recorder.send, recorder.overflow, batch_size=10, max_latency=10.0, workers=1)
+    for number in range(30):
+        batcher.put(_action(number))
+    batcher.close()
+    assert sorted(int(action["_id"]) for action in recorder.sent()) == list(range(30))
+    assert all(len(batch) <= 10 for batch in recorder.batches)
+    assert batcher.metrics()["sent"] == 30
+
+
+def test_flushes_after_max_latency():
+    recorder = Recorder()
+    batcher = BatchingIndexer(recorder.send, recorder.overflow, batch_size=100, max_latency=0.05, workers=1)
+    batcher.put(_action(1))
+    assert wait_for(recorder.sent)
+    assert len(recorder.sent()) == 1
+    batcher.close()
+
+
+def test_source_is_serialized_once_for_send():
+    recorder = Recorder()
+    batcher = BatchingIndexer(recorder.send, recorder.overflow, batch_size=2, workers=1)
+    batcher.put(_action(1))
+    batcher.put(_action(2))
+    batcher.close()
+    sources = [action["_source"] for action in recorder.sent()]
+    assert all(isinstance(source, str) for source in sources)
+    assert [json.loads(source) for source in sources] == [{"value": 1}, {"value": 2}]
+
+
+def test_full_queue_overflows():
+    recorder = Recorder(delay=0.5)
+    batcher = BatchingIndexer(recorder.send, recorder.overflow, queue_size=5, batch_size=1, workers=1)
+    results = [batcher.put(_action(number)) for number in range(20)]
+    assert not all(results)
+    assert len(recorder.overflowed) == results.count(False)
+    assert batcher.lag() == 1.0
+    batcher.close(timeout=0.1)
+
+
+def test_close_with_full_queue_does_not_block():
+    recorder = Recorder(delay=2.0)
+    batcher = BatchingIndexer(recorder.send, recorder.overflow, queue_size=3, batch_size=1, workers=1)
+    batcher.put(_action(0))
+    time.sleep(0.1)
+    for number in range(1, 10):
+        batcher.put(_action(number))
+    assert batcher.depth == batcher.capacity
+    begin = time.monotonic()
+    batcher.close(timeout=0.2)
+    assert time.monotonic() - begin < 1.0
+    assert len(recorder.sent()) + len(recorder.overflowed) <= 10
+    time.sleep(2.2)
+    handled = sorted(int(action["_id"]) for action in recorder.sent() + recorder.overflowed)
+    assert handled == list(range(10))
+
+
+def test_put_after_close_sends_directly():
+    recorder = Recorder()
+    batcher = BatchingIndexer(recorder.send, recorder.overflow, workers=1)
+    batcher.close()
+    assert batcher.put(_action(1))
+    assert recorder.batches == [[_action(1)]]
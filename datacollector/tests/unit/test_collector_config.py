@@ -0,0 +1,77 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of CollectorConfig."""
+import pytest
+
+from datacollector.collector.collector_config_parser import CollectorConfig, CollectorConfigException
+
+
+def test_update_overrides_values():
+    config = CollectorConfig("collector")
+    config.update(engine="asyncio", collect_mode="poll", async_workers=4)
+    assert config.engine == "asyncio"
+    assert config.async_workers == 4
+
+
+def test_update_rejects_unknown_values():
+    with pytest.raises(AttributeError):
+        CollectorConfig("collector").update(no_such_value=1)
+
+
+def test_stream_mode_is_rejected_with_asyncio_engine():
+    config = CollectorConfig("collector")
+    config.update(engine="threaded", collect_mode="stream")
+    with pytest.raises(CollectorConfigException):
+        config.update(engine="asyncio")
+
+
+@pytest.mark.parametrize("name, value", [
+    ("overrun_policy", "drop"),
+    ("file_durability", "sometimes"),
+    ("compression", "zstd"),
+    ("file_compression", "bzip2"),
+    ("file_format", "csv"),
+    ("collect_mode", "push"),
+    ("engine", "forked"),
+])
+def test_unknown_values_are_rejected(name, value):
+    with pytest.raises(CollectorConfigException, match=name):
+        CollectorConfig("collector").update(**{name: value})
+
+
+def test_unknown_backpressure_actions_are_rejected():
+    with pytest.raises(CollectorConfigException, match="throttle"):
+        CollectorConfig("collector").update(backpressure_actions=("stretch", "throttle"))
+
+
+def _read(text):
+    config = CollectorConfig("collector")
+    config._config_parser.read_string(text)
+    config.read_config()
+    return config
+
+
+def test_read_config_reads_valid_values():
+    config = _read("[collector]\nfile_durability = FSync\nbackpressure_actions = stretch, shed\n")
+    assert config.file_durability == "fsync"
+    assert config.backpressure_actions == ("stretch", "shed")
+
+
+def test_read_config_raises_on_unparsable_value():
+    with pytest.raises(CollectorConfigException):
+        _read("[collector]\nfile_buffer_bytes = lots\n")
+
+
+def test_invalid_value_read_from_file_is_rejected_by_validation():
+    config = _read("[collector]\nfile_durability = sometimes\n")
+    with pytest.raises(CollectorConfigException, match="file_durability"):
+        config._validate()
+
+
+@pytest.mark.parametrize("threshold", [-0.1, 1.5])
+def test_spool_threshold_out_of_range_is_rejected(threshold):
+    with pytest.raises(CollectorConfigException, match="backpressure_spool_threshold"):
+        CollectorConfig("collector").update(backpressure_spool_threshold=threshold)
@@ -0,0 +1,155 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of the columnar store."""
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from datacollector.collector.columnar_store import (ColumnarReader, ColumnarStoreException, ColumnarWriter,
+                                                    MISSING, SERIES, convert_json)
+from datacollector.collector.memcpu_parser import CPU_FIELDS
+from datacollector.collector.sample import CpuSample, MemorySample, Sample
+
+START = datetime(2021, 5, 4, 10)
+MEM_LINES = ["MemTotal:       28803616 kB\n", "MemFree:        27841200 kB\n"]
+
+
+def _timestamp(number):
+    return (START + timedelta(seconds=number)).isoformat()
+
+
+def _sample(number, cpus=("cpu", "cpu0"), memory_lines=MEM_LINES):
+    sample = Sample(_timestamp(number), "run")
+    counters = np.arange(len(cpus) * len(CPU_FIELDS), dtype=np.int64).reshape(len(cpus), len(CPU_FIELDS)) + number
+    sample.cpu = CpuSample(tuple(cpus), counters, np.full(len(cpus), float(number)))
+    sample.memory = MemorySample.from_lines(memory_lines) if memory_lines is not None else None
+    return sample
+
+
+def _write(directory, numbers, **kwargs):
+    writer = ColumnarWriter(directory, durability="none", **kwargs)
+    for number in numbers:
+        writer.append(_sample(number))
+    writer.close()
+
+
+def test_series_read_back(tmp_path):
+    directory = str(tmp_path / "node.columns")
+    _write(directory, range(10))
+    reader = ColumnarReader(directory)
+    assert len(reader) == 10
+    assert reader.cpus == ["cpu", "cpu0"]
+    assert list(reader.series("cpu.cpu0.user")) == [len(CPU_FIELDS) + number for number in range(10)]
+    assert list(reader.series("cpu.cpu.utilisation")) == [float(number) for number in range(10)]
+    assert list(reader.series("memory.MemTotal")) == [28803616] * 10
+    assert reader.series("cpu.user").shape == (10, 2)
+
+
+def test_range_lookup_is_inclusive(tmp_path):
+    directory = str(tmp_path / "node.columns")
+    _write(directory, range(100))
+    reader = ColumnarReader(directory)
+    values = reader.series("cpu.cpu.utilisation", _timestamp(20), _timestamp(29))
+    assert list(values) == [float(number) for number in range(20, 30)]
+    assert len(reader.series("timestamp", _timestamp(200))) == 0
+
+
+def test_unknown_series_raises(tmp_path):
+    directory = str(tmp_path / "node.columns")
+    _write(directory, range(2))
+    with pytest.raises(ColumnarStoreException):
+        ColumnarReader(directory).series("cpu.cpu7.user")
+
+
+def test_partial_first_sample_waits_for_schema(tmp_path):
+    directory = str(tmp_path / "node.columns")
+    writer = ColumnarWriter(directory, durability="none")
+    first = _sample(0)
+    first.memory = None
+    writer.append(first)
+    writer.append(_sample(1))
+    writer.close()
+    reader = ColumnarReader(directory)
+    assert reader.memory_keys == ["MemTotal", "MemFree"]
+    assert list(reader.series("memory.MemFree")) == [MISSING, 27841200]
+
+
+def test_appends_to_existing_store(tmp_path):
+    directory = str(tmp_path / "node.columns")
+    _write(directory, range(5))
+    _write(directory, range(5, 8))
+    assert list(ColumnarReader(directory).series("cpu.cpu.utilisation")) == [float(number) for number in range(8)]
+
+
+def test_torn_rows_are_truncated_on_open(tmp_path):
+    directory = str(tmp_path / "node.columns")
+    _write(directory, range(5))
+    # A crash after the timestamp and cpu counters of a sample were written, but not the other series.
+    reference = ColumnarWriter(str(tmp_path / "reference.columns"), durability="none")
+    reference.append(_sample(5))
+    reference.close()
+    for name in ("timestamp", "cpu_counters"):
+        file_name = SERIES[name][0]
+        with open(os.path.join(str(tmp_path / "reference.columns"), file_name), "rb") as source, \
+                open(os.path.join(directory, file_name), "ab") as target:
+            target.write(source.read())
+    with open(os.path.join(directory, SERIES["memory"][0]), "ab") as target:
+        target.write(b"\x01\x02\x03")
+    assert len(ColumnarReader(directory)) == 5
+
+    _write(directory, range(6, 9))
+    reader = ColumnarReader(directory)
+    expected = [float(number) for number in list(range(5)) + list(range(6, 9))]
+    assert list(reader.series("cpu.cpu.utilisation")) == expected
+    assert list(reader.series("cpu.cpu.user")) == [number for number in list(range(5)) + list(range(6, 9))]
+    assert list(reader.series("timestamp")) == list(reader.timestamps)
+    sizes = {name: os.path.getsize(os.path.join(directory, file_name)) for name, (file_name, _) in SERIES.items()}
+    assert sizes["timestamp"] == 8 * 8
+    assert sizes["memory"] == 8 * 2 * 8
+
+
+def test_new_cpus_and_meminfo_keys_are_logged(tmp_path, caplog):
+    directory = str(tmp_path / "node.columns")
+    writer = ColumnarWriter(directory, durability="none")
+    writer.append(_sample(0))
+    with caplog.at_level(logging.WARNING, logger='__collector__'):
+        writer.append(_sample(1, cpus=("cpu", "cpu0", "cpu1"), memory_lines=MEM_LINES + ["Cached: 10 kB\n"]))
+        writer.append(_sample(2, cpus=("cpu", "cpu0", "cpu1"), memory_lines=MEM_LINES + ["Cached: 10 kB\n"]))
+    writer.close()
+    messages = [record.getMessage() for record in caplog.records]
+    assert len([message for message in messages if "cpu1" in message]) == 1
+    assert len([message for message in messages if "Cached" in message]) == 1
+    assert ColumnarReader(directory).cpus == ["cpu", "cpu0"]
+
+
+def test_fsync_every_syncs_files(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd))
+    writer = ColumnarWriter(str(tmp_path / "node.columns"), durability="fsync", fsync_every=3)
+    for number in range(7):
+        writer.append(_sample(number))
+    assert len(synced) == 2 * len(SERIES)
+    writer.close()
+    assert len(synced) == 3 * len(SERIES)
+
+
+def test_convert_json(tmp_path):
+    rows = []
+    for number in range(4):
+        row = {"timestamp": _timestamp(number), "run_id": "run",
+               "cpu": dict(zip(CPU_FIELDS, range(number, number + len(CPU_FIELDS))), utilisation=1.5),
+               "memory": {"MemTotal": 100 + number}}
+        rows.append(json.dumps(row))
+    rows.append(json.dumps({"timestamp": _timestamp(9), "process_0": {"pid": "1"}}))
+    directory = str(tmp_path / "node.columns")
+    assert convert_json(rows, directory) == 4
+    reader = ColumnarReader(directory)
+    assert list(reader.series("memory.MemTotal")) == [100, 101, 102, 103]
+    assert list(reader.series("cpu.cpu.user")) == [0, 1, 2, 3]
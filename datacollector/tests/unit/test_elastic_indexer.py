@@ -0,0 +1,105 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of the process-wide Elasticsearch indexer shared by main collectors."""
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from datacollector.collector import elastic_indexer
+from datacollector.collector.collector_config_parser import CollectorConfig
+from datacollector.collector.elastic_indexer import ElasticIndexer
+from datacollector.collector.elastic_spool import ElasticSpoolException
+from datacollector.collector.maincollector import MainCollector
+
+
+def _actions(start, count):
+    return [{"_index": "test", "_id": str(number), "_source": {"value": number}}
+            for number in range(start, start + count)]
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    monkeypatch.setattr(elastic_indexer, "ElasticConfig", lambda name: SimpleNamespace(
+        host="localhost", port=9200, memcpu_index="memcpu", user="user", password="secret"))
+
+    def unreachable(self, actions, timeout, max_retries):
+        raise ConnectionError("Elasticsearch is down")
+
+    monkeypatch.setattr(ElasticIndexer, "_send", unreachable)
+    config = CollectorConfig("collector")
+    config.update(index_to_elastic=True, elastic_spool=True, elastic_spool_directory=str(tmp_path / "spool"),
+                  elastic_batching=False, ssh_pool=True)
+    yield config
+    ElasticIndexer._close_at_exit()
+
+
+def _main_collector(config):
+    agent = SimpleNamespace(collect_interval=1, collect_start_time=datetime.utcnow())
+    return MainCollector(agent, config)
+
+
+def _finish(main_collector):
+    main_collector.stop = True
+    main_collector.run()
+
+
+def test_stopped_main_collector_leaves_indexer_to_others(config):
+    first = _main_collector(config)
+    second = _main_collector(config)
+    indexer = ElasticIndexer.shared(config)
+    ElasticIndexer.release_shared()
+    _finish(first)
+    indexer.index_actions(_actions(0, 5))
+    assert indexer.spool.pending == 5
+    assert ElasticIndexer.shared(config) is indexer
+    ElasticIndexer.release_shared()
+
+    _finish(second)
+    with pytest.raises(ElasticSpoolException):
+        indexer.index_actions(_actions(5, 5))
+    assert ElasticIndexer.shared(config) is not indexer
+    ElasticIndexer.release_shared()
+
+
+def test_record_references_keep_indexer_open(config):
+    main_collector = _main_collector(config)
+    indexer = ElasticIndexer.shared(config)
+    _finish(main_collector)
+    indexer.index_actions(_actions(0, 1))
+    ElasticIndexer.release_shared()
+    assert indexer.spool.pending == 1
+    with pytest.raises(ElasticSpoolException):
+        indexer.index_actions(_actions(1, 1))
+
+
+@pytest.mark.parametrize("threshold, fill, lag", [
+    (0.9, 0.5, 0.0),
+    (0.9, 0.9, 0.0),
+    (0.9, 0.95, 0.5),
+    (0.9, 1.0, 1.0),
+    (0.0, 0.5, 0.5),
+    (1.0, 1.0, 0.0),
+])
+def test_spool_is_lag_only_near_its_budget(config, monkeypatch, threshold, fill, lag):
+    config.update(backpressure_spool_threshold=threshold)
+    indexer = ElasticIndexer(config)
+    monkeypatch.setattr(indexer.spool, "lag", lambda: fill)
+    try:
+        assert indexer.lag() == pytest.approx(lag)
+    finally:
+        indexer.close()
+
+
+def test_spool_lag_is_measured_from_spooled_documents(config):
+    config.update(elastic_spool_max_bytes=1000, elastic_spool_segment_bytes=100)
+    indexer = ElasticIndexer(config)
+    try:
+        indexer.index_actions(_actions(0, 5))
+        assert 0.0 < indexer.spool.lag() < config.backpressure_spool_threshold
+        assert indexer.lag() == 0.0
+    finally:
+        indexer.close()
@@ -0,0 +1,118 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of the Elasticsearch spool."""
+import os
+import time
+
+from datacollector.collector.elastic_spool import ElasticSpool
+from datacollector.tests.unit.helpers import wait_for
+
+
+class FixedBackoff:
+    """Backoff policy with a constant delay."""
+
+    def __init__(self, delay):
+        self._delay = delay
+
+    def delay(self, attempt):
+        return self._delay
+
+
+def _actions(start, count):
+    return [{"_index": "test", "_id": str(number), "_source": {"value": number}}
+            for number in range(start, start + count)]
+
+
+def test_append_counts_pending_documents(tmp_path):
+    spool = ElasticSpool(str(tmp_path), segment_bytes=200)
+    spool.append(_actions(0, 10))
+    assert spool.pending == 10
+    assert spool.pending_bytes > 0
+    assert len(os.listdir(str(tmp_path))) > 1
+    spool.close()
+
+
+def test_replay_delivers_all_documents_in_order(tmp_path):
+    delivered = []
+    spool = ElasticSpool(str(tmp_path), segment_bytes=300, replay_batch=4)
+    spool.append(_actions(0, 25))
+    spool.start_replay(delivered.extend)
+    assert wait_for(lambda: spool.pending == 0 and not os.listdir(str(tmp_path)))
+    spool.close()
+    assert [action["_id"] for action in delivered] == [str(number) for number in range(25)]
+    assert spool.counters()["replayed"] == 25
+
+
+def test_replay_retries_failed_batches(tmp_path):
+    delivered = []
+    failures = [2]
+
+    def deliver(actions):
+        if failures[0]:
+            failures[0] -= 1
+            raise ConnectionError("cluster down")
+        delivered.extend(actions)
+
+    spool = ElasticSpool(str(tmp_path))
+    spool._backoff = FixedBackoff(0.01)
+    spool.append(_actions(0, 5))
+    spool.start_replay(deliver)
+    assert wait_for(lambda: len(delivered) == 5)
+    spool.close()
+
+
+def test_append_does_not_cut_backoff_short(tmp_path):
+    attempts = []
+
+    def deliver(actions):
+        attempts.append(len(actions))
+        raise ConnectionError("cluster down")
+
+    spool = ElasticSpool(str(tmp_path))
+    spool._backoff = FixedBackoff(10.0)
+    spool.append(_actions(0, 1))
+    spool.start_replay(deliver)
+    assert wait_for(lambda: attempts)
+    for number in range(1, 20):
+        spool.append(_actions(number, 1))
+        time.sleep(0.01)
+    assert len(attempts) == 1
+    begin = time.monotonic()
+    spool.close()
+    assert time.monotonic() - begin < 5.0
+
+
+def test_evicts_oldest_segments_over_budget(tmp_path):
+    spool = ElasticSpool(str(tmp_path), max_bytes=1000, segment_bytes=200)
+    spool.append(_actions(0, 100))
+    assert spool.pending_bytes <= 1000
+    assert spool.counters()["evicted"] + spool.pending == 100
+    spool.close()
+
+
+def test_segments_survive_restart(tmp_path):
+    spool = ElasticSpool(str(tmp_path))
+    spool.append(_actions(0, 7))
+    spool.close()
+    delivered = []
+    spool = ElasticSpool(str(tmp_path))
+    assert spool.pending == 7
+    spool.start_replay(delivered.extend)
+    assert wait_for(lambda: len(delivered) == 7)
+    spool.close()
+
+
+def test_replay_skips_corrupt_lines(tmp_path):
+    spool = ElasticSpool(str(tmp_path))
+    spool.append(_actions(0, 2))
+    spool.close()
+    with open(os.path.join(str(tmp_path), "spool.000001.jsonl"), "a") as file:
+        file.write("{not json\n")
+    delivered = []
+    spool = ElasticSpool(str(tmp_path))
+    spool.start_replay(delivered.extend)
+    assert wait_for(lambda: spool.counters()["rejected"] == 1 and len(delivered) == 2)
+    spool.close()
@@ -0,0 +1,97 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of the buffered file sink."""
+import json
+import os
+
+import pytest
+
+from datacollector.collector.file_sink import FileSink, FileSinkException
+
+
+def _read(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+def test_flush_policy_writes_every_sample(tmp_path):
+    path = str(tmp_path / "node.json")
+    sink = FileSink(path, durability="flush")
+    sink.write({"value": 1})
+    assert _read(path) == [{"value": 1}]
+    sink.write({"value": 2})
+    assert sink.flushes == 2
+    sink.close()
+    assert _read(path) == [{"value": 1}, {"value": 2}]
+
+
+def test_none_policy_buffers_until_size(tmp_path):
+    path = str(tmp_path / "node.json")
+    sink = FileSink(path, buffer_bytes=39, flush_interval=60, durability="none")
+    sink.write({"value": 1})
+    sink.write({"value": 2})
+    assert _read(path) == []
+    sink.write({"value": 3})
+    assert len(_read(path)) == 3
+    assert sink.flushes == 1
+    sink.write({"value": 4})
+    sink.close()
+    assert [row["value"] for row in _read(path)] == [1, 2, 3, 4]
+    assert sink.bytes_written == os.path.getsize(path)
+
+
+def test_none_policy_writes_after_flush_interval(tmp_path):
+    path = str(tmp_path / "node.json")
+    sink = FileSink(path, flush_interval=0, durability="none")
+    sink.write({"value": 1})
+    assert _read(path) == [{"value": 1}]
+    sink.close()
+
+
+def test_fsync_policy_syncs_every_n_samples(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(os, "fsync", synced.append)
+    sink = FileSink(str(tmp_path / "node.json"), durability="fsync", fsync_every=3)
+    for number in range(7):
+        sink.write({"value": number})
+    assert len(synced) == 2
+    sink.close()
+    assert len(synced) == 3
+    assert sink.fsyncs == 3
+
+
+def test_appends_to_existing_file(tmp_path):
+    path = str(tmp_path / "node.json")
+    for number in range(2):
+        sink = FileSink(path)
+        sink.write({"value": number})
+        sink.close()
+    assert _read(path) == [{"value": 0}, {"value": 1}]
+
+
+def test_write_to_closed_sink_raises(tmp_path):
+    sink = FileSink(str(tmp_path / "node.json"))
+    sink.close()
+    sink.close()
+    assert sink.closed
+    with pytest.raises(FileSinkException):
+        sink.write({"value": 1})
+
+
+def test_unknown_durability_raises(tmp_path):
+    with pytest.raises(FileSinkException):
+        FileSink(str(tmp_path / "node.json"), durability="always")
+
+
+def test_lag_is_share_of_time_spent_writing(tmp_path):
+    sink = FileSink(str(tmp_path / "node.json"))
+    sink.lag()
+    assert sink.lag() == 0.0
+    sink.write({"value": 1})
+    assert 0.0 < sink.lag() <= 1.0
+    sink.close()
@@ -0,0 +1,71 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of reading an Inventory from csv- and ini-files."""
+import pytest
+
+from datacollector.collector.inventory import Inventory, InventoryException
+
+
+def _write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def _fields(inventory):
+    return [(node.name, node.hostname, node.port, node.username, node.password, node.connection)
+            for node in inventory]
+
+
+def test_csv_inventory_is_read(tmp_path):
+    path = _write(tmp_path, "nodes.csv", "name,hostname,port,username,password,connection\n"
+                                         "drone-1,10.0.0.1,2222,user,secret,\n"
+                                         "drone-2,10.0.0.2,,admin,pass,LOCAL\n"
+                                         ",10.0.0.3,22,user,secret,ssh\n")
+    inventory = Inventory(path)
+    assert _fields(inventory) == [("drone-1", "10.0.0.1", 2222, "user", "secret", "ssh"),
+                                  ("drone-2", "10.0.0.2", 22, "admin", "pass", "local"),
+                                  ("10.0.0.3", "10.0.0.3", 22, "user", "secret", "ssh")]
+
+
+def test_ini_inventory_is_read(tmp_path):
+    path = _write(tmp_path, "nodes.ini", "[drone-1]\nhostname = 10.0.0.1\nport = 2222\nusername = user\n"
+                                         "password = secret\n\n[host]\nhostname = localhost\nconnection = local\n")
+    inventory = Inventory(path)
+    assert _fields(inventory) == [("drone-1", "10.0.0.1", 2222, "user", "secret", "ssh"),
+                                  ("host", "localhost", 22, "", "", "local")]
+
+
+def test_malformed_csv_rows_are_skipped(tmp_path):
+    path = _write(tmp_path, "nodes.csv", "name,hostname,port,username,password,connection\n"
+                                         "no-host,,22,user,secret,\n"
+                                         "bad-port,10.0.0.2,ssh,user,secret,\n"
+                                         "bad-connection,10.0.0.3,22,user,secret,telnet\n"
+                                         "short,10.0.0.4\n"
+                                         "drone-1,10.0.0.1,22,user,secret,\n"
+                                         "drone-1,10.0.0.5,22,user,secret,\n")
+    inventory = Inventory(path)
+    assert [(node.name, node.hostname) for node in inventory] == [("short", "10.0.0.4"), ("drone-1", "10.0.0.1")]
+
+
+def test_malformed_ini_sections_are_skipped(tmp_path):
+    path = _write(tmp_path, "nodes.ini", "[no-host]\nport = 22\n\n[bad-port]\nhostname = 10.0.0.2\nport = x\n\n"
+                                         "[bad-connection]\nhostname = 10.0.0.3\nconnection = telnet\n\n"
+                                         "[drone-1]\nhostname = 10.0.0.1\n")
+    inventory = Inventory(path)
+    assert [node.name for node in inventory] == ["drone-1"]
+
+
+@pytest.mark.parametrize("name", ["missing.csv", "missing.ini"])
+def test_missing_inventory_file_raises(tmp_path, name):
+    with pytest.raises(InventoryException):
+        Inventory(str(tmp_path / name))
+
+
+def test_unreadable_ini_inventory_raises(tmp_path):
+    path = _write(tmp_path, "nodes.ini", "hostname = 10.0.0.1\n")
+    with pytest.raises(InventoryException):
+        Inventory(path)
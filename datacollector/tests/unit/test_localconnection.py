@@ -0,0 +1,154 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of LocalConnection reading a fake /proc through kept file descriptors."""
+import errno
+import os
+
+import pytest
+
+from datacollector.collector import localconnection
+from datacollector.collector.localconnection import LocalConnection, UnsupportedCommandException
+from datacollector.collector.process_table import PROCESS_COMMAND
+
+CPU_LINE = "cpu  10 0 10 100 0 0 0 0 0 0\n"
+
+
+def _stat(pid, ticks=1):
+    return "{0} (cmd{0}) S 1 0 0 0 0 0 0 0 0 0 {1} {1} 0 0 20 0 1 0 {0}\n".format(pid, ticks)
+
+
+def _write_process(proc, pid, ticks=1, pages=50):
+    (proc / str(pid)).mkdir(exist_ok=True)
+    (proc / str(pid) / "stat").write_text(_stat(pid, ticks))
+    (proc / str(pid) / "statm").write_text("100 {} 10 0 0 0 0\n".format(pages))
+
+
+@pytest.fixture
+def proc(tmp_path, monkeypatch):
+    proc = tmp_path / "proc"
+    proc.mkdir()
+    (proc / "stat").write_text(CPU_LINE + "cpu0 10 0 10 100 0 0 0 0 0 0\n")
+    (proc / "meminfo").write_text("MemTotal:       28803616 kB\nMemFree:        27841200 kB\n")
+    for pid in (1, 12):
+        _write_process(proc, pid)
+    monkeypatch.setattr(localconnection, "PROC", str(proc))
+    return proc
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Record the paths opened by LocalConnection."""
+    paths = []
+    real_open = os.open
+
+    def recording_open(path, flags, *args):
+        paths.append(path)
+        return real_open(path, flags, *args)
+
+    monkeypatch.setattr(localconnection.os, "open", recording_open)
+    return paths
+
+
+@pytest.fixture
+def failing_fds(monkeypatch):
+    """File descriptor -> errno failing its next pread, like a kept descriptor of an ended process."""
+    fds = {}
+    real_pread = os.pread
+
+    def pread(fd, size, offset):
+        if fd in fds:
+            error = fds.pop(fd)
+            raise OSError(error, os.strerror(error))
+        return real_pread(fd, size, offset)
+
+    monkeypatch.setattr(localconnection.os, "pread", pread)
+    return fds
+
+
+def test_process_command_reads_proc(proc):
+    connection = LocalConnection()
+    lines = connection._execute_command(PROCESS_COMMAND)
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    assert lines == [CPU_LINE, "pagesize {}\n".format(page_size), _stat(1), _stat(12),
+                     "{}/1/statm:100 50 10 0 0 0 0\n".format(proc), "{}/12/statm:100 50 10 0 0 0 0\n".format(proc)]
+    connection.close_session()
+
+
+def test_repeated_reads_use_kept_descriptors(proc, opened):
+    connection = LocalConnection()
+    connection._execute_command("cat {}/meminfo".format(proc))
+    connection._execute_command(PROCESS_COMMAND)
+    first_opens = len(opened)
+    _write_process(proc, 12, ticks=7, pages=80)
+    (proc / "meminfo").write_text("MemTotal:       28803616 kB\nMemFree:        100 kB\n")
+    assert connection._execute_command("cat {}/meminfo".format(proc))[1] == "MemFree:        100 kB\n"
+    lines = connection._execute_command(PROCESS_COMMAND)
+    assert _stat(12, ticks=7) in lines
+    assert "{}/12/statm:100 80 10 0 0 0 0\n".format(proc) in lines
+    assert len(opened) == first_opens
+    connection.close_session()
+    assert connection._files == {}
+
+
+def test_descriptor_of_reused_pid_is_reopened(proc, failing_fds, opened):
+    connection = LocalConnection()
+    connection._execute_command(PROCESS_COMMAND)
+    stale = connection._files["{}/12/stat".format(proc)]
+    failing_fds[stale] = errno.ESRCH
+    _write_process(proc, 12, ticks=9)
+    lines = connection._execute_command(PROCESS_COMMAND)
+    assert _stat(12, ticks=9) in lines
+    assert opened.count("{}/12/stat".format(proc)) == 2
+    connection.close_session()
+
+
+def test_ended_process_is_skipped_and_its_descriptors_closed(proc, failing_fds):
+    connection = LocalConnection()
+    connection._execute_command(PROCESS_COMMAND)
+    failing_fds.update((fd, errno.ESRCH) for path, fd in connection._files.items() if "/12/" in path)
+    for name in ("stat", "statm"):
+        (proc / "12" / name).unlink()
+    (proc / "12").rmdir()
+    lines = connection._execute_command(PROCESS_COMMAND)
+    assert _stat(12) not in lines
+    assert _stat(1) in lines
+    assert not any("/12/" in path for path in connection._files)
+    connection.close_session()
+
+
+def test_descriptor_failing_with_enoent_is_reopened(proc, failing_fds):
+    connection = LocalConnection()
+    path = "{}/meminfo".format(proc)
+    connection._execute_command("cat " + path)
+    failing_fds[connection._files[path]] = errno.ENOENT
+    (proc / "meminfo").write_text("MemTotal:       1 kB\n")
+    assert connection._execute_command("cat " + path) == ["MemTotal:       1 kB\n"]
+    assert path in connection._files
+    connection.close_session()
+
+
+def test_removed_file_is_reported_missing(proc, failing_fds):
+    connection = LocalConnection()
+    path = "{}/meminfo".format(proc)
+    connection._execute_command("cat " + path)
+    failing_fds[connection._files[path]] = errno.ENOENT
+    (proc / "meminfo").unlink()
+    with pytest.raises(FileNotFoundError):
+        connection._execute_command("cat " + path)
+    assert path not in connection._files
+
+
+def test_descriptors_beyond_limit_are_not_kept(proc):
+    connection = LocalConnection(max_open_files=2)
+    lines = connection._execute_command(PROCESS_COMMAND)
+    assert _stat(12) in lines
+    assert len(connection._files) == 2
+    connection.close_session()
+
+
+def test_unsupported_command_raises(proc):
+    with pytest.raises(UnsupportedCommandException):
+        LocalConnection()._execute_command("ls {}".format(proc))
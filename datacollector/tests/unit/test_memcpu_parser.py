@@ -0,0 +1,64 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of the CPU counter parsing and utilisation calculation."""
+import numpy as np
+import pytest
+
+from datacollector.collector.memcpu_parser import (CPU_FIELDS, CpuUtilisationCalculationException, MemCpuParser,
+                                                   cpu_utilisation_array, parse_cpu_counters)
+from datacollector.collector.sample import CpuSample
+
+LINES = ["cpu  74608 2520 24433 1117073 6176 4054 0 0 0 0\n", "cpu0 37304 1260 12216 558536 3088 2027 0 0 0 0\n"]
+
+
+def test_parse_cpu_counters():
+    names, counters = parse_cpu_counters(LINES)
+    assert names == ("cpu", "cpu0")
+    assert counters.dtype == np.int64
+    assert counters.shape == (2, len(CPU_FIELDS))
+    assert counters[1, 3] == 558536
+
+
+@pytest.mark.parametrize("lines", [["cpu 1 2 x 4\n"], ["cpu 1 2 3 4\n", "cpu0 1 2\n"]])
+def test_parse_malformed_cpu_counters(lines):
+    with pytest.raises(CpuUtilisationCalculationException):
+        parse_cpu_counters(lines)
+
+
+def test_utilisation_matches_scalar_calculation():
+    names, previous = parse_cpu_counters(LINES)
+    counters = previous + np.array([[30, 0, 10, 50, 10, 0, 0, 0, 0, 0], [5, 1, 2, 90, 0, 2, 0, 0, 0, 0]])
+    utilisation = cpu_utilisation_array(counters, previous)
+    parser = MemCpuParser()
+    for index in range(len(names)):
+        current = dict(zip(CPU_FIELDS, counters[index]))
+        expected = parser.cpu_utilisation(current, dict(zip(CPU_FIELDS, previous[index])))
+        assert utilisation[index] == pytest.approx(expected)
+
+
+def test_core_without_elapsed_time_has_zero_utilisation():
+    _, previous = parse_cpu_counters(LINES)
+    counters = previous.copy()
+    counters[0, 0] += 10
+    counters[0, 3] += 30
+    utilisation = cpu_utilisation_array(counters, previous)
+    assert utilisation[0] == pytest.approx(25.0)
+    assert utilisation[1] == 0.0
+
+
+def test_update_utilisation_keeps_previous_counters():
+    parser = MemCpuParser()
+    first = CpuSample.from_lines(LINES)
+    parser.update_utilisation(first)
+    second = CpuSample.from_lines(LINES)
+    parser.update_utilisation(second)
+    assert list(second.utilisation) == [0.0, 0.0]
+
+
+def test_too_few_fields_raises():
+    counters = np.ones((1, 4), dtype=np.int64)
+    with pytest.raises(CpuUtilisationCalculationException):
+        cpu_utilisation_array(counters, np.zeros_like(counters))
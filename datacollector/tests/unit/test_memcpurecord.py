@@ -0,0 +1,152 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of MemCpuRecord writing samples with incremental process data."""
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from datacollector.collector import memcpurecord
+from datacollector.collector.batched_command import BatchedCommand
+from datacollector.collector.collector_config_parser import CollectorConfig
+from datacollector.collector.process_delta import KEYFRAME_KEY, ProcessDeltaDecoder
+from datacollector.collector.segments import iter_data_lines
+
+RUN_ID = "run"
+MEM_LINES = ["MemTotal:       28803616 kB\n", "MemFree:        27841200 kB\n", "MemAvailable:   28058048 kB\n"]
+
+
+def _cpu_lines(tick):
+    return ["cpu  {0} 0 {0} {1} 0 0 0 0 0 0\n".format(100 * tick, 1000 * tick),
+            "cpu0 {0} 0 {0} {1} 0 0 0 0 0 0\n".format(100 * tick, 1000 * tick)]
+
+
+def _process_lines(tick, pids):
+    lines = [_cpu_lines(tick)[0], "pagesize 4096\n"]
+    for pid in pids:
+        fields = ["S", "1"] + ["0"] * 9 + [str(10 * tick), str(tick)] + ["0"] * 4 + ["1", "0", str(pid)]
+        lines.append("{} (cmd{}) {}\n".format(pid, pid, " ".join(fields)))
+    lines += ["/proc/{}/statm:100 {} 10 0 0 0 0\n".format(pid, 50 + tick) for pid in pids]
+    return lines
+
+
+@pytest.fixture
+def make_record(tmp_path, monkeypatch):
+    monkeypatch.setattr(memcpurecord, "__file__", str(tmp_path / "collector" / "memcpurecord.py"))
+    os.makedirs(str(tmp_path / "data" / RUN_ID))
+    records = []
+
+    def make(name="node", **values):
+        config = CollectorConfig("collector")
+        config.update(**dict({"index_to_elastic": False, "process_delta": True, "process_keyframe_interval": 100,
+                              "process_cpu_threshold": 100.0, "file_format": "json"}, **values))
+        collector = SimpleNamespace(main_collector=SimpleNamespace(collector_config=config), node_run_id=RUN_ID)
+        record = memcpurecord.MemCpuRecord(name, collector)
+        records.append(record)
+        return record
+
+    yield make
+    for record in records:
+        record.close()
+
+
+def _rows(tmp_path, name="node"):
+    return [json.loads(line) for line in iter_data_lines(str(tmp_path / "data" / RUN_ID), name)]
+
+
+def _decoded_pids(rows):
+    decoder = ProcessDeltaDecoder()
+    snapshots = []
+    for row in rows:
+        decoded = decoder.decode(row)
+        snapshots.append(sorted(process["pid"] for key, process in decoded.items() if key.startswith("process_")))
+    return snapshots
+
+
+def test_process_deltas_decode_to_full_tables(tmp_path, make_record):
+    record = make_record()
+    tables = [[1, 2, 3], [1, 2, 3, 4], [2, 3, 4], [2, 3, 4, 5]]
+    for tick, pids in enumerate(tables, 1):
+        record.ingest_data("t{}".format(tick), _cpu_lines(tick), MEM_LINES, _process_lines(tick, pids))
+    record.close()
+    rows = _rows(tmp_path)
+    assert rows[0][KEYFRAME_KEY] and not rows[1].get(KEYFRAME_KEY)
+    assert _decoded_pids(rows) == [sorted(str(pid) for pid in pids) for pids in tables]
+
+
+def test_failed_utilisation_does_not_advance_encoder(tmp_path, make_record, monkeypatch):
+    record = make_record()
+    record.ingest_data("t1", _cpu_lines(1), MEM_LINES, _process_lines(1, [1, 2, 3]))
+
+    def fail(cpu):
+        raise ValueError("no elapsed time")
+
+    monkeypatch.setattr(record._parser, "update_utilisation", fail)
+    with pytest.raises(ValueError):
+        record.ingest_data("t2", _cpu_lines(2), MEM_LINES, _process_lines(2, [1, 2]))
+    monkeypatch.undo()
+    record.ingest_data("t3", _cpu_lines(3), MEM_LINES, _process_lines(3, [1, 2]))
+    record.close()
+    rows = _rows(tmp_path)
+    assert [row["timestamp"] for row in rows] == ["t1", "t3"]
+    assert _decoded_pids(rows) == [["1", "2", "3"], ["1", "2"]]
+
+
+def test_failed_write_forces_keyframe(tmp_path, make_record, monkeypatch):
+    record = make_record()
+    record.ingest_data("t1", _cpu_lines(1), MEM_LINES, _process_lines(1, [1, 2]))
+
+    def fail(row):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(record._sink, "write", fail)
+    with pytest.raises(OSError):
+        record.ingest_data("t2", _cpu_lines(2), MEM_LINES, _process_lines(2, [1, 2, 3]))
+    monkeypatch.undo()
+    record.ingest_data("t3", _cpu_lines(3), MEM_LINES, _process_lines(3, [1, 3]))
+    record.close()
+    rows = _rows(tmp_path)
+    assert rows[1][KEYFRAME_KEY]
+    assert _decoded_pids(rows) == [["1", "2"], ["1", "3"]]
+
+
+def test_rotation_between_process_samples_starts_segment_with_keyframe(tmp_path, make_record):
+    record = make_record(file_rotate_bytes=600)
+    for tick in range(1, 30):
+        process = _process_lines(tick, [1, 2, tick + 2]) if tick % 4 == 0 else None
+        record.ingest_data("t{:02d}".format(tick), _cpu_lines(tick), MEM_LINES, process)
+    record.close()
+    directory = tmp_path / "data" / RUN_ID
+    segments = sorted(name for name in os.listdir(str(directory)) if name.startswith("node.0"))
+    assert segments
+    for name in segments + ["node.json"]:
+        with open(str(directory / name)) as file:
+            rows = [json.loads(line) for line in file]
+        process_rows = [row for row in rows if any(key.startswith("process_") for key in row)]
+        if process_rows:
+            assert process_rows[0].get(KEYFRAME_KEY)
+
+
+def test_streamed_sections_match_sections_read_as_whole(tmp_path, make_record):
+    batch = BatchedCommand([("cpu", "cat /proc/stat"), ("memory", "cat /proc/meminfo"), ("process", "ps")])
+    whole = make_record()
+    streamed = make_record("streamed")
+    for tick in (1, 2):
+        sections = {"cpu": _cpu_lines(tick), "memory": MEM_LINES, "process": _process_lines(tick, [1, 2])}
+        whole.ingest_sections("t", sections, "s")
+        lines = []
+        for name in batch.names:
+            lines += ["#DC-BEGIN {}\n".format(name)] + sections[name] + ["#DC-END {} 0\n".format(name)]
+        streamed.ingest_stream(batch.iter_sections(iter(lines)), "s")
+    whole.close()
+    streamed.close()
+    rows = _rows(tmp_path)
+    streamed_rows = _rows(tmp_path, "streamed")
+    for row in streamed_rows:
+        row["timestamp"] = "t"
+    assert streamed_rows == rows
+    assert "process_0" in rows[0]
@@ -0,0 +1,85 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of the incremental encoding of the process table."""
+import json
+
+import pytest
+
+from datacollector.collector.process_delta import (DELTA_KEY, KEYFRAME_KEY, ProcessDeltaDecoder,
+                                                   ProcessDeltaEncoder, ProcessDeltaException)
+
+
+def _process(pid, cpu=1.0, res=1000, state="S"):
+    return {"pid": str(pid), "ppid": "1", "command": "cmd{}".format(pid), "state": state, "threads": 1,
+            "cpu": cpu, "res": res}
+
+
+def _pids(row):
+    return sorted(process["pid"] for key, process in row.items() if key.startswith("process_"))
+
+
+def test_keyframe_every_interval():
+    encoder = ProcessDeltaEncoder(keyframe_interval=3)
+    rows = [encoder.encode([_process(1)]) for _ in range(7)]
+    assert [bool(row.get(KEYFRAME_KEY)) for row in rows] == [True, False, False, True, False, False, True]
+
+
+def test_delta_contains_only_differences():
+    encoder = ProcessDeltaEncoder(cpu_threshold=1.0, memory_threshold=1024)
+    encoder.encode([_process(1), _process(2), _process(3)])
+    delta = encoder.encode([_process(1, cpu=1.5), _process(2, cpu=5.0), _process(4)])[DELTA_KEY]
+    assert [process["pid"] for process in delta["added"]] == ["4"]
+    assert [process["pid"] for process in delta["changed"]] == ["2"]
+    assert delta["removed"] == ["3"]
+
+
+def test_small_changes_accumulate_against_last_written_state():
+    encoder = ProcessDeltaEncoder(cpu_threshold=1.0)
+    encoder.encode([_process(1, cpu=1.0)])
+    assert encoder.encode([_process(1, cpu=1.6)])[DELTA_KEY]["changed"] == []
+    assert encoder.encode([_process(1, cpu=2.2)])[DELTA_KEY]["changed"] == [_process(1, cpu=2.2)]
+
+
+def test_identity_and_memory_changes():
+    encoder = ProcessDeltaEncoder(memory_threshold=100)
+    encoder.encode([_process(1), _process(2)])
+    delta = encoder.encode([_process(1, state="R"), _process(2, res=1100)])[DELTA_KEY]
+    assert [process["pid"] for process in delta["changed"]] == ["1", "2"]
+
+
+def test_round_trip_through_json():
+    encoder = ProcessDeltaEncoder(keyframe_interval=4, cpu_threshold=0.0)
+    decoder = ProcessDeltaDecoder()
+    tables = [[1, 2, 3], [1, 2, 3, 4], [2, 3, 4], [2, 4, 10], [2, 4, 10], [5], []]
+    for number, pids in enumerate(tables):
+        processes = [_process(pid, cpu=float(number)) for pid in pids]
+        row = json.loads(json.dumps(encoder.encode(processes)))
+        decoded = decoder.decode(row)
+        assert _pids(decoded) == sorted(str(pid) for pid in pids)
+        assert all(process["cpu"] == float(number) for key, process in decoded.items()
+                   if key.startswith("process_"))
+        assert KEYFRAME_KEY not in decoded and DELTA_KEY not in decoded
+
+
+def test_forced_keyframe_can_be_decoded_alone():
+    encoder = ProcessDeltaEncoder(keyframe_interval=100)
+    encoder.encode([_process(1)])
+    encoder.encode([_process(1), _process(2)])
+    encoder.force_keyframe()
+    row = encoder.encode([_process(2), _process(3)])
+    assert row[KEYFRAME_KEY]
+    assert _pids(ProcessDeltaDecoder().decode(row)) == ["2", "3"]
+
+
+def test_delta_before_keyframe_raises():
+    encoder = ProcessDeltaEncoder()
+    encoder.encode([_process(1)])
+    with pytest.raises(ProcessDeltaException):
+        ProcessDeltaDecoder().decode(encoder.encode([_process(1), _process(2)]))
+
+
+def test_row_without_process_data_is_unchanged():
+    assert ProcessDeltaDecoder().decode({"timestamp": "t"}) == {"timestamp": "t"}
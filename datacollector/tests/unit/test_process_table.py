@@ -0,0 +1,73 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of the process table built from /proc/[pid]/stat lines."""
+import pytest
+
+from datacollector.collector.process_table import ProcessParseException, ProcessTable
+
+
+def _stat(pid, command="cmd", utime=0, stime=0, starttime=1, threads=1, state="S", ppid=1):
+    fields = [state, str(ppid)] + ["0"] * 9 + [str(utime), str(stime)] + ["0"] * 4 + [str(threads), "0",
+                                                                                      str(starttime)]
+    return "{} ({}) {}\n".format(pid, command, " ".join(fields))
+
+
+def _lines(total, stats, statms=(), pagesize=4096):
+    return (["cpu  {} 0 0 0 0 0 0 0 0 0\n".format(total), "pagesize {}\n".format(pagesize)] + list(stats)
+            + list(statms))
+
+
+def test_first_collection_has_no_cpu():
+    processes = ProcessTable().update(_lines(1000, [_stat(10, utime=5), _stat(2)]))
+    assert [process["pid"] for process in processes] == ["2", "10"]
+    assert all(process["cpu"] is None for process in processes)
+    assert processes[1]["utime"] == 5
+
+
+def test_cpu_is_share_of_total_time():
+    table = ProcessTable()
+    table.update(_lines(1000, [_stat(1, utime=10, stime=10)]))
+    processes = table.update(_lines(1200, [_stat(1, utime=40, stime=30)]))
+    assert processes[0]["cpu"] == 25.0
+
+
+def test_reused_pid_has_no_cpu():
+    table = ProcessTable()
+    table.update(_lines(1000, [_stat(1, utime=10, starttime=1)]))
+    processes = table.update(_lines(1200, [_stat(1, utime=20, starttime=500)]))
+    assert processes[0]["cpu"] is None
+
+
+def test_command_with_spaces_and_parentheses():
+    processes = ProcessTable().update(_lines(1000, [_stat(7, command="tmux: server (1)", state="R", ppid=3)]))
+    assert processes[0]["command"] == "tmux: server (1)"
+    assert processes[0]["state"] == "R"
+    assert processes[0]["ppid"] == "3"
+
+
+def test_memory_is_read_from_statm():
+    lines = _lines(1000, [_stat(1)], ["/proc/1/statm:100 50 10 0 0 0 0\n"], pagesize=8192)
+    process = ProcessTable().update(lines)[0]
+    assert (process["virt"], process["res"], process["shr"]) == (800, 400, 80)
+
+
+def test_ended_processes_are_evicted():
+    table = ProcessTable()
+    table.update(_lines(1000, [_stat(1), _stat(2), _stat(3)]))
+    table.update(_lines(1100, [_stat(1)]))
+    assert len(table) == 1
+    assert table.evicted == 2
+
+
+def test_missing_cpu_line_raises():
+    with pytest.raises(ProcessParseException):
+        ProcessTable().update([_stat(1)])
+
+
+@pytest.mark.parametrize("line", ["1 cmd S 1\n", "1 (cmd) S 1 2 3\n"])
+def test_invalid_stat_line_raises(line):
+    with pytest.raises(ProcessParseException):
+        ProcessTable().update(_lines(1000, [line]))
@@ -0,0 +1,150 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of BackoffPolicy, CircuitBreaker and ReconnectScheduler with an injected clock and random source."""
+import random
+import threading
+
+from datacollector.collector.reconnect_policy import BackoffPolicy, CircuitBreaker, ReconnectScheduler
+
+
+class FakeClock:
+    """Clock that only moves when advanced."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class CeilingRng:
+    """Random source returning the upper bound of every range."""
+
+    @staticmethod
+    def uniform(low, high):
+        return high
+
+
+def test_backoff_grows_exponentially_up_to_cap():
+    policy = BackoffPolicy(base=0.5, cap=10.0, multiplier=2.0, rng=CeilingRng())
+    assert [policy.delay(attempt) for attempt in range(7)] == [0.5, 1.0, 2.0, 4.0, 8.0, 10.0, 10.0]
+
+
+def test_backoff_is_capped_for_large_attempts():
+    policy = BackoffPolicy(base=1.0, cap=60.0, rng=CeilingRng())
+    assert policy.delay(10 ** 6) == 60.0
+
+
+def test_backoff_jitter_stays_within_bounds():
+    policy = BackoffPolicy(base=1.0, cap=30.0, rng=random.Random(42))
+    for attempt in range(10):
+        delays = [policy.delay(attempt) for _ in range(200)]
+        ceiling = min(30.0, 2.0 ** attempt)
+        assert all(0.0 <= delay <= ceiling for delay in delays)
+        assert max(delays) > ceiling / 2
+
+
+def test_backoff_is_reproducible_with_seeded_rng():
+    first = BackoffPolicy(rng=random.Random(7))
+    second = BackoffPolicy(rng=random.Random(7))
+    assert [first.delay(n) for n in range(5)] == [second.delay(n) for n in range(5)]
+
+
+def test_breaker_opens_at_threshold():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60.0, clock=clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert not breaker.degraded
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.degraded
+    assert breaker.failures == 3
+    clock.advance(20.0)
+    assert breaker.retry_after() == 40.0
+
+
+def test_breaker_half_opens_after_reset_timeout_and_closes_on_success():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0, clock=clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    clock.advance(59.0)
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.advance(1.0)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.retry_after() == 0.0
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+    assert not breaker.degraded
+
+
+def test_breaker_reopens_after_failed_half_open_attempt():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0, clock=clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    clock.advance(60.0)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.retry_after() == 60.0
+
+
+def test_scheduler_runs_due_callbacks_in_order_of_due_time():
+    clock = FakeClock()
+    scheduler = ReconnectScheduler(workers=1, clock=clock)
+    calls = []
+    done = threading.Event()
+
+    def callback(name):
+        def run():
+            calls.append(name)
+            if len(calls) == 3:
+                done.set()
+        return run
+
+    scheduler.schedule(callback("third"), 3.0)
+    scheduler.schedule(callback("first"), 1.0)
+    scheduler.schedule(callback("later"), 20.0)
+    scheduler.schedule(callback("second"), 2.0)
+    clock.advance(10.0)
+    scheduler.start()
+    try:
+        assert done.wait(5)
+    finally:
+        scheduler.stop()
+    assert calls == ["first", "second", "third"]
+
+
+def test_scheduler_keeps_order_of_equal_due_times():
+    clock = FakeClock()
+    scheduler = ReconnectScheduler(workers=1, clock=clock)
+    calls = []
+    done = threading.Event()
+    for name in range(5):
+        scheduler.schedule(lambda name=name: (calls.append(name), len(calls) == 5 and done.set()), 1.0)
+    clock.advance(1.0)
+    scheduler.start()
+    try:
+        assert done.wait(5)
+    finally:
+        scheduler.stop()
+    assert calls == [0, 1, 2, 3, 4]
+
+
+def test_scheduler_drops_callbacks_after_stop():
+    scheduler = ReconnectScheduler(workers=1, clock=FakeClock())
+    calls = []
+    scheduler.start()
+    scheduler.stop()
+    scheduler.schedule(lambda: calls.append(1), 0.0)
+    assert calls == []
@@ -0,0 +1,114 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of the collection tick and metric source scheduling."""
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from datacollector.collector import inodecollector, memcpurecord
+from datacollector.collector.batched_command import BatchFramingException
+from datacollector.collector.collector_config_parser import CollectorConfig
+from datacollector.collector.memcpunodecollector import MemCpuNodeCollector
+from datacollector.collector.scheduler import AlignedScheduler, SourceSchedule
+
+
+def test_first_tick_is_aligned_to_interval():
+    scheduler = AlignedScheduler(5)
+    assert scheduler.first_tick(1000.0) == 1000.0
+    assert scheduler.first_tick(1001.2) == 1005.0
+
+
+def test_first_tick_without_alignment_is_now():
+    assert AlignedScheduler(5, align=False).first_tick(1001.2) == 1001.2
+
+
+def test_next_tick_does_not_drift():
+    scheduler = AlignedScheduler(5)
+    assert scheduler.next_tick(1000.0, now=1003.9) == 1005.0
+
+
+def test_next_tick_skips_missed_ticks():
+    scheduler = AlignedScheduler(5)
+    assert scheduler.next_tick(1000.0, now=1017.0) == 1020.0
+    assert scheduler.next_tick(1000.0, now=1020.0) == 1025.0
+
+
+def test_phase_offsets_are_deterministic_and_within_spread():
+    scheduler = AlignedScheduler(10, phase_spread=0.5)
+    offsets = [scheduler.phase_offset("node{}".format(number)) for number in range(50)]
+    assert offsets == [AlignedScheduler(10, phase_spread=0.5).phase_offset("node{}".format(number))
+                       for number in range(50)]
+    assert all(0.0 <= offset < 5.0 for offset in offsets)
+    assert len(set(offsets)) > 1
+    assert AlignedScheduler(10).phase_offset("node1") == 0.0
+
+
+def test_wait_until_returns_on_stop():
+    stop_event = threading.Event()
+    stop_event.set()
+    assert AlignedScheduler.wait_until(float("inf"), stop_event)
+    assert not AlignedScheduler.wait_until(0.0, threading.Event())
+
+
+def test_sources_are_due_once_per_window():
+    schedule = SourceSchedule([("cpu", 1), ("memory", 5), ("process", 60)])
+    due = []
+    for tick in range(1200, 1212):
+        names = schedule.due(tick)
+        schedule.mark_collected(names, tick)
+        due.append(names)
+    assert due[0] == ["cpu", "memory", "process"]
+    assert due[1] == ["cpu"]
+    assert due[5] == ["cpu", "memory"]
+    assert sum("process" in names for names in due) == 1
+
+
+def test_uncollected_source_stays_due_in_window():
+    schedule = SourceSchedule([("cpu", 1), ("process", 60)])
+    assert schedule.due(1200) == ["cpu", "process"]
+    schedule.mark_collected(["cpu"], 1200)
+    assert schedule.due(1201) == ["cpu", "process"]
+    schedule.mark_collected(["cpu", "process"], 1201)
+    assert schedule.due(1202) == ["cpu"]
+    assert schedule.due(1260) == ["cpu", "process"]
+
+
+class FakeConnection:
+    """Connection failing the first batched collection."""
+
+    hostname = "node"
+
+    def __init__(self):
+        self.batches = []
+
+    def execute_batch_stream(self, batch):
+        self.batches.append(list(batch.names))
+        if len(self.batches) == 1:
+            raise BatchFramingException("torn output")
+        return iter(())
+
+
+@pytest.fixture
+def collector(tmp_path, monkeypatch):
+    monkeypatch.setattr(inodecollector, "__file__", str(tmp_path / "collector" / "inodecollector.py"))
+    monkeypatch.setattr(memcpurecord, "__file__", str(tmp_path / "collector" / "memcpurecord.py"))
+    config = CollectorConfig("collector")
+    config.update(index_to_elastic=False, batch_commands=True, process_interval=60)
+    main_collector = SimpleNamespace(collector_config=config, collect_interval=1, backpressure=None,
+                                     scheduler=AlignedScheduler(1), agent=SimpleNamespace(collect_id="run"))
+    collector = MemCpuNodeCollector(main_collector, FakeConnection())
+    monkeypatch.setattr(collector._record, "ingest_stream", lambda sections, scheduled_timestamp: None)
+    yield collector
+    collector.close_record()
+
+
+def test_failed_collection_is_retried_on_next_tick(collector):
+    for tick in (1200, 1201, 1202):
+        collector._scheduled_time = tick
+        collector._try_collect()
+    assert collector.connection.batches == [["cpu", "memory", "process"], ["cpu", "memory", "process"],
+                                            ["cpu", "memory"]]
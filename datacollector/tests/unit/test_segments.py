@@ -0,0 +1,170 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of the rotating file sink, segment manifest and segment reader."""
+import json
+import os
+
+import pytest
+
+from datacollector.collector.file_sink import RotatingFileSink
+from datacollector.collector.process_delta import DELTA_KEY, KEYFRAME_KEY, ProcessDeltaDecoder, ProcessDeltaEncoder
+from datacollector.collector.segments import SegmentCompressor, SegmentManifest, iter_data_lines
+
+
+def _timestamp(number):
+    return "2021-05-04T10:{:02d}:{:02d}".format(number // 60, number % 60)
+
+
+def _processes(number):
+    return [{"pid": str(pid), "command": "cmd{}".format(pid), "state": "S", "ppid": "1", "threads": 1,
+             "cpu": float(number % 7), "res": 1000} for pid in range(1, 4 + number % 3)]
+
+
+def _sink(tmp_path, **kwargs):
+    return RotatingFileSink(str(tmp_path / "node.json"), durability="flush", **kwargs)
+
+
+def _segment_rows(tmp_path):
+    """Return the rows of each segment in order, the active segment last."""
+    manifest = SegmentManifest.load(str(tmp_path), "node")
+    files = [segment["file"] for segment in manifest] + ["node.json"]
+    rows = []
+    for file in files:
+        if os.path.exists(str(tmp_path / file)):
+            with open(str(tmp_path / file)) as lines:
+                rows.append([json.loads(line) for line in lines])
+    return rows
+
+
+def test_rotates_by_size_and_records_manifest(tmp_path):
+    sink = _sink(tmp_path, rotate_bytes=200)
+    for number in range(20):
+        sink.write({"timestamp": _timestamp(number), "value": number})
+    sink.close()
+    segments = SegmentManifest.load(str(tmp_path), "node")
+    assert sink.rotations == len(segments) > 1
+    assert [segment["sequence"] for segment in segments] == list(range(1, len(segments) + 1))
+    assert segments[0]["start"] == _timestamp(0)
+    assert all(segment["offset"] == previous["offset"] + previous["bytes"]
+               for previous, segment in zip(segments, segments[1:]))
+    values = [json.loads(line)["value"] for line in iter_data_lines(str(tmp_path), "node")]
+    assert values == list(range(20))
+
+
+def test_manifest_sequence_continues_after_restart(tmp_path):
+    for _ in range(2):
+        sink = _sink(tmp_path, rotate_bytes=100)
+        for number in range(5):
+            sink.write({"timestamp": _timestamp(number), "value": number})
+        sink.close()
+    segments = SegmentManifest.load(str(tmp_path), "node")
+    assert len({segment["sequence"] for segment in segments}) == len(segments)
+
+
+def test_range_read_skips_segments(tmp_path):
+    sink = _sink(tmp_path, rotate_bytes=150)
+    for number in range(30):
+        sink.write({"timestamp": _timestamp(number), "value": number})
+    sink.close()
+    lines = list(iter_data_lines(str(tmp_path), "node", start=_timestamp(25)))
+    values = [json.loads(line)["value"] for line in lines]
+    assert 25 in values and 0 not in values
+
+
+@pytest.mark.parametrize("compression", ["gzip", "lzma"])
+def test_compressed_segments_are_read_back(tmp_path, compression):
+    compressor = SegmentCompressor()
+    run = tmp_path / "run"
+    run.mkdir()
+    sink = _sink(run, rotate_bytes=150, compression=compression, compressor=compressor)
+    for number in range(20):
+        sink.write({"timestamp": _timestamp(number), "value": number})
+    sink.close()
+    assert compressor.pending == 0
+    assert compressor.compressed == sink.rotations
+    assert all(segment["file"].endswith((".gz", ".xz")) for segment in SegmentManifest.load(str(run), "node"))
+    assert [json.loads(line)["value"] for line in iter_data_lines(str(run), "node")] == list(range(20))
+    assert not [name for name in os.listdir(str(run)) if name.endswith(".tmp")]
+
+
+def test_segments_left_by_earlier_run_are_compressed(tmp_path):
+    previous = tmp_path / "run1"
+    previous.mkdir()
+    sink = _sink(previous, rotate_bytes=150)
+    for number in range(20):
+        sink.write({"timestamp": _timestamp(number), "value": number})
+    sink.close()
+    # A stop during compression leaves a half-written file next to the plain segment.
+    first = SegmentManifest.load(str(previous), "node")[0]["file"]
+    (previous / (first + ".gz.tmp")).write_bytes(b"partial")
+    current = tmp_path / "run2"
+    current.mkdir()
+    compressor = SegmentCompressor()
+    _sink(current, compression="gzip", compressor=compressor).close()
+    segments = SegmentManifest.load(str(previous), "node")
+    assert compressor.compressed == len(segments) == sink.rotations
+    assert all(segment["file"].endswith(".gz") for segment in segments)
+    assert sorted(os.listdir(str(previous))) == sorted([segment["file"] for segment in segments]
+                                                       + ["node.json", "node.manifest.json"])
+    assert [json.loads(line)["value"] for line in iter_data_lines(str(previous), "node")] == list(range(20))
+
+
+def test_segment_bytes_are_counted_encoded(tmp_path):
+    sink = _sink(tmp_path, rotate_bytes=100)
+    row = {"timestamp": _timestamp(0), "command": "\u00e4\u00f6\u20ac" * 20}
+    sink.write(row)
+    assert sink.rotate_if_due()
+    segment = SegmentManifest.load(str(tmp_path), "node")[0]
+    assert segment["bytes"] == os.path.getsize(str(tmp_path / segment["file"]))
+    sink.close()
+
+
+def test_every_segment_starts_process_data_with_keyframe(tmp_path):
+    encoder = ProcessDeltaEncoder(keyframe_interval=1000)
+    sink = _sink(tmp_path, rotate_bytes=300, on_rotate=encoder.force_keyframe)
+    for number in range(40):
+        row = {"timestamp": _timestamp(number)}
+        # Process data only every third sample, as with a longer process interval.
+        if number % 3 == 0:
+            sink.rotate_if_due()
+            row.update(encoder.encode(_processes(number)))
+        sink.write(row)
+    sink.close()
+    segments = _segment_rows(tmp_path)
+    assert len(segments) > 2
+    for rows in segments:
+        process_rows = [row for row in rows if KEYFRAME_KEY in row or DELTA_KEY in row]
+        if process_rows:
+            assert process_rows[0].get(KEYFRAME_KEY)
+
+
+def test_segment_decodes_without_earlier_segments(tmp_path):
+    encoder = ProcessDeltaEncoder(keyframe_interval=1000)
+    sink = _sink(tmp_path, rotate_bytes=400, on_rotate=encoder.force_keyframe)
+    for number in range(30):
+        sink.rotate_if_due()
+        sink.write(dict(encoder.encode(_processes(number)), timestamp=_timestamp(number)))
+    sink.close()
+    last = _segment_rows(tmp_path)[-1]
+    decoder = ProcessDeltaDecoder()
+    for row in last:
+        number = [index for index in range(30) if _timestamp(index) == row["timestamp"]][0]
+        decoded = decoder.decode(dict(row))
+        assert [decoded[key]["pid"] for key in sorted(decoded) if key.startswith("process_")] == \
+            [process["pid"] for process in _processes(number)]
+
+
+def test_rotation_checked_before_encoding_holds_for_write(tmp_path):
+    rotations = []
+    sink = _sink(tmp_path, rotate_interval=3600.0, on_rotate=lambda: rotations.append(True))
+    sink.write({"timestamp": _timestamp(0)})
+    assert not sink.rotate_if_due()
+    sink._rotate_interval = 1e-9
+    sink.write({"timestamp": _timestamp(1)})
+    assert not rotations
+    sink.write({"timestamp": _timestamp(2)})
+    assert rotations == [True]
+    sink.close()
@@ -0,0 +1,135 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of the shared SSH transport pool."""
+import pytest
+
+from datacollector.collector import ssh_pool
+from datacollector.collector.ssh_pool import SshTransportPool
+
+
+class FakeTransport:
+    """Transport that is active until its client is closed."""
+
+    def __init__(self):
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+
+class FakeClient:
+    """SSHClient recording the connect arguments and close."""
+
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.connect_kwargs = None
+        self.closed = False
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, **kwargs):
+        self.connect_kwargs = kwargs
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.closed = True
+        self.transport.active = False
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(ssh_pool.paramiko, "SSHClient", FakeClient)
+    return SshTransportPool()
+
+
+def _acquire(pool, password):
+    key = pool.key("node", 22, "user", password)
+    return key, pool.acquire(key, password=password)
+
+
+def test_same_credentials_share_client(pool):
+    first_key, first = _acquire(pool, "secret")
+    second_key, second = _acquire(pool, "secret")
+    assert first_key == second_key
+    assert first is second
+    assert first.connect_kwargs == {"hostname": "node", "port": 22, "username": "user", "password": "secret"}
+
+
+def test_other_credentials_get_own_client(pool):
+    _, first = _acquire(pool, "secret")
+    _, second = _acquire(pool, "other")
+    assert first is not second
+    assert second.connect_kwargs["password"] == "other"
+
+
+def test_key_does_not_contain_password(pool):
+    assert "secret" not in pool.key("node", 22, "user", "secret")
+
+
+def test_released_client_is_reused(pool):
+    key, first = _acquire(pool, "secret")
+    pool.release(key, first)
+    _, second = _acquire(pool, "secret")
+    assert second is first
+    assert not first.closed
+
+
+def test_invalidated_client_is_closed_by_last_release(pool):
+    key, first = _acquire(pool, "secret")
+    _, shared = _acquire(pool, "secret")
+    pool.invalidate(key, first)
+    assert not first.closed
+    _, replacement = _acquire(pool, "secret")
+    assert replacement is not first
+    pool.release(key, first)
+    assert not first.closed
+    pool.release(key, shared)
+    assert first.closed
+    assert not replacement.closed
+
+
+def test_invalidate_leaves_replacement_alone(pool):
+    key, first = _acquire(pool, "secret")
+    pool.invalidate(key, first)
+    _, replacement = _acquire(pool, "secret")
+    pool.invalidate(key, first)
+    pool.release(key, first)
+    assert first.closed
+    _, again = _acquire(pool, "secret")
+    assert again is replacement
+
+
+def test_invalidate_without_holders_closes(pool):
+    key, first = _acquire(pool, "secret")
+    pool.release(key, first)
+    pool.invalidate(key, first)
+    assert first.closed
+
+
+def test_close_idle(pool):
+    key, first = _acquire(pool, "secret")
+    pool.close_idle()
+    assert not first.closed
+    pool.release(key, first)
+    pool.close_idle()
+    assert first.closed
+
+
+def test_shared_pool_closes_idle_transports_on_last_release(monkeypatch):
+    monkeypatch.setattr(ssh_pool.paramiko, "SSHClient", FakeClient)
+    monkeypatch.setattr(SshTransportPool, "_shared", None)
+    monkeypatch.setattr(SshTransportPool, "_shared_refs", 0)
+    first = SshTransportPool.shared()
+    assert SshTransportPool.shared() is first
+    key, client = _acquire(first, "secret")
+    first.release(key, client)
+    SshTransportPool.release_shared()
+    assert not client.closed
+    SshTransportPool.release_shared()
+    assert client.closed
@@ -0,0 +1,98 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of reading command output over SSH."""
+import gzip
+import zlib
+from types import SimpleNamespace
+
+from datacollector.collector.sshconnection import SshConnection
+
+OUTPUT = "".join("line {}\n".format(number) for number in range(1000)).encode()
+
+
+class FakeChannel:
+    """Channel returning the output in fixed-size chunks."""
+
+    def __init__(self, data, chunk_size=100):
+        self._chunks = [data[index:index + chunk_size] for index in range(0, len(data), chunk_size)]
+        self.closed = False
+
+    def recv(self, size):
+        return self._chunks.pop(0) if self._chunks else b""
+
+    def recv_exit_status(self):
+        return 0
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    """SSHClient running every command on a channel with the given output."""
+
+    def __init__(self, data):
+        self._data = data
+        self.channels = []
+
+    def exec_command(self, command):
+        channel = FakeChannel(self._data)
+        self.channels.append(channel)
+        return None, SimpleNamespace(channel=channel), None
+
+
+def _connection(data):
+    connection = SshConnection("node", 22, "user", "secret")
+    connection._ssh_client = FakeClient(data)
+    return connection
+
+
+def test_plain_payload_is_counted():
+    connection = _connection(OUTPUT)
+    lines = connection._read_output("cat")
+    assert "".join(lines).encode() == OUTPUT
+    assert connection.payload_received == connection.payload_decoded == len(OUTPUT)
+
+
+def test_compressed_payload_is_counted_before_and_after_decompression():
+    compressed = gzip.compress(OUTPUT)
+    connection = _connection(compressed)
+    lines = connection._read_output("cat | gzip", zlib.decompressobj(16 + zlib.MAX_WBITS))
+    assert "".join(lines).encode() == OUTPUT
+    assert connection.payload_received == len(compressed)
+    assert connection.payload_decoded == len(OUTPUT)
+
+
+def test_stopped_reader_counts_received_payload_and_closes_channel():
+    connection = _connection(OUTPUT)
+    lines = connection._iter_output("cat")
+    next(lines)
+    lines.close()
+    assert connection.payload_received == 100
+    assert connection._ssh_client.channels[0].closed
+
+
+def test_lines_split_across_chunks_are_joined():
+    text = "ä€ line {}\n"
+    data = "".join(text.format(number) for number in range(50)).encode()
+    connection = SshConnection("node", 22, "user", "secret")
+    connection._ssh_client = FakeClient(b"")
+    connection._ssh_client.exec_command = lambda command: (None, SimpleNamespace(channel=FakeChannel(data, 7)), None)
+    assert list(connection.execute_lines("cat")) == [text.format(number) for number in range(50)]
+
+
+def test_last_line_without_newline_is_yielded():
+    connection = _connection(b"first\nlast")
+    assert list(connection.execute_lines("cat")) == ["first\n", "last"]
+
+
+def test_compressed_output_is_decompressed_while_read():
+    connection = SshConnection("node", 22, "user", "secret", compression="gzip")
+    connection._compress = True
+    connection._ssh_client = FakeClient(gzip.compress(OUTPUT))
+    lines = connection.execute_lines("cat")
+    assert next(lines) == "line 0\n"
+    assert connection._ssh_client.channels[0]._chunks
+    assert "".join(lines).encode() == OUTPUT[len("line 0\n"):]
@@ -0,0 +1,184 @@
+# © 2021 Nokia
+#
+# Licensed under the Apache license, version 2.0
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests of push mode collection from a remote sampler."""
+import socket
+import threading
+from types import SimpleNamespace
+
+import pytest
+from paramiko import SSHException
+
+from datacollector.collector import inodecollector, memcpurecord
+from datacollector.collector.batched_command import BatchedCommand
+from datacollector.collector.collector_config_parser import CollectorConfig
+from datacollector.collector.memcpunodecollector import MemCpuNodeCollector
+from datacollector.collector.scheduler import AlignedScheduler
+from datacollector.collector.stream_sampler import FRAME_END, StreamClosedException, StreamSampler
+
+BATCH = BatchedCommand([("cpu", "cat /proc/stat"), ("memory", "cat /proc/meminfo")])
+CPU_LINES = ["cpu  100 0 100 1000 0 0 0 0 0 0\n", "cpu0 100 0 100 1000 0 0 0 0 0 0\n"]
+MEM_LINES = ["MemTotal:       28803616 kB\n", "MemFree:        27841200 kB\n"]
+
+
+SECTIONS = {"cpu": CPU_LINES, "memory": MEM_LINES}
+NODE_SECTIONS = dict(SECTIONS, process=[])
+
+
+def _frame(sections=None):
+    lines = []
+    for name, output in (SECTIONS if sections is None else sections).items():
+        lines += ["#DC-BEGIN {}\n".format(name)] + output + ["#DC-END {} 0\n".format(name)]
+    return "".join(lines) + FRAME_END + "\n"
+
+
+class FakeChannel:
+    """Channel returning the given chunks, then timing out, raising end or reporting the end of the stream."""
+
+    def __init__(self, chunks, end=b""):
+        self._chunks = list(chunks)
+        self._end = end
+        self.closed = False
+
+    def settimeout(self, timeout):
+        pass
+
+    def recv(self, size):
+        if self._chunks:
+            return self._chunks.pop(0)
+        if self._end is None:
+            raise socket.timeout()
+        if isinstance(self._end, Exception):
+            raise self._end
+        return self._end
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    """Connection opening the given channels in turn. An exception in channels is raised by open_stream."""
+
+    hostname = "node"
+
+    def __init__(self, channels):
+        self._channels = list(channels)
+        self.payload = 0
+
+    def open_stream(self, command):
+        channel = self._channels.pop(0)
+        if isinstance(channel, Exception):
+            raise channel
+        return channel
+
+    def count_payload(self, received, decoded=None):
+        self.payload += received
+
+
+def _chunks(data, size):
+    data = data.encode()
+    return [data[index:index + size] for index in range(0, len(data), size)]
+
+
+def test_frames_are_split_into_sections():
+    data = _frame() + _frame()
+    sampler = StreamSampler(FakeConnection([FakeChannel(_chunks(data, 7))]), BATCH, 1000)
+    sampler.start()
+    frames = sampler.frames(threading.Event())
+    first = next(frames)
+    assert first.sections == {"cpu": CPU_LINES, "memory": MEM_LINES}
+    assert next(frames).sections == first.sections
+    with pytest.raises(StreamClosedException):
+        next(frames)
+    assert sampler._connection.payload == len(data)
+
+
+def test_frame_with_broken_framing_is_skipped():
+    data = _frame({"cpu": CPU_LINES}) + _frame()
+    sampler = StreamSampler(FakeConnection([FakeChannel(_chunks(data, 50))]), BATCH, 1000)
+    sampler.start()
+    frames = sampler.frames(threading.Event())
+    assert next(frames).sections["memory"] == MEM_LINES
+    assert sampler.frames_skipped == 1
+
+
+def test_silent_stream_is_dead():
+    sampler = StreamSampler(FakeConnection([FakeChannel([], end=None)]), BATCH, 1000, dead_timeout=0.05)
+    sampler.start()
+    with pytest.raises(StreamClosedException, match="No data"):
+        for _ in sampler.frames(threading.Event()):
+            pass
+
+
+def test_stop_event_ends_frames():
+    stop_event = threading.Event()
+    stop_event.set()
+    sampler = StreamSampler(FakeConnection([FakeChannel([], end=None)]), BATCH, 1000)
+    sampler.start()
+    assert list(sampler.frames(stop_event)) == []
+
+
+@pytest.fixture
+def make_collector(tmp_path, monkeypatch):
+    monkeypatch.setattr(inodecollector, "__file__", str(tmp_path / "collector" / "inodecollector.py"))
+    monkeypatch.setattr(memcpurecord, "__file__", str(tmp_path / "collector" / "memcpurecord.py"))
+    collectors = []
+
+    def make(channels):
+        config = CollectorConfig("collector")
+        config.update(index_to_elastic=False, collect_mode="stream")
+        main_collector = SimpleNamespace(collector_config=config, collect_interval=1, backpressure=None,
+                                         scheduler=AlignedScheduler(1), agent=SimpleNamespace(collect_id="run"))
+        collector = MemCpuNodeCollector(main_collector, FakeConnection(channels))
+        collector._connected.set()
+        frames = []
+        monkeypatch.setattr(collector._record, "ingest_sections",
+                            lambda timestamp, sections: frames.append(sections))
+        collectors.append(collector)
+        return collector, frames
+
+    yield make
+    for collector in collectors:
+        collector.close_record()
+
+
+def _stop_on_connection_lost(collector, monkeypatch):
+    lost = []
+
+    def connection_lost():
+        lost.append(True)
+        collector.stop()
+
+    monkeypatch.setattr(collector, "_connection_lost", connection_lost)
+    return lost
+
+
+@pytest.mark.parametrize("error", [SSHException("channel refused"), EOFError(), ConnectionResetError()])
+def test_transport_error_on_start_reconnects(make_collector, monkeypatch, error):
+    collector, frames = make_collector([error])
+    lost = _stop_on_connection_lost(collector, monkeypatch)
+    collector._consume_stream()
+    assert lost == [True]
+    assert frames == []
+
+
+def test_transport_error_while_reading_reconnects(make_collector, monkeypatch):
+    channel = FakeChannel([_frame(NODE_SECTIONS).encode()], end=OSError("socket closed"))
+    collector, frames = make_collector([channel])
+    lost = _stop_on_connection_lost(collector, monkeypatch)
+    collector._consume_stream()
+    assert lost == [True]
+    assert frames == [NODE_SECTIONS]
+    assert channel.closed
+
+
+def test_broken_frame_is_skipped_and_stream_continues(make_collector, monkeypatch):
+    data = (_frame(SECTIONS) + _frame(NODE_SECTIONS)).encode()
+    collector, frames = make_collector([FakeChannel([data])])
+    lost = _stop_on_connection_lost(collector, monkeypatch)
+    collector._consume_stream()
+    assert frames == [NODE_SECTIONS]
+    assert lost == [True]
+    assert collector.samples == 1